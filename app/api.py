@@ -8,76 +8,384 @@ project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 sys.path.insert(0, project_root)
 
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-from flask import Blueprint, request, jsonify
-from src.pitch_detector import run as detect_pitch
-from utils import Scale
+import json
+from flask import Blueprint, Request, Response, request, jsonify, url_for
+from src.worker_pool import detect as detect_pitch, detect_streaming, detect_ranked, detect_cascade, get_pool
+from src import model_session
+from src.batching import get_scheduler
+from src.jobs import get_job_queue, QueueFullError
+from src.result_cache import get_cache
+from src import batch
+from src import chroma
+from src import scale_service
+from src import metrics
+from src import tracing
+from src import uploads
 
 # For input sanitization
-import tempfile  # Import the tempfile library
+import hashlib
+import io
+from werkzeug.datastructures import FileStorage
+from werkzeug.exceptions import RequestEntityTooLarge
 from werkzeug.utils import secure_filename
 
 # Change this line to create a Blueprint
 api = Blueprint('api', __name__)
 
+# Endpoints whose uploads are checked while the request body is read:
+# single audio files, and batches (audio files and archives)
+UPLOAD_ENDPOINTS = ('api.detect', 'api.submit_detect_job')
+BATCH_ENDPOINTS = ('api.detect_batch',)
+# Room for the multipart boundaries and headers on top of the file itself
+MULTIPART_OVERHEAD = 64 * 1024
+
+class UploadRequest(Request):
+    """
+    Request of the app: on the upload endpoints, a body larger than
+    MAX_UPLOAD_BYTES (MAX_BATCH_BYTES for a batch) is refused from its
+    Content-Length, and each file is written to an UploadSpool, which
+    rejects it from its first bytes.
+    """
+    def upload_limit(self):
+        """Size limit of the uploaded files of this request (None outside the upload endpoints)."""
+        if self.endpoint in UPLOAD_ENDPOINTS:
+            return uploads.MAX_UPLOAD_BYTES
+        if self.endpoint in BATCH_ENDPOINTS:
+            return uploads.MAX_BATCH_BYTES
+        return None
+
+    @property
+    def max_content_length(self):
+        limit = super().max_content_length
+        upload_limit = self.upload_limit()
+        if upload_limit:
+            upload_limit += MULTIPART_OVERHEAD
+            return upload_limit if limit is None else min(limit, upload_limit)
+        return limit
+
+    @max_content_length.setter
+    def max_content_length(self, value):
+        self._max_content_length = value
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if self.endpoint in UPLOAD_ENDPOINTS:
+            return uploads.UploadSpool()
+        if self.endpoint in BATCH_ENDPOINTS:
+            # Each part is checked in the batch, so that one bad file does not fail the others
+            return uploads.UploadSpool(max_bytes=uploads.MAX_BATCH_BYTES, sniff=False)
+        return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+
+@api.record_once
+def use_upload_request(state):
+    state.app.request_class = UploadRequest
+
+UNSUPPORTED_FILE_TYPE = 'Unsupported file type. Please upload a valid audio file.'
+
+@api.errorhandler(uploads.UnsupportedFormatError)
+def unsupported_format(e):
+    return jsonify({'error': UNSUPPORTED_FILE_TYPE}), 415
+
+@api.errorhandler(uploads.UploadTooLargeError)
+@api.errorhandler(RequestEntityTooLarge)
+def upload_too_large(e):
+    if isinstance(e, RequestEntityTooLarge):
+        # The limit of this endpoint (a batch has its own), unless the app's MAX_CONTENT_LENGTH is lower
+        limit = request.upload_limit()
+        if request.max_content_length and (not limit or request.max_content_length < limit):
+            limit = request.max_content_length
+        e = uploads.UploadTooLargeError(f'The request is larger than the maximum of '
+                                        f'{limit / (1024 * 1024):g} MB.')
+    return jsonify({'error': str(e)}), 413
+
 @api.route("/")
 def root():
     return "Welcome dear human…"
 
-@api.route('/detect', methods=['POST'])
-def detect():
+@api.route("/ready")
+def ready():
+    # Only ready once the model is loaded and warmed up
+    # (in every worker process when the process pool is enabled)
+    pool = get_pool()
+    if pool is not None:
+        is_ready = all(worker['ready'] for worker in pool.stats())
+    else:
+        is_ready = model_session.is_ready()
+    if is_ready:
+        return jsonify({'ready': True}), 200
+    return jsonify({'ready': False}), 503
+
+@api.route("/stats")
+def stats():
+    # Runtime counters of the detection backend
+    pool = get_pool()
+    return jsonify({
+        'batching': get_scheduler().stats(),
+        'jobs': {'queued': get_job_queue().depth()},
+        'workers': pool.stats() if pool is not None else [],
+        'cache': get_cache().stats(),
+    }), 200
+
+# Seconds a client should wait before retrying when the job queue is full
+RETRY_AFTER = int(os.environ.get('JOB_RETRY_AFTER', 5))
+
+def check_upload():
+    """Returns the uploaded audio file, or an error response if it is not valid."""
     if 'audio' not in request.files:
-        return jsonify({'error': 'No audio file has been sent'}), 400
+        return None, (jsonify({'error': 'No audio file has been sent'}), 400)
 
     audio_file = request.files['audio']
-    # audio_file.save('user_audio.mp3') # save the file locally
 
-    # Check the file type to ensure it's a supported audio format
-    if audio_file.mimetype not in ['audio/mpeg', 'audio/wav', 'audio/ogg', 'audio/flac']:
-        return jsonify({'error': 'Unsupported file type. Please upload a valid audio file.'}), 415
+    # The container is recognized from the first bytes, whatever type the client declared
+    if uploads.sniff_stream(audio_file.stream) is None:
+        return None, (jsonify({'error': UNSUPPORTED_FILE_TYPE}), 415)
+    return audio_file, None
+
+# Number of ranked keys returned by the 'profile' engine
+RANKED_KEYS = 5
+
+def get_engine():
+    """Key-finding engine asked by the client (?engine=heuristic|profile), or None if unknown."""
+    from src import pitch_detector # The detection code is loaded on first use
+    engine = request.args.get('engine', pitch_detector.DETECTION_ENGINE).lower()
+    return engine if engine in pitch_detector.ENGINES else None
+
+def unknown_engine_response():
+    from src.pitch_detector import ENGINES
+    return jsonify({'error': f"Unknown engine. Use one of: {', '.join(ENGINES)}."}), 400
+
+def is_streaming():
+    """True when the client asked for the streaming analysis (?stream=1)."""
+    return request.args.get('stream', '0').lower() in ('1', 'true', 'yes')
+
+def read_upload(audio_file):
+    """Reads an uploaded file into memory. Returns its bytes, extension and content hash."""
+    with metrics.DETECT_STAGE_SECONDS.time(stage='upload'), tracing.span('upload') as span:
+        data = audio_file.read()
+        span.set(bytes=len(data))
+    suffix = f'.{secure_filename(audio_file.filename).split(".")[-1]}'
+    return data, suffix, hashlib.sha256(data).hexdigest()
+
+def detect_upload(data, suffix, content_hash=None, streaming=False, engine='heuristic'):
+    """
+    Detects the key of uploaded audio bytes.
+
+    In streaming mode the audio is analyzed window by window and the
+    analysis stops as soon as the key is clear. The 'profile' engine
+    also returns the best keys ranked by confidence. With the key cascade
+    enabled, the result tells which tier answered ('chroma' or 'model').
+    """
+    # Same bytes, model and detection logic: reuse the previous result
+    cache = get_cache()
+    if content_hash is not None:
+        if streaming:
+            content_hash += ':stream'
+        elif engine != 'heuristic':
+            content_hash += f':{engine}'
+        result = cache.get(content_hash)
+        if result is not None:
+            tracing.annotate(cached=True)
+            if 'tier' in result:
+                # Keeps the share of requests escalated to the model exact
+                metrics.KEY_TIERS.inc(tier='cache')
+            return result
+
+    # The audio is decoded in memory (no temporary file for WAV/FLAC/OGG)
+    metrics.DETECT_BYTES.inc(len(data))
+    with tracing.span('detect', engine=engine, streaming=streaming) as span:
+        tier = None # Tier of the key cascade that answered
+        try:
+            if streaming:
+                pitch, mode, analyzed, duration = detect_streaming(data, suffix)
+                result = {'pitch': pitch, 'mode': mode,
+                          'analyzed_seconds': round(analyzed, 2), 'duration_seconds': round(duration, 2)}
+            elif engine == 'profile':
+                if chroma.KEY_CASCADE:
+                    (pitch, mode, ranked), tier = detect_cascade(data, suffix, task='rank')
+                else:
+                    pitch, mode, ranked = detect_ranked(data, suffix)
+                result = {'pitch': pitch, 'mode': mode, 'engine': engine, 'keys': ranked[:RANKED_KEYS]}
+            else:
+                if chroma.KEY_CASCADE:
+                    (pitch, mode), tier = detect_cascade(data, suffix)
+                else:
+                    pitch, mode = detect_pitch(data, suffix)
+                result = {'pitch': pitch, 'mode': mode}
+            if tier is not None:
+                result['tier'] = tier
+        except Exception as e:
+            metrics.DETECT_ERRORS.inc(type=type(e).__name__)
+            raise
+        span.set(pitch=pitch, mode=mode, tier=tier)
+    if content_hash is not None:
+        cache.put(content_hash, result)
+    return result
+
+@api.route('/detect', methods=['POST'])
+def detect():
+    audio_file, error = check_upload()
+    if error:
+        return error
+    engine = get_engine()
+    if engine is None:
+        return unknown_engine_response()
 
-    # Use a try-finally block to ensure the temporary file is deleted
     try:
-        # Create a temporary file with a specific extension
-        # 'suffix' is important for libraries that rely on the file type
-        with tempfile.NamedTemporaryFile(suffix=f'.{secure_filename(audio_file.filename).split(".")[-1]}', delete=False) as temp_file:
-            # Write the content of the uploaded file to the temporary file
-            audio_file.save(temp_file)
-            temp_file_path = temp_file.name
-            # print(">>Temp file created:", temp_file_path)
-
-        # Pass the path of the temporary file to your pitch detection function
-        pitch, mode = detect_pitch(temp_file_path)
-        print(pitch, mode)
-        return jsonify({'pitch': pitch, 'mode': mode}), 200
+        return jsonify(detect_upload(*read_upload(audio_file), streaming=is_streaming(), engine=engine)), 200
+    except uploads.AudioTooLongError as e:
+        return jsonify({'error': str(e)}), 413
     except Exception as e:
         return jsonify({'error': str(e)}), 500
-    finally:
-        # This block ensures the temporary file is deleted, even if an error occurs
-        if 'temp_file_path' in locals() and os.path.exists(temp_file_path):
-            os.remove(temp_file_path)
-            # print(">>Temp file successfully deleted!")
+
+def queue_full_response():
+    """503 response telling the client when to retry."""
+    response = jsonify({'error': 'The detection queue is full. Please try again later.'})
+    return response, 503, {'Retry-After': str(RETRY_AFTER)}
+
+@api.route('/detect/jobs', methods=['POST'])
+def submit_detect_job():
+    # Fail fast before the upload is parsed (request.files) when there is no room
+    job_queue = get_job_queue()
+    if job_queue.full():
+        return queue_full_response()
+
+    audio_file, error = check_upload()
+    if error:
+        return error
+    engine = get_engine()
+    if engine is None:
+        return unknown_engine_response()
+
+    try:
+        job = job_queue.submit(detect_upload, *read_upload(audio_file), is_streaming(), engine)
+    except QueueFullError:
+        return queue_full_response()
+
+    location = url_for('api.get_detect_job', job_id=job.id)
+    return jsonify(job.to_dict()), 202, {'Location': location}
+
+def detach_files(key):
+    """
+    Takes the uploaded files of a field out of the request: the request
+    closes its files when the view returns, before a streamed response is sent.
+    """
+    files = []
+    for storage in request.files.getlist(key):
+        files.append(FileStorage(storage.stream, storage.filename, storage.name, headers=storage.headers))
+        storage.stream = io.BytesIO()
+    return files
+
+def batch_files(audio_files, archive_files):
+    """
+    Reads the files of a batch request one at a time: the 'audio' parts,
+    then the files inside the 'archive' parts (zip or tar).
+
+    Yields:
+        tuple: (name, (data, suffix, content_hash), error) for each file.
+    """
+    for audio_file in audio_files:
+        # The container is recognized from the first bytes, whatever type the client declared
+        if uploads.sniff_stream(audio_file.stream) is None:
+            yield audio_file.filename, None, 'Unsupported file type.'
+            continue
+        try:
+            uploads.check_size(uploads.stream_size(audio_file.stream))
+        except uploads.UploadTooLargeError as e:
+            yield audio_file.filename, None, str(e)
+            continue
+        yield audio_file.filename, read_upload(audio_file), None
+    for archive_file in archive_files:
+        try:
+            for name, data, error in batch.iter_archive(archive_file.stream):
+                if error is not None:
+                    yield name, None, error
+                else:
+                    suffix = f'.{secure_filename(name).split(".")[-1]}'
+                    yield name, (data, suffix, hashlib.sha256(data).hexdigest()), None
+        except Exception as e:
+            yield archive_file.filename, None, f'Could not read the archive: {e}'
+
+@api.route('/detect/batch', methods=['POST'])
+def detect_batch():
+    """
+    Detects the keys of many files (multipart 'audio' parts and/or zip/tar
+    'archive' parts) and streams one NDJSON line per file as each finishes.
+    """
+    if 'audio' not in request.files and 'archive' not in request.files:
+        return jsonify({'error': 'No audio file or archive has been sent'}), 400
+    for archive_file in request.files.getlist('archive'):
+        if not batch.is_archive(archive_file.stream):
+            return jsonify({'error': f'{archive_file.filename} is not a zip or tar archive.'}), 415
+    engine = get_engine()
+    if engine is None:
+        return unknown_engine_response()
+    streaming = is_streaming()
+    audio_files, archive_files = detach_files('audio'), detach_files('archive')
+
+    def detect(upload):
+        return detect_upload(*upload, streaming=streaming, engine=engine)
+
+    def lines():
+        try:
+            for result in batch.run_batch(batch_files(audio_files, archive_files), detect):
+                yield json.dumps(result) + '\n'
+        finally:
+            for storage in audio_files + archive_files:
+                storage.close()
+
+    # The files are read while the response is being sent
+    return Response(lines(), 200, mimetype='application/x-ndjson')
+
+@api.route('/detect/jobs/<string:job_id>', methods=['GET'])
+def get_detect_job(job_id):
+    job = get_job_queue().get(job_id)
+    if job is None:
+        return jsonify({'error': f'Job {job_id} not found.'}), 404
+    return jsonify(job.to_dict()), 200
 
 # The Flask endpoint is now correct and will work with this dictionary.
+# Scale responses only change with the scales table, so clients and proxies may cache them
+SCALE_MAX_AGE = int(os.environ.get('SCALE_MAX_AGE', 3600))
+
+def not_modified(etag):
+    """True when the client already holds the representation with this ETag (If-None-Match)."""
+    return request.if_none_match.contains_weak(etag)
+
+def set_cache_headers(response, etag, max_age=SCALE_MAX_AGE):
+    """Adds the ETag and Cache-Control headers of a cacheable response."""
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = max_age
+    return response
+
 @api.route('/scale/<string:key_name>', methods=['GET'])
 def get_scale(key_name):
-    print(f"GET method for '{key_name}'")
-    new_scale = Scale(key_name) # Creates scale object
-    # print(new_scale.root_note, new_scale.api_name)
-
-    # Then, check if the normalized key exists in the comprehensive dictionary
-    if new_scale.scale is not None:
-        data = {
-            'root': new_scale.root_note,
-            'enharmonic': new_scale.enharmonic,
-            'is_flat': new_scale.is_flat,
-            'mode': new_scale.mode,
-            'scale': new_scale.scale,
-            'chords': new_scale.chords,
-            'relative': new_scale.relative,
-        }
-        return jsonify(data), 200
+    tracing.annotate(key=key_name)
+    etag = scale_service.get_scale_etag(key_name)
+    if etag is not None and not_modified(etag):
+        return set_cache_headers(Response(status=304), etag)
+
+    # Responses of all the valid key names are encoded once at import
+    body = scale_service.get_scale_body(key_name)
+    if body is not None:
+        return set_cache_headers(Response(body, 200, mimetype='application/json'), etag)
     else:
         return jsonify({'error': f'Information for key {key_name} not found.'}), 404
 
+@api.route('/scales', methods=['GET'])
+def get_scales():
+    """Data of many keys in one response: ?keys=c,am,f-sharp (all the 24 keys without it)."""
+    keys = request.args.get('keys', '')
+    key_names = list(dict.fromkeys(name.strip() for name in keys.split(',') if name.strip())) or None
+    if key_names is not None:
+        unknown = [name for name in key_names if scale_service.get_scale_body(name) is None]
+        if unknown:
+            return jsonify({'error': f"Information for keys {', '.join(unknown)} not found."}), 404
+
+    etag = scale_service.get_scales_etag(key_names)
+    if not_modified(etag):
+        return set_cache_headers(Response(status=304), etag)
+    body = scale_service.get_scales_body(key_names)
+    return set_cache_headers(Response(body, 200, mimetype='application/json'), etag)
+
 # if __name__=='__main__':
 #     api.run(debug=True,port=4400) #38516 (music)
\ No newline at end of file
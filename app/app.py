@@ -1,7 +1,15 @@
 # app/app.py
-from flask import Flask, render_template, request, redirect, url_for
-from .api import api
-from src.utils import get_scale_data, get_url, get_music_score
+import logging
+import os
+import threading
+from flask import Flask, Response, make_response, render_template, request, redirect, url_for, send_from_directory
+from .api import api, not_modified, set_cache_headers
+from src.result_cache import hash_bytes
+from src.utils import get_url, get_music_score, is_score_cached, prerender_scores, SCORE_DIR
+from src import chroma, metrics, model_session, scale_service, tracing, worker_pool
+
+# Startup diagnostics (e.g. the model backend) are logged; traces have their own logger
+logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO').upper(), format='%(message)s')
 
 app = Flask(__name__)
 
@@ -9,6 +17,56 @@ app = Flask(__name__)
 # All endpoints in api.py will be prefixed with /api
 app.register_blueprint(api, url_prefix='/api')
 
+# Load and warm up the detection model when the worker starts
+# (or fork the detection processes when the process pool is enabled)
+# Set PRELOAD_MODEL=0 to defer loading until the first detection
+if os.environ.get('PRELOAD_MODEL', '1') != '0':
+    if worker_pool.WORKER_PROCESSES:
+        worker_pool.get_pool()
+    else:
+        model_session.preload()
+    if chroma.KEY_CASCADE:
+        threading.Thread(target=chroma.warm_up, name='chroma-warm-up', daemon=True).start()
+
+# Render the music scores of all the keys in the background
+# Set PRERENDER_SCORES=0 to render them on the first view instead
+if os.environ.get('PRERENDER_SCORES', '1') != '0':
+    threading.Thread(target=prerender_scores, name='score-prerender', daemon=True).start()
+
+@app.before_request
+def start_trace():
+    # A client can ask for the detailed trace of one request with 'X-Trace: debug' (or 'info')
+    level = tracing.LEVELS.get(request.headers.get('X-Trace', '').lower())
+    tracing.start_trace(f'{request.method} {request.url_rule or request.path}',
+                        request.headers.get('X-Request-ID'), level or None)
+
+@app.after_request
+def count_request(response):
+    metrics.HTTP_REQUESTS.inc(endpoint=request.endpoint or 'none', method=request.method,
+                              status=response.status_code)
+    trace = tracing.current_trace()
+    if trace is not None:
+        trace.attributes['status'] = response.status_code
+        response.headers['X-Request-ID'] = trace.request_id
+    return response
+
+@app.teardown_request
+def end_trace(error=None):
+    tracing.end_trace()
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Counters and stage latency histograms in the Prometheus text format."""
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+@app.cli.command('prerender-scores')
+def prerender_scores_command():
+    """Renders the music scores of all the keys (e.g. at build time)."""
+    print(f"{prerender_scores()} music scores available in {SCORE_DIR}")
+
+# Score images are named after their content, so browsers can keep them for good
+SCORE_MAX_AGE = 365 * 24 * 3600
+
 @app.route('/')
 def index():
     data = {'title': 'What Key is This?'}
@@ -24,18 +82,42 @@ def choose_scale():
     data = {'title': 'Scales & Chords'}
     return render_template('keyboard.html', data=data)
 
+# Scale pages only change with the scales table, the templates and the rendered score
+SCALE_PAGE_MAX_AGE = int(os.environ.get('SCALE_PAGE_MAX_AGE', 3600))
+
+def read_templates():
+    """Contents of the HTML templates, in a stable order."""
+    template_dir = os.path.join(app.root_path, app.template_folder)
+    for name in sorted(os.listdir(template_dir)):
+        with open(os.path.join(template_dir, name), 'rb') as f:
+            yield f.read()
+
+PAGES_VERSION = hash_bytes([scale_service.SCALES_VERSION.encode(), *read_templates()])
+
+def scale_page_etag(key_name, mode):
+    """ETag of a scale page, or None while its score has not been looked up yet."""
+    if not is_score_cached(key_name, mode):
+        return None
+    score_path = get_music_score(key_name, mode) # Cached: no render
+    return hash_bytes([f'{PAGES_VERSION}:{key_name.lower()}:{mode}:{score_path}'.encode()])[:32]
+
 @app.route('/scale/<string:key_name>')
 def show_scale(key_name):
-    print('User asked for', key_name.upper())
     # Gets the value of the URL parameters
     # Ex: http://localhost:5000/scale/c
-    mode = request.args.get('mode', 'major').lower() # ?mode=minor
-    is_minor = True if mode.lower() == 'minor' else False
-    print(f"URL parameters: '{mode}'") # For debugging
+    # ?mode=minor; anything else is major (scores are cached per mode)
+    mode = 'minor' if request.args.get('mode', 'major').lower() == 'minor' else 'major'
+    is_minor = mode == 'minor'
+    tracing.annotate(key=key_name, mode=mode)
 
-    scale =  get_scale_data(f'{key_name}', is_minor) # API Call
+    # The browser already has this page: answer before building it
+    etag = scale_page_etag(key_name, mode)
+    if etag is not None and not_modified(etag):
+        return set_cache_headers(Response(status=304), etag, SCALE_PAGE_MAX_AGE)
+
+    scale = scale_service.get_scale(key_name, is_minor) # In-process, no HTTP round-trip
     if scale is None:
-        print("ALERT: Scale has not been detected!")
+        tracing.event('Scale not found')
         return render_template('404.html'), 404
     else:
         data = {
@@ -50,11 +132,18 @@ def show_scale(key_name):
             # Generate the music score and get its path
             'score_path': get_music_score(key_name, mode)
             }
-        return render_template('scale.html', data=data)
+        response = make_response(render_template('scale.html', data=data))
+        return set_cache_headers(response, scale_page_etag(key_name, mode), SCALE_PAGE_MAX_AGE)
+
+@app.route('/scores/<path:filename>')
+def music_score(filename):
+    response = send_from_directory(os.path.abspath(SCORE_DIR), filename, max_age=SCORE_MAX_AGE)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
 
 @app.route('/scale/detected/<string:pitch>')
 def parser(pitch):
-    print('Detection parameter received:', pitch)
     # Split the pitch string into the root note and the mode.
     # Ex: http://localhost:5000/scale/detected/c_minor
     # GET 'c_minor' -> ['c', 'minor']
@@ -62,7 +151,7 @@ def parser(pitch):
 
     # Default to major if the mode is not recognized.
     if not (mode == 'major' or mode == 'minor'):
-        print("Unrecognized mode:", mode)
+        tracing.event('Unrecognized mode', mode=mode)
         mode = 'major'
 
     is_minor = mode == 'minor'
@@ -74,7 +163,7 @@ def parser(pitch):
     else:
         redirect_url = url_for('show_scale', key_name=key_name)
 
-    print(f"Redirecting to: {redirect_url}")
+    tracing.annotate(pitch=pitch, redirect=redirect_url)
     return redirect(redirect_url)
 
 @app.route('/help')
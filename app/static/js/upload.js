@@ -67,13 +67,9 @@ document.addEventListener('DOMContentLoaded', function() {
         audioFilename.textContent = file.name; // Display the filename
 
         try {
-            // Send the audio file to the Flask backend for key detection.
-            const response = await fetch('/api/detect', {
-                method: 'POST',
-                body: formData,
-            });
-
-            const result = await response.json();
+            // Send the audio file to the Flask backend as a detection job,
+            // then poll the job until the key has been detected.
+            const { response, result } = await detectKey(formData);
 
             // Check if the response was successful.
             if (response.ok) {
@@ -104,6 +100,45 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
 
+    // Interval between two checks of the detection job (in milliseconds).
+    const POLL_INTERVAL = 1000;
+
+    function sleep(ms) {
+        return new Promise(resolve => setTimeout(resolve, ms));
+    }
+
+    // Submits a detection job and waits for it to finish.
+    // Returns the last HTTP response and the detection result (or error).
+    async function detectKey(formData) {
+        const response = await fetch('/api/detect/jobs', {
+            method: 'POST',
+            body: formData,
+        });
+        const job = await response.json();
+
+        // The job could not be queued (e.g. unsupported file or queue full).
+        if (!response.ok) {
+            return { response, result: job };
+        }
+
+        const jobUrl = response.headers.get('Location') || `/api/detect/jobs/${job.job_id}`;
+        while (true) {
+            await sleep(POLL_INTERVAL);
+            const pollResponse = await fetch(jobUrl);
+            const status = await pollResponse.json();
+
+            if (!pollResponse.ok) {
+                return { response: pollResponse, result: status };
+            }
+            if (status.status === 'done') {
+                return { response: pollResponse, result: status.result };
+            }
+            if (status.status === 'failed') {
+                return { response: { ok: false }, result: { error: status.error } };
+            }
+        }
+    }
+
     // Function to handle file selection and update UI, without calling the API.
     function handleFileSelected(file) {
         // Create a temporary URL for the uploaded file to be used in the audio player.
@@ -0,0 +1,131 @@
+# benchmarks/backends.py
+"""
+Side-by-side benchmark of the inference backends (TF SavedModel, TFLite,
+ONNX) on the same fixtures: model load time, detection latency and
+throughput, peak RSS, and a check that every backend detects the same keys.
+
+    python -m benchmarks.backends                            # every installed backend
+    python -m benchmarks.backends --backends onnx,tflite --quick
+
+Each backend runs in its own process, so that RSS and thread pools are
+not shared. The exit status is 1 when the backends disagree on a key.
+"""
+import argparse
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+from benchmarks.fixtures import build_fixtures, LENGTHS
+from benchmarks.run import measure, max_rss_mb, git_commit
+
+BACKENDS = ('tf', 'tflite', 'onnx')
+# Any of these packages runs the backend
+RUNTIMES = {'tf': ('tensorflow',), 'tflite': ('tflite_runtime', 'tensorflow'), 'onnx': ('onnxruntime',)}
+
+def is_installed(backend):
+    return any(importlib.util.find_spec(name) is not None for name in RUNTIMES[backend])
+
+def run_backend(backend, fixtures, repeat):
+    """
+    Benchmarks one backend in this process (MODEL_BACKEND is set by the parent).
+
+    Returns:
+        dict: Load time, per-fixture latency statistics and detected keys, and peak RSS.
+    """
+    from src import audio_io, model_session, pitch_detector
+    start = time.perf_counter()
+    model_session.load(backend=backend)
+    load_seconds = time.perf_counter() - start
+
+    stages, keys = {}, {}
+    for name, path in fixtures.items():
+        with open(path, 'rb') as f:
+            audio = audio_io.preprocess(f.read(), '.wav')
+        keys[name] = list(pitch_detector.run_audio(audio))
+        stages[name] = measure(lambda audio=audio: pitch_detector.run_audio(audio), repeat, warmup=0)
+    return {
+        'load_seconds': round(load_seconds, 3),
+        'stages': stages,
+        'keys': keys,
+        'max_rss_mb': max_rss_mb(),
+    }
+
+def key_mismatches(results):
+    """Fixtures whose detected key differs between the benchmarked backends."""
+    keys = {}
+    for backend, result in results.items():
+        for name, key in result.get('keys', {}).items():
+            keys.setdefault(name, {})[backend] = key
+    return {name: by_backend for name, by_backend in keys.items()
+            if len({tuple(key) for key in by_backend.values()}) > 1}
+
+def spawn(backend, args):
+    """Runs the benchmark of a backend in a fresh interpreter."""
+    with tempfile.TemporaryDirectory() as directory:
+        output = os.path.join(directory, 'result.json')
+        env = dict(os.environ, MODEL_BACKEND=backend,
+                   BATCH_MAX_WAIT_MS='0') # No batching wait: a single request at a time
+        command = [sys.executable, '-m', 'benchmarks.backends', '--child', backend, '--child-output', output,
+                   '--fixtures-dir', args.fixtures_dir, '--repeat', str(args.repeat)]
+        if args.quick:
+            command.append('--quick')
+        process = subprocess.run(command, cwd=ROOT, env=env, capture_output=True, text=True)
+        if process.returncode != 0:
+            return {'error': process.stderr.strip().splitlines()[-1] if process.stderr.strip() else 'failed'}
+        with open(output) as f:
+            return json.load(f)
+
+def summary(name, result):
+    if 'stages' not in result:
+        return f"{name:<8} {result.get('skipped') or result.get('error')}"
+    stages = result['stages'].values()
+    p50 = sum(s['p50_ms'] for s in stages) / len(stages)
+    throughput = sum(s['throughput_per_s'] for s in stages) / len(stages)
+    return (f"{name:<8} load {result['load_seconds']:>6.2f} s  mean p50 {p50:>9.1f} ms  "
+            f"{throughput:>6.2f} files/s  max RSS {result['max_rss_mb']} MB")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark of the inference backends.')
+    parser.add_argument('--backends', default=','.join(BACKENDS), help='comma-separated backends')
+    parser.add_argument('--output', default=os.path.join(ROOT, 'backends_results.json'),
+                        help='results file (JSON)')
+    parser.add_argument('--fixtures-dir', default=os.path.join(ROOT, 'benchmarks', 'fixtures'),
+                        help='where the synthesized WAV fixtures are written')
+    parser.add_argument('--repeat', type=int, default=5, help='detections timed per fixture')
+    parser.add_argument('--quick', action='store_true', help='shortest fixtures only')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    parser.add_argument('--child-output', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    fixtures = build_fixtures(args.fixtures_dir, lengths=LENGTHS[:1] if args.quick else LENGTHS)
+    if args.child:
+        with open(args.child_output, 'w') as f:
+            json.dump(run_backend(args.child, fixtures, args.repeat), f)
+        return 0
+
+    results = {}
+    for backend in args.backends.split(','):
+        if backend not in BACKENDS:
+            parser.error(f"unknown backend '{backend}'")
+        results[backend] = spawn(backend, args) if is_installed(backend) else {'skipped': 'not installed'}
+        print(summary(backend, results[backend]))
+
+    mismatches = key_mismatches(results)
+    with open(args.output, 'w') as f:
+        json.dump({'commit': git_commit(), 'backends': results, 'key_mismatches': mismatches}, f, indent=2)
+    print(f"\nResults written to {args.output}")
+    for name, by_backend in mismatches.items():
+        print(f"Different keys for {name}: {by_backend}")
+    if not mismatches:
+        print("Same keys with every backend.")
+    return 1 if mismatches else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
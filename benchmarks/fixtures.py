@@ -0,0 +1,50 @@
+# benchmarks/fixtures.py
+import os
+import numpy as np
+import soundfile as sf
+
+# MIDI notes of the synthesized fixtures
+TONES = {
+    'sine': [69], # A4
+    'triad': [60, 64, 67], # C major
+}
+LENGTHS = (5, 30) # seconds
+SAMPLE_RATES = (22050, 44100)
+
+def midi_to_hz(note):
+    return 440.0 * 2 ** ((note - 69) / 12)
+
+def synthesize(notes, seconds, sample_rate):
+    """
+    Renders MIDI notes as a plucked-like tone: the notes are struck again
+    every half second, so the transcription sees onsets and not one long note.
+
+    Returns:
+        np.ndarray: Mono float32 samples in [-1, 1].
+    """
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    envelope = np.exp(-3.0 * (t % 0.5)) # Re-attack every 0.5 s
+    audio = sum(np.sin(2 * np.pi * midi_to_hz(note) * t) for note in notes)
+    return (0.8 / len(notes) * envelope * audio).astype(np.float32)
+
+def fixture_name(tone, seconds, sample_rate):
+    return f'{tone}_{seconds}s_{sample_rate}hz.wav'
+
+def build_fixtures(directory, tones=TONES, lengths=LENGTHS, sample_rates=SAMPLE_RATES):
+    """
+    Writes the WAV fixtures to a directory (existing files are reused).
+
+    Returns:
+        dict: Fixture name -> path.
+    """
+    os.makedirs(directory, exist_ok=True)
+    fixtures = {}
+    for tone, notes in tones.items():
+        for seconds in lengths:
+            for sample_rate in sample_rates:
+                name = fixture_name(tone, seconds, sample_rate)
+                path = os.path.join(directory, name)
+                if not os.path.exists(path):
+                    sf.write(path, synthesize(notes, seconds, sample_rate), sample_rate, subtype='PCM_16')
+                fixtures[name] = path
+    return fixtures
@@ -0,0 +1,36 @@
+# benchmarks/legacy.py
+"""
+Implementations replaced by faster ones, kept to time them against the
+current code (and to check that both give the same answers).
+"""
+from itertools import combinations
+
+def legacy_find_chord(notes):
+    """The close-position, root-position check used before the template matcher."""
+    from src.pitch_detector import get_pitch_class_name
+    notes = sorted(notes)
+    if notes[1] - notes[0] == 4 and notes[2] - notes[1] == 3:
+        return f"{get_pitch_class_name(notes[0])} Major"
+    if notes[1] - notes[0] == 3 and notes[2] - notes[1] == 4:
+        return f"{get_pitch_class_name(notes[0])} Minor"
+    return None
+
+def legacy_find_triads(common_notes):
+    """The combinations loop used before the template matcher."""
+    found = []
+    for chord in combinations(common_notes, 3):
+        name = legacy_find_chord(list(chord))
+        if name:
+            found.append(name)
+    return found
+
+def legacy_get_scale(key_name):
+    """The /scale handler before the pre-encoded table: rebuilds all scales per request."""
+    from unittest.mock import patch
+    from flask import jsonify
+    import src.scales_generator as sg
+    from src.utils import Scale
+    with patch('src.scales_generator.SCALES', sg.run()):
+        new_scale = Scale(key_name)
+    print(f"GET method for '{key_name}'")
+    return jsonify(new_scale.to_dict()), 200
@@ -0,0 +1,266 @@
+# benchmarks/run.py
+"""
+Benchmark suite of the detection and scale hot paths.
+
+Runs offline on synthesized audio fixtures and writes latency percentiles,
+throughput and peak memory of each stage to a JSON file:
+
+    python -m benchmarks.run                       # all the stages
+    python -m benchmarks.run --quick --only api    # a subset, fewer repeats
+    python -m benchmarks.run --compare old.json    # also print the changes
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+from benchmarks.fixtures import build_fixtures, LENGTHS
+
+RESULTS_FORMAT = 1
+
+def percentile(sorted_values, q):
+    """Linear-interpolated percentile of sorted values (q in [0, 100])."""
+    position = (len(sorted_values) - 1) * q / 100
+    low = int(position)
+    high = min(low + 1, len(sorted_values) - 1)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (position - low)
+
+def measure(fn, repeat, warmup=1):
+    """
+    Times repeated calls of fn, then measures its peak Python memory
+    (tracemalloc, which also tracks NumPy buffers) on one more call.
+
+    Returns:
+        dict: Latency statistics in ms, throughput in calls/s and peak memory in MB.
+    """
+    with contextlib.redirect_stdout(io.StringIO()): # Keeps the report clean if a library prints
+        for _ in range(warmup):
+            fn()
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            timings.append(time.perf_counter() - start)
+        tracemalloc.start()
+        try:
+            fn()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+    timings.sort()
+    ms = [t * 1000 for t in timings]
+    return {
+        'n': repeat,
+        'mean_ms': round(sum(ms) / len(ms), 4),
+        'p50_ms': round(percentile(ms, 50), 4),
+        'p90_ms': round(percentile(ms, 90), 4),
+        'p99_ms': round(percentile(ms, 99), 4),
+        'min_ms': round(ms[0], 4),
+        'max_ms': round(ms[-1], 4),
+        'throughput_per_s': round(len(timings) / sum(timings), 2),
+        'peak_memory_mb': round(peak / 2**20, 3),
+    }
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ Stages ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Each stage group returns (name, fn, repeat) tuples
+
+def scale_stages():
+    import src.scales_generator as sg
+    from src.utils import Scale
+    return [
+        ('scales_generator.run', sg.run, 200),
+        ('Scale(c)', lambda: Scale('c'), 2000),
+        ('Scale(f-sharpm)', lambda: Scale('f-sharpm'), 2000),
+    ]
+
+def note_lists():
+    """Synthetic transcriptions: MIDI note lists of several sizes, from a few pitch classes."""
+    rng = random.Random(0)
+    lists = {}
+    for size in (100, 2000):
+        pitch_classes = [0, 2, 4, 5, 7, 9, 11] # C major
+        lists[size] = [rng.choice(pitch_classes) + 12 * rng.randint(3, 6) for _ in range(size)]
+    return lists
+
+def heuristic_stages():
+    from benchmarks.legacy import legacy_find_triads
+    from src import key_profiles, pitch_detector
+    stages = []
+    for k in (10, 24, 48):
+        # The k most common notes span several octaves
+        common_notes = [36 + (i * 7) % 48 for i in range(k)]
+        stages += [
+            (f'find_triads.combinations[k={k}]', lambda n=common_notes: legacy_find_triads(n), 200),
+            (f'find_triads.templates[k={k}]', lambda n=common_notes: pitch_detector.match_templates(
+                n, pitch_detector.TRIAD_TEMPLATES), 200),
+        ]
+    for size, notes in note_lists().items():
+        events = [(i * 0.1, i * 0.1 + 0.25, note, 0.8) for i, note in enumerate(notes)]
+        stages += [
+            (f'detect_pitch[notes={size},k=10]', lambda notes=notes: pitch_detector.detect_pitch(notes, 10), 500),
+            (f'detect_key[notes={size}]', lambda notes=notes: pitch_detector.detect_key(notes), 500),
+            (f'key_profiles.detect_key[notes={size}]', lambda events=events: key_profiles.detect_key(events), 500),
+        ]
+    return stages
+
+def audio_stages(fixtures):
+    from src import audio_io, chroma
+    from basic_pitch.constants import AUDIO_SAMPLE_RATE
+    stages = []
+    for name, path in fixtures.items():
+        with open(path, 'rb') as f:
+            data = f.read()
+        audio = audio_io.preprocess(data, '.wav')
+        stages.append((f'decode_bytes[{name}]', lambda data=data: audio_io.decode_bytes(data, '.wav'), 20))
+        stages.append((f'preprocess[{name}]', lambda data=data: audio_io.preprocess(data, '.wav'), 20))
+        # First tier of the key cascade (the model stages are the second)
+        stages.append((f'chroma.estimate_key[{name}]',
+                       lambda audio=audio: chroma.estimate_key(audio, AUDIO_SAMPLE_RATE), 10))
+    return stages
+
+def model_stages(fixtures):
+    from src import audio_io, model_session, pitch_detector as pd
+    model_session.load()
+    stages = []
+    for name, path in fixtures.items():
+        with open(path, 'rb') as f:
+            model_output = pd.predict(audio_io.preprocess(f.read(), '.wav'))
+        stages += [
+            (f'pitch_detector.run[{name}]', lambda path=path: pd.run(path), 3),
+            # Key from the same model output: note tracking + MIDI, or the posteriorgrams alone
+            (f'key_from_notes[{name}]', lambda o=model_output: pd.detect_key(
+                [event[2] for event in pd.track_notes(o)[1]]), 10),
+            (f'key_from_posteriors[{name}]', lambda o=model_output: pd.key_from_ranking(
+                pd.energy_ranking(pd.pitch_energy(o), pd.MAX_COMMON_NOTES)), 10),
+        ]
+    return stages
+
+def api_stages(fixtures):
+    from app.app import app
+    from benchmarks.legacy import legacy_get_scale
+    from src.result_cache import get_cache
+    app.add_url_rule('/legacy/scale/<string:key_name>', view_func=legacy_get_scale)
+    client = app.test_client()
+
+    def detect(data):
+        get_cache().clear() # Measure the detection, not the result cache
+        response = client.post('/api/detect', content_type='multipart/form-data',
+                               data={'audio': (io.BytesIO(data), 'fixture.wav', 'audio/wav')})
+        assert response.status_code == 200, response.data
+
+    stages = [
+        ('GET /api/scale/c', lambda: client.get('/api/scale/c'), 2000),
+        # The same scale with the table rebuilt per request, as before it was pre-encoded
+        ('GET /legacy/scale/c', lambda: client.get('/legacy/scale/c'), 200),
+        ('GET /api/scales', lambda: client.get('/api/scales'), 1000),
+        ('GET /api/scales?keys=c,am,f-sharp', lambda: client.get('/api/scales?keys=c,am,f-sharp'), 1000),
+    ]
+    for name, path in fixtures.items():
+        with open(path, 'rb') as f:
+            data = f.read()
+        stages.append((f'POST /api/detect[{name}]', lambda data=data: detect(data), 3))
+    return stages
+
+GROUPS = ('scales', 'heuristic', 'audio', 'model', 'api')
+
+def collect_stages(groups, fixtures):
+    stages = []
+    if 'scales' in groups:
+        stages += scale_stages()
+    if 'heuristic' in groups:
+        stages += heuristic_stages()
+    if 'audio' in groups:
+        stages += audio_stages(fixtures)
+    if 'model' in groups:
+        stages += model_stages(fixtures)
+    if 'api' in groups:
+        stages += api_stages(fixtures)
+    return stages
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ Results ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+def max_rss_mb():
+    """Peak RSS of the process, native allocations (e.g. the model runtime) included."""
+    try:
+        import resource
+    except ImportError: # Windows
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / 2**20 if sys.platform == 'darwin' else rss / 2**10, 1)
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results, baseline):
+    """Prints the p50 latency changes against a previous results file."""
+    print(f"\n{'stage':<55} {'p50 before':>11} {'p50 now':>11} {'change':>8}")
+    for name, stats in results['stages'].items():
+        old = baseline['stages'].get(name)
+        if old is None:
+            continue
+        change = (stats['p50_ms'] - old['p50_ms']) / old['p50_ms'] * 100 if old['p50_ms'] else 0.0
+        print(f"{name:<55} {old['p50_ms']:>9.3f}ms {stats['p50_ms']:>9.3f}ms {change:>+7.1f}%")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmarks of the detection and scale hot paths.')
+    parser.add_argument('--output', default=os.path.join(ROOT, 'bench_results.json'),
+                        help='results file (JSON)')
+    parser.add_argument('--fixtures-dir', default=os.path.join(ROOT, 'benchmarks', 'fixtures'),
+                        help='where the synthesized WAV fixtures are written')
+    parser.add_argument('--groups', default=','.join(GROUPS),
+                        help=f"comma-separated stage groups ({', '.join(GROUPS)})")
+    parser.add_argument('--only', default='', help='only run the stages whose name contains this text')
+    parser.add_argument('--quick', action='store_true', help='shortest fixtures and a tenth of the repeats')
+    parser.add_argument('--compare', help='previous results file to compare with')
+    args = parser.parse_args(argv)
+
+    lengths = LENGTHS[:1] if args.quick else LENGTHS
+    fixtures = build_fixtures(args.fixtures_dir, lengths=lengths)
+    stages = collect_stages(args.groups.split(','), fixtures)
+
+    results = {
+        'format': RESULTS_FORMAT,
+        'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'stages': {},
+    }
+    for name, fn, repeat in stages:
+        if args.only not in name:
+            continue
+        if args.quick:
+            repeat = max(1, repeat // 10)
+        stats = measure(fn, repeat)
+        results['stages'][name] = stats
+        print(f"{name:<55} p50 {stats['p50_ms']:>10.3f} ms  p99 {stats['p99_ms']:>10.3f} ms  "
+              f"{stats['throughput_per_s']:>10.1f}/s  peak {stats['peak_memory_mb']:>8.2f} MB")
+
+    results['max_rss_mb'] = max_rss_mb()
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+    return results
+
+if __name__ == '__main__':
+    main()
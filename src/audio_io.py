@@ -0,0 +1,200 @@
+import io
+import os
+import tempfile
+import numpy as np
+import soundfile as sf
+import soxr
+from basic_pitch.constants import AUDIO_SAMPLE_RATE
+from src import metrics, tracing, uploads
+
+# Containers libsndfile decodes from memory (MP3 needs libsndfile >= 1.1);
+# the others go straight to the disk fallback
+SOUNDFILE_SUFFIXES = {f'.{name.lower()}' for name in sf.available_formats()}
+if '.ogg' in SOUNDFILE_SUFFIXES:
+    SOUNDFILE_SUFFIXES |= {'.oga', '.opus'}
+if '.aiff' in SOUNDFILE_SUFFIXES:
+    SOUNDFILE_SUFFIXES.add('.aif')
+
+# Silence trimming before inference (set TRIM_SILENCE=0 to analyze every frame)
+TRIM_SILENCE = os.environ.get('TRIM_SILENCE', '1') != '0'
+SILENCE_TOP_DB = float(os.environ.get('SILENCE_TOP_DB', 60)) # silent below the loudest frame minus this
+SILENCE_MIN_SECONDS = float(os.environ.get('SILENCE_MIN_SECONDS', 1.0)) # shorter internal gaps are kept
+SILENCE_KEEP_SECONDS = float(os.environ.get('SILENCE_KEEP_SECONDS', 0.25)) # kept around the audible audio
+SILENCE_FRAME = 1024 # RMS frame length in samples at the model rate (~46 ms)
+
+def to_model_input(audio, sample_rate):
+    """
+    Converts decoded samples to what the model expects: mono float32
+    at the model's sample rate.
+
+    Args:
+        audio (np.ndarray): Samples of shape (n_frames,) or (n_frames, n_channels).
+        sample_rate (int): Sample rate of the decoded audio.
+    """
+    if audio.ndim > 1:
+        audio = audio.mean(axis=1) # Downmix to mono
+    if sample_rate != AUDIO_SAMPLE_RATE:
+        audio = soxr.resample(audio, sample_rate, AUDIO_SAMPLE_RATE, quality='HQ')
+    return np.ascontiguousarray(audio, dtype=np.float32)
+
+def decode_buffer(data):
+    """
+    Decodes an audio file held in memory (WAV, FLAC, OGG...) without touching
+    the disk. Audio longer than MAX_AUDIO_SECONDS is refused from its header.
+    """
+    with sf.SoundFile(io.BytesIO(data)) as sound_file:
+        uploads.check_duration(sound_file.frames / sound_file.samplerate)
+        audio = sound_file.read(dtype='float32')
+    return to_model_input(audio, sound_file.samplerate)
+
+def decode_spooled(data, suffix):
+    """
+    Fallback for containers libsndfile cannot read from memory: spools
+    the bytes to a temporary file and decodes it from its path.
+    """
+    import librosa
+    with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as temp_file:
+        temp_file.write(data)
+        temp_file_path = temp_file.name
+    try:
+        uploads.check_duration(librosa.get_duration(path=temp_file_path))
+        # Native rate and channels: downmixed and resampled once, like the other containers
+        audio, sample_rate = librosa.load(temp_file_path, sr=None, mono=False)
+        return to_model_input(audio.T, sample_rate)
+    finally:
+        os.remove(temp_file_path)
+
+def decode_bytes(data, suffix=''):
+    """
+    Decodes uploaded audio bytes to mono float32 at the model's sample rate.
+
+    Args:
+        data (bytes): Content of the audio file.
+        suffix (str): File extension (e.g. '.mp3'), used by the disk fallback.
+
+    Returns:
+        np.ndarray: The decoded audio.
+    """
+    with metrics.DETECT_STAGE_SECONDS.time(stage='decode'), tracing.span('decode', bytes=len(data)):
+        if suffix and suffix.lower() not in SOUNDFILE_SUFFIXES:
+            return decode_spooled(data, suffix)
+        try:
+            return decode_buffer(data)
+        except sf.LibsndfileError:
+            return decode_spooled(data, suffix)
+
+def frame_levels(audio, frame=SILENCE_FRAME):
+    """RMS level in dB of each frame of the audio (the last one zero-padded)."""
+    padded = np.pad(audio, (0, -len(audio) % frame))
+    rms = np.sqrt(np.mean(np.square(padded.reshape(-1, frame), dtype=np.float64), axis=1))
+    return 20 * np.log10(np.maximum(rms, 1e-10))
+
+def trim_silence(audio, top_db=SILENCE_TOP_DB, min_seconds=SILENCE_MIN_SECONDS,
+                 keep_seconds=SILENCE_KEEP_SECONDS, frame=SILENCE_FRAME):
+    """
+    Drops the leading and trailing silence, and the internal silent
+    regions longer than min_seconds, keeping keep_seconds of each silent
+    region next to the audible audio.
+
+    Args:
+        audio (np.ndarray): Mono audio at the model's sample rate.
+        top_db (float): Frames quieter than the loudest one by this many dB are silent.
+
+    Returns:
+        np.ndarray: The audio without its silent regions (unchanged if it is all silent).
+    """
+    levels = frame_levels(audio, frame)
+    silent = levels < levels.max() - top_db
+    if not silent.any() or silent.all():
+        return audio
+    keep_frames = int(np.ceil(keep_seconds * AUDIO_SAMPLE_RATE / frame))
+    min_frames = int(np.ceil(min_seconds * AUDIO_SAMPLE_RATE / frame))
+
+    # Silent runs as [start, end) frame ranges
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], silent.astype(np.int8), [0]))))
+    keep = np.ones(len(silent), dtype=bool)
+    for start, end in zip(edges[::2], edges[1::2]):
+        if start == 0: # Leading silence
+            keep[:max(0, end - keep_frames)] = False
+        elif end == len(silent): # Trailing silence
+            keep[start + keep_frames:] = False
+        elif end - start > min_frames:
+            keep[start + keep_frames:end - keep_frames] = False
+    if keep.all():
+        return audio
+    return audio[np.repeat(keep, frame)[:len(audio)]]
+
+def preprocess(data, suffix=''):
+    """
+    Prepares uploaded audio bytes for inference: decodes them to mono
+    float32 at the model's sample rate and trims the silent regions.
+
+    Returns:
+        np.ndarray: The audio to analyze.
+    """
+    audio = decode_bytes(data, suffix)
+    if not TRIM_SILENCE:
+        return audio
+    with metrics.DETECT_STAGE_SECONDS.time(stage='trim'), tracing.span('trim', frames=len(audio)) as span:
+        trimmed = trim_silence(audio)
+        span.set(frames_saved=len(audio) - len(trimmed))
+    metrics.AUDIO_FRAMES.inc(len(audio), kind='decoded')
+    metrics.AUDIO_FRAMES.inc(len(audio) - len(trimmed), kind='trimmed')
+    return trimmed
+
+def split_blocks(audio, seconds):
+    """Splits decoded audio into blocks of the given duration."""
+    size = int(seconds * AUDIO_SAMPLE_RATE)
+    for start in range(0, len(audio), size):
+        yield audio[start:start + size]
+
+def open_blocks(data, seconds, suffix=''):
+    """
+    Decodes uploaded audio bytes block by block, so that the analysis can
+    stop before the whole file is decoded.
+
+    Args:
+        data (bytes): Content of the audio file.
+        seconds (float): Duration of each block.
+        suffix (str): File extension (e.g. '.mp3'), used by the disk fallback.
+
+    Returns:
+        tuple: Duration of the file in seconds and a generator of mono
+        float32 blocks at the model's sample rate.
+    """
+    try:
+        sound_file = sf.SoundFile(io.BytesIO(data))
+    except sf.LibsndfileError:
+        audio = decode_spooled(data, suffix)
+        return len(audio) / AUDIO_SAMPLE_RATE, split_blocks(audio, seconds)
+    try:
+        uploads.check_duration(sound_file.frames / sound_file.samplerate)
+    except uploads.AudioTooLongError:
+        sound_file.close()
+        raise
+    if sound_file.format == 'MP3':
+        # libsndfile's MP3 decoder glitches on partial reads, so decode it at once
+        sound_file.close()
+        audio = decode_buffer(data)
+        return len(audio) / AUDIO_SAMPLE_RATE, split_blocks(audio, seconds)
+
+    def blocks():
+        with sound_file:
+            block_size = int(seconds * sound_file.samplerate)
+            resampler = None
+            if sound_file.samplerate != AUDIO_SAMPLE_RATE:
+                # A stream resampler keeps the block boundaries seamless
+                resampler = soxr.ResampleStream(sound_file.samplerate, AUDIO_SAMPLE_RATE, 1,
+                                                dtype='float32', quality='HQ')
+            remaining = sound_file.frames
+            while remaining > 0:
+                block = sound_file.read(min(block_size, remaining), dtype='float32', always_2d=True)
+                if len(block) == 0:
+                    break
+                remaining -= len(block)
+                mono = block.mean(axis=1)
+                if resampler is not None:
+                    mono = resampler.resample_chunk(mono, last=remaining <= 0)
+                yield np.ascontiguousarray(mono, dtype=np.float32)
+
+    return sound_file.frames / sound_file.samplerate, blocks()
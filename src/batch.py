@@ -0,0 +1,120 @@
+import os
+import posixpath
+import tarfile
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from src import uploads
+
+# Files of a batch detected at the same time (they share the batching scheduler
+# or the worker pool, so this mostly bounds the memory held by the batch)
+BATCH_CONCURRENCY = int(os.environ.get('BATCH_CONCURRENCY', 4))
+
+# Audio files accepted inside archives, by extension
+AUDIO_EXTENSIONS = ('.mp3', '.wav', '.ogg', '.flac')
+
+def is_archive(fileobj):
+    """True for a zip or tar (optionally compressed) file object. Rewinds it."""
+    try:
+        if zipfile.is_zipfile(fileobj):
+            return True
+        fileobj.seek(0)
+        try:
+            with tarfile.open(fileobj=fileobj, mode='r:*'):
+                return True
+        except tarfile.TarError:
+            return False
+    finally:
+        fileobj.seek(0)
+
+def iter_archive(fileobj):
+    """
+    Reads the files of a zip or tar archive one at a time.
+
+    Yields:
+        tuple: (name, data, error) for each file, where data is None and
+        error a message for the files that are not supported audio.
+    """
+    if zipfile.is_zipfile(fileobj):
+        fileobj.seek(0)
+        with zipfile.ZipFile(fileobj) as archive:
+            for info in archive.infolist():
+                if not info.is_dir() and not is_hidden(info.filename):
+                    yield read_member(info.filename, info.file_size, lambda: archive.open(info))
+    else:
+        fileobj.seek(0)
+        with tarfile.open(fileobj=fileobj, mode='r:*') as archive:
+            for member in archive:
+                if member.isfile() and not is_hidden(member.name):
+                    yield read_member(member.name, member.size, lambda: archive.extractfile(member))
+
+def is_hidden(name):
+    """Metadata entries added by archivers (e.g. __MACOSX/, ._file, .DS_Store)."""
+    return any(part.startswith(('.', '__MACOSX')) for part in name.split('/'))
+
+def read_member(name, size, open_member):
+    """
+    Reads an archived file of the declared size, opened with open_member(),
+    at most one byte past the upload limit (archives can declare any size).
+    """
+    if posixpath.splitext(name)[1].lower() not in AUDIO_EXTENSIONS:
+        return name, None, 'Unsupported file type.'
+    try:
+        uploads.check_size(size)
+        data = read_archived(open_member, uploads.MAX_UPLOAD_BYTES + 1 if uploads.MAX_UPLOAD_BYTES else -1)
+        uploads.check_size(len(data))
+    except uploads.UploadTooLargeError as e:
+        return name, None, str(e)
+    except (OSError, zipfile.BadZipFile, tarfile.TarError) as e:
+        return name, None, f'Could not read the file from the archive: {e}'
+    # The container is recognized from the first bytes, not from the file name
+    if uploads.sniff_format(data[:uploads.SNIFF_BYTES]) is None:
+        return name, None, 'Unsupported file type.'
+    return name, data, None
+
+def read_archived(open_member, n):
+    """Reads up to n bytes of an archived file, closing it (and its decompressor) right away."""
+    with open_member() as member:
+        return member.read(n)
+
+def run_batch(files, detect, concurrency=BATCH_CONCURRENCY):
+    """
+    Detects the keys of many files concurrently, yielding each result as
+    soon as it is ready. Files are only read as detection slots free up.
+
+    Args:
+        files: Iterable of (name, data, error) tuples; files with an error
+            are reported without being detected.
+        detect: Function of the file data returning the result dict.
+        concurrency (int): Files detected at the same time.
+
+    Yields:
+        dict: {'index', 'file'} plus the result, or an 'error' for the
+        files that failed. Results come in completion order.
+    """
+    executor = ThreadPoolExecutor(concurrency)
+    pending = {} # Future -> (index, name)
+
+    def finished(futures):
+        for future in futures:
+            index, name = pending.pop(future)
+            try:
+                yield {'index': index, 'file': name, **future.result()}
+            except Exception as e:
+                yield {'index': index, 'file': name, 'error': str(e) or type(e).__name__}
+
+    try:
+        for index, (name, data, error) in enumerate(files):
+            if error is not None:
+                yield {'index': index, 'file': name, 'error': error}
+                continue
+            pending[executor.submit(detect, data)] = (index, name)
+            # Keep the next files queued behind the running ones, not more
+            while len(pending) >= 2 * concurrency:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                yield from finished(done)
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            yield from finished(done)
+    finally:
+        # Also runs when the client disconnects: drop the files not started yet
+        executor.shutdown(wait=False, cancel_futures=True)
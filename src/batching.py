@@ -0,0 +1,145 @@
+import os
+import queue
+import threading
+import time
+import numpy as np
+from src import model_session
+
+# Scheduler settings (can be overridden through environment variables)
+MAX_BATCH_SIZE = int(os.environ.get('BATCH_MAX_SIZE', 16)) # model windows per forward pass
+MAX_WAIT_MS = float(os.environ.get('BATCH_MAX_WAIT_MS', 5)) # time to wait for more requests
+
+class _Request:
+    """A block of audio windows waiting for a forward pass."""
+    def __init__(self, windows):
+        self.windows = windows
+        self.enqueued_at = time.perf_counter()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class BatchScheduler:
+    """
+    Collects audio windows from concurrent requests for a few milliseconds
+    and runs them through the model as a single batched forward pass.
+    """
+    def __init__(self, predict_fn, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS):
+        """
+        Args:
+            predict_fn: Callable taking an array (n_windows, n_samples, 1) and
+                returning a dict of arrays batched on the first axis.
+            max_batch_size (int): Maximum number of windows per forward pass.
+            max_wait_ms (float): Maximum time to wait for a batch to fill up.
+        """
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        self._carry = None # Request that did not fit in the previous batch
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'requests': 0,
+            'batches': 0,
+            'windows': 0,
+            'batch_sizes': {},
+            'queue_wait_total_ms': 0.0,
+            'queue_wait_max_ms': 0.0,
+        }
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def submit(self, windows):
+        """
+        Queues audio windows and blocks until their predictions are ready.
+
+        Args:
+            windows (np.ndarray): Array of shape (n_windows, n_samples, 1).
+
+        Returns:
+            dict: Model outputs for these windows only.
+        """
+        # Long files are split so that no single request exceeds a batch
+        requests = [_Request(windows[i:i + self.max_batch_size])
+                    for i in range(0, len(windows), self.max_batch_size)]
+        for request in requests:
+            self._queue.put(request)
+        for request in requests:
+            request.done.wait()
+            if request.error is not None:
+                raise request.error
+        if len(requests) == 1:
+            return requests[0].result
+        return {k: np.concatenate([r.result[k] for r in requests]) for k in requests[0].result}
+
+    def stats(self):
+        """Returns a snapshot of the batch size and queue wait counters."""
+        with self._stats_lock:
+            stats = dict(self._stats)
+            stats['batch_sizes'] = dict(self._stats['batch_sizes'])
+        stats['queue_wait_avg_ms'] = stats['queue_wait_total_ms'] / stats['requests'] if stats['requests'] else 0.0
+        stats['batch_size_avg'] = stats['windows'] / stats['batches'] if stats['batches'] else 0.0
+        return stats
+
+    def _collect(self):
+        """Gathers requests until the batch is full or the wait time is over."""
+        first = self._carry or self._queue.get()
+        self._carry = None
+        batch = [first]
+        size = len(first.windows)
+        deadline = time.perf_counter() + self.max_wait
+        while size < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if size + len(request.windows) > self.max_batch_size:
+                self._carry = request # Keep it for the next batch
+                break
+            batch.append(request)
+            size += len(request.windows)
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._collect()
+            started = time.perf_counter()
+            try:
+                outputs = self.predict_fn(np.concatenate([r.windows for r in batch]))
+                # Fan the results back out to each waiting request
+                offset = 0
+                for request in batch:
+                    n = len(request.windows)
+                    request.result = {k: v[offset:offset + n] for k, v in outputs.items()}
+                    offset += n
+            except Exception as e:
+                for request in batch:
+                    request.error = e
+            self._record(batch, started)
+            for request in batch:
+                request.done.set()
+
+    def _record(self, batch, started):
+        size = sum(len(r.windows) for r in batch)
+        with self._stats_lock:
+            self._stats['requests'] += len(batch)
+            self._stats['batches'] += 1
+            self._stats['windows'] += size
+            self._stats['batch_sizes'][size] = self._stats['batch_sizes'].get(size, 0) + 1
+            for request in batch:
+                wait_ms = (started - request.enqueued_at) * 1000
+                self._stats['queue_wait_total_ms'] += wait_ms
+                self._stats['queue_wait_max_ms'] = max(self._stats['queue_wait_max_ms'], wait_ms)
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def get_scheduler():
+    """Returns the process-wide scheduler in front of the resident model."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = BatchScheduler(lambda x: model_session.get_model().predict(x))
+    return _scheduler
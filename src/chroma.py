@@ -0,0 +1,52 @@
+# src/chroma.py
+"""
+Cheap first-pass key estimate from a chromagram, without the model.
+
+The mean constant-Q chroma of the audio is correlated with the key
+profiles. When the best key beats the runner-up by CHROMA_MIN_CONFIDENCE,
+it answers the request; otherwise the detection escalates to basic-pitch.
+"""
+import os
+import numpy as np
+from src import key_profiles, metrics, tracing
+
+# Two-tier cascade: the chroma estimate first, the model only when it is unsure
+KEY_CASCADE = os.environ.get('KEY_CASCADE', '0') != '0'
+# Correlation margin of the best key over the runner-up needed to skip the model
+CHROMA_MIN_CONFIDENCE = float(os.environ.get('CHROMA_MIN_CONFIDENCE', 0.15))
+# Chroma frame hop in samples (~93 ms at 22.05 kHz; only the mean over time is used)
+CHROMA_HOP_LENGTH = 2048
+
+def chroma_vector(audio, sample_rate):
+    """Mean constant-Q chroma of mono audio: 12 energies, C to B."""
+    import librosa
+    if len(audio) == 0:
+        return np.zeros(12)
+    chroma = librosa.feature.chroma_cqt(y=audio, sr=sample_rate, hop_length=CHROMA_HOP_LENGTH)
+    return chroma.mean(axis=1)
+
+def confidence(ranked):
+    """Correlation margin of the best key over the runner-up (0 without a key)."""
+    if len(ranked) < 2:
+        return 0.0
+    return round(ranked[0]['confidence'] - ranked[1]['confidence'], 4)
+
+def estimate_key(audio, sample_rate):
+    """
+    Estimates the key of mono audio from its chroma.
+
+    Returns:
+        tuple: (pitch, mode, ranked, confidence) where ranked is the output
+        of key_profiles.rank_keys and confidence the margin of the best key.
+    """
+    with metrics.DETECT_STAGE_SECONDS.time(stage='chroma'), tracing.span('chroma') as span:
+        pitch, mode, ranked = key_profiles.detect_key_from_vector(chroma_vector(audio, sample_rate))
+        margin = confidence(ranked)
+        span.set(pitch=pitch, mode=mode, confidence=margin)
+    return pitch, mode, ranked, margin
+
+def warm_up(sample_rate=22050, seconds=3):
+    """Computes one chromagram so that librosa's JIT compilation is not paid by a request."""
+    # Long enough for the lowest octave of the constant-Q transform (no short-signal warnings)
+    t = np.arange(int(seconds * sample_rate), dtype=np.float32) / sample_rate
+    chroma_vector(0.5 * np.sin(2 * np.pi * 440.0 * t), sample_rate)
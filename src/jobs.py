@@ -0,0 +1,120 @@
+import os
+import queue
+import threading
+import time
+import uuid
+
+# Job pool settings (can be overridden through environment variables)
+DETECT_WORKERS = int(os.environ.get('DETECT_WORKERS', 2)) # detection worker threads
+DETECT_QUEUE_SIZE = int(os.environ.get('DETECT_QUEUE_SIZE', 16)) # jobs waiting for a worker
+JOB_TTL = float(os.environ.get('JOB_TTL', 600)) # seconds a finished job is kept
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue is full."""
+
+class Job:
+    """A unit of work tracked by the job queue."""
+    def __init__(self, fn, args):
+        self.id = uuid.uuid4().hex
+        self.fn = fn
+        self.args = args
+        self.status = 'queued' # queued -> running -> done | failed
+        self.result = None
+        self.error = None
+        self.finished_at = None
+
+    def to_dict(self):
+        data = {'job_id': self.id, 'status': self.status}
+        if self.status == 'done':
+            data['result'] = self.result
+        elif self.status == 'failed':
+            data['error'] = self.error
+        return data
+
+class JobQueue:
+    """
+    Bounded queue of jobs served by a fixed pool of worker threads.
+    Submissions fail fast when the queue is full instead of blocking.
+    """
+    def __init__(self, workers=DETECT_WORKERS, max_queued=DETECT_QUEUE_SIZE, ttl=JOB_TTL):
+        """
+        Args:
+            workers (int): Number of worker threads.
+            max_queued (int): Maximum number of jobs waiting for a worker.
+            ttl (float): Seconds a finished job is kept before it is forgotten.
+        """
+        self.ttl = ttl
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._jobs = {}
+        self._lock = threading.Lock()
+        for _ in range(workers):
+            threading.Thread(target=self._worker, daemon=True).start()
+
+    def submit(self, fn, *args):
+        """
+        Queues fn(*args) and returns its job immediately.
+
+        Raises:
+            QueueFullError: If the queue has no free slot.
+        """
+        job = Job(fn, args)
+        with self._lock:
+            self._purge()
+            self._jobs[job.id] = job
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                del self._jobs[job.id]
+            raise QueueFullError('The detection queue is full.')
+        return job
+
+    def get(self, job_id):
+        """Returns the job with the given id, or None if it is unknown."""
+        with self._lock:
+            self._purge() # Also on an idle server, where nothing is submitted
+            return self._jobs.get(job_id)
+
+    def full(self):
+        """True when no more jobs can be queued."""
+        return self._queue.full()
+
+    def depth(self):
+        """Number of jobs waiting for a worker."""
+        return self._queue.qsize()
+
+    def _purge(self):
+        # Forget finished jobs older than the TTL
+        now = time.monotonic()
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.finished_at is not None and now - job.finished_at > self.ttl]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            job.status = 'running'
+            try:
+                job.result = job.fn(*job.args)
+                status = 'done'
+            except Exception as e:
+                job.error = str(e)
+                status = 'failed'
+            finally:
+                # Finished jobs are kept for the TTL: release the upload they were given
+                job.fn = job.args = None
+            job.finished_at = time.monotonic()
+            job.status = status
+            self._queue.task_done()
+
+_job_queue = None
+_job_queue_lock = threading.Lock()
+
+def get_job_queue():
+    """Returns the process-wide detection job queue."""
+    global _job_queue
+    with _job_queue_lock:
+        if _job_queue is None:
+            _job_queue = JobQueue()
+    return _job_queue
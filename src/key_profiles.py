@@ -0,0 +1,88 @@
+import numpy as np
+
+# Mapping from pitch class numbers to note names
+PITCH_CLASSES = ["C", "C#", "D", "D#", "E", "F",
+                    "F#", "G", "G#", "A", "A#", "B"]
+
+# Krumhansl-Kessler key profiles (probe-tone ratings), tonic first
+MAJOR_PROFILE = np.array([6.35, 2.23, 3.48, 2.33, 4.38, 4.09, 2.52, 5.19, 2.39, 3.66, 2.29, 2.88])
+MINOR_PROFILE = np.array([6.33, 2.68, 3.52, 5.38, 2.60, 3.53, 2.54, 4.75, 3.98, 2.69, 3.34, 3.17])
+
+def _standardize(x):
+    """Zero mean, unit variance along the last axis."""
+    x = x - x.mean(axis=-1, keepdims=True)
+    return x / x.std(axis=-1, keepdims=True)
+
+# The 24 keys: index i < 12 is the major key on pitch class i, i >= 12 the minor one
+KEYS = [(name, 'Major') for name in PITCH_CLASSES] + [(name, 'Minor') for name in PITCH_CLASSES]
+# Standardized profiles of all 24 keys, shape (24, 12)
+KEY_MATRIX = _standardize(np.stack(
+    [np.roll(MAJOR_PROFILE, root) for root in range(12)] +
+    [np.roll(MINOR_PROFILE, root) for root in range(12)]
+))
+
+def pitch_class_vector(note_events):
+    """
+    Builds a 12-bin pitch-class histogram weighted by note duration and amplitude.
+
+    Args:
+        note_events (list): (start, end, pitch, amplitude, ...) tuples from basic-pitch.
+
+    Returns:
+        np.ndarray: Weights of the pitch classes C to B.
+    """
+    if not note_events:
+        return np.zeros(12)
+    events = np.array([event[:4] for event in note_events], dtype=np.float64)
+    start, end, pitch, amplitude = events.T
+    weights = (end - start) * amplitude
+    return np.bincount(pitch.astype(np.int64) % 12, weights=weights, minlength=12)
+
+def correlate(vector):
+    """
+    Pearson correlation of a pitch-class vector with all 24 key profiles,
+    computed as a single matrix product.
+
+    Returns:
+        np.ndarray: 24 correlations in KEYS order (zeros for an empty vector).
+    """
+    vector = np.asarray(vector, dtype=np.float64)
+    if not vector.any() or vector.std() == 0:
+        return np.zeros(len(KEYS))
+    return KEY_MATRIX @ _standardize(vector) / 12
+
+def rank_keys(vector):
+    """
+    Ranks the 24 keys for a pitch-class vector.
+
+    Returns:
+        list: {'pitch', 'mode', 'confidence'} dicts, best key first
+        (empty when there are no notes).
+    """
+    scores = correlate(vector)
+    if not scores.any():
+        return []
+    order = np.argsort(-scores, kind='stable')
+    return [{'pitch': KEYS[i][0], 'mode': KEYS[i][1], 'confidence': round(float(scores[i]), 4)}
+            for i in order]
+
+def detect_key(note_events):
+    """
+    Finds the key of transcribed notes with the key-profile engine.
+
+    Returns:
+        tuple: (pitch, mode, ranked) where ranked is the output of rank_keys.
+    """
+    return detect_key_from_vector(pitch_class_vector(note_events))
+
+def detect_key_from_vector(vector):
+    """
+    Finds the key of a 12-bin pitch-class vector (e.g. energies from the posteriorgrams).
+
+    Returns:
+        tuple: (pitch, mode, ranked) where ranked is the output of rank_keys.
+    """
+    ranked = rank_keys(vector)
+    if not ranked:
+        return None, None, ranked
+    return ranked[0]['pitch'], ranked[0]['mode'], ranked
@@ -0,0 +1,139 @@
+# src/metrics.py
+"""
+In-process counters and latency histograms, exposed in the Prometheus
+text format by the /metrics endpoint.
+
+Recording is a lock and a few additions; the text is only built when
+the endpoint is scraped.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Upper bounds (in seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_registry = []
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+def escape(value):
+    return value.replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+def format_labels(pairs):
+    """Renders (name, value) label pairs as {name="value",...} (empty without labels)."""
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in pairs) + '}'
+
+class Counter:
+    """Monotonic counter, optionally split by labels."""
+    type = 'counter'
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {} # Label values -> count
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[name]) for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(str(labels[name]) for name in self.labels), 0)
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield f'{self.name}{format_labels(list(zip(self.labels, key)))} {format_value(value)}'
+
+class Histogram:
+    """Distribution of observed values (e.g. durations) in fixed buckets."""
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._values = {} # Label values -> [per-bucket counts (+Inf last), sum, count]
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observes the duration of the block (also when it raises)."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels):
+        series = self._values.get(tuple(str(labels[name]) for name in self.labels))
+        return series[2] if series is not None else 0
+
+    def samples(self):
+        with self._lock:
+            values = sorted((key, list(counts), total, count) for key, (counts, total, count) in self._values.items())
+        for key, counts, total, count in values:
+            pairs = list(zip(self.labels, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                yield f'{self.name}_bucket{format_labels(pairs + [("le", format_value(bound))])} {cumulative}'
+            yield f'{self.name}_sum{format_labels(pairs)} {format_value(total)}'
+            yield f'{self.name}_count{format_labels(pairs)} {count}'
+
+def render():
+    """All the metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in _registry:
+        lines.append(f'# HELP {metric.name} {metric.documentation}')
+        lines.append(f'# TYPE {metric.name} {metric.type}')
+        lines.extend(metric.samples())
+    return '\n'.join(lines) + '\n'
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ Metrics ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Stages of /api/detect: upload, decode, trim (silence), chroma (first tier of the key cascade), inference (batched forward passes),
+# notes (note events from the model output), key_search, and worker (the
+# inference, notes and key search in a worker process when the pool is enabled)
+DETECT_STAGE_SECONDS = Histogram(
+    'whatkey_detect_stage_seconds', 'Time spent in each stage of the key detection.', ['stage'])
+DETECT_BYTES = Counter(
+    'whatkey_detect_bytes_total', 'Bytes of uploaded audio analyzed (cached results excluded).')
+AUDIO_FRAMES = Counter(
+    'whatkey_audio_frames_total', 'Audio frames at the model rate, decoded and trimmed as silence.', ['kind'])
+DETECT_ERRORS = Counter(
+    'whatkey_detect_errors_total', 'Failed detections, by exception type.', ['type'])
+KEY_TIERS = Counter(
+    'whatkey_key_tier_total', 'Detections of the key cascade answered by each tier (model: escalated, cache: cached result).',
+    ['tier'])
+SCALE_SECONDS = Histogram(
+    'whatkey_scale_seconds', 'Time spent getting the scale data (get_scale) and rendering scores (score_render).',
+    ['operation'])
+HTTP_REQUESTS = Counter(
+    'whatkey_http_requests_total', 'HTTP requests handled, by endpoint, method and status code.',
+    ['endpoint', 'method', 'status'])
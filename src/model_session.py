@@ -0,0 +1,210 @@
+import logging
+import os
+import threading
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Serialized model used by this process (None: basic-pitch's ICASSP 2022 model)
+# basic-pitch itself is only imported when the model is first needed
+MODEL_PATH = None
+
+# Inference runtime: 'tf' (SavedModel), 'tflite', 'onnx', or 'auto' to let
+# basic-pitch pick the first one installed (TensorFlow first)
+BACKENDS = ('tf', 'tflite', 'onnx')
+MODEL_BACKEND = os.environ.get('MODEL_BACKEND', 'auto').lower()
+# Model file of each backend in basic-pitch's saved_models/icassp_2022
+BACKEND_FILES = {'tf': 'nmp', 'tflite': 'nmp.tflite', 'onnx': 'nmp.onnx'}
+
+# CPU threads used by one model instance (0 keeps the library default),
+# overridden per backend by e.g. ONNX_INTRA_OP_THREADS / ONNX_INTER_OP_THREADS.
+# TensorFlow reads its thread counts once, when it starts: load() exports
+# them before the model is loaded, so they only apply to the first TF model
+# of the process
+INTRA_OP_THREADS = int(os.environ.get('INTRA_OP_THREADS', 0))
+INTER_OP_THREADS = int(os.environ.get('INTER_OP_THREADS', 0))
+
+# Resident model shared by every detection request of this process
+_model = None
+_backend = None # Backend of the resident model
+_lock = threading.Lock()
+_ready = threading.Event()
+
+def configure_threads(intra_op=INTRA_OP_THREADS, inter_op=INTER_OP_THREADS):
+    """
+    Sets the CPU thread counts used by the model. Must be called before
+    the model is loaded, e.g. at the start of a worker process.
+
+    Args:
+        intra_op (int): Threads used inside a single operation (0 = default).
+        inter_op (int): Operations run in parallel (0 = default).
+    """
+    global INTRA_OP_THREADS, INTER_OP_THREADS
+    INTRA_OP_THREADS, INTER_OP_THREADS = intra_op, inter_op
+    if intra_op:
+        os.environ['OMP_NUM_THREADS'] = str(intra_op)
+    export_tf_threads(intra_op, inter_op)
+
+def export_tf_threads(intra_op, inter_op):
+    """Sets TensorFlow's thread counts in the environment, where it reads them when it starts."""
+    if intra_op:
+        os.environ['TF_NUM_INTRAOP_THREADS'] = str(intra_op)
+    if inter_op:
+        os.environ['TF_NUM_INTEROP_THREADS'] = str(inter_op)
+
+def thread_settings(backend):
+    """Intra-op and inter-op thread counts of a backend (0 = library default)."""
+    prefix = backend.upper()
+    return (int(os.environ.get(f'{prefix}_INTRA_OP_THREADS', INTRA_OP_THREADS)),
+            int(os.environ.get(f'{prefix}_INTER_OP_THREADS', INTER_OP_THREADS)))
+
+def check_backend(backend):
+    if backend != 'auto' and backend not in BACKENDS:
+        raise ValueError(f"Unknown model backend '{backend}'. Use one of: auto, {', '.join(BACKENDS)}.")
+    return backend
+
+def resolve_path(model_path=MODEL_PATH, backend=None):
+    """Returns the path of the model to load (the default one of the backend when None)."""
+    if model_path is not None:
+        return model_path
+    backend = check_backend(backend or MODEL_BACKEND)
+    if backend == 'auto':
+        from basic_pitch import ICASSP_2022_MODEL_PATH
+        return ICASSP_2022_MODEL_PATH
+    import basic_pitch
+    return os.path.join(os.path.dirname(basic_pitch.__file__), 'saved_models', 'icassp_2022', BACKEND_FILES[backend])
+
+def backend_of(model):
+    """Backend name of a loaded basic-pitch model."""
+    from basic_pitch.inference import Model
+    names = {Model.MODEL_TYPES.TENSORFLOW: 'tf', Model.MODEL_TYPES.TFLITE: 'tflite',
+             Model.MODEL_TYPES.ONNX: 'onnx', Model.MODEL_TYPES.COREML: 'coreml'}
+    return names.get(model.model_type, str(model.model_type))
+
+def open_model(backend, model_path):
+    """
+    Loads a model with the given runtime directly (basic-pitch's Model tries
+    every installed runtime in turn), with the backend's thread settings.
+    """
+    from basic_pitch.inference import Model
+    intra_op, inter_op = thread_settings(backend)
+    model = Model.__new__(Model)
+    if backend == 'onnx':
+        import onnxruntime as ort
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = intra_op
+        options.inter_op_num_threads = inter_op
+        model.model_type = Model.MODEL_TYPES.ONNX
+        model.model = ort.InferenceSession(str(model_path), options, providers=["CPUExecutionProvider"])
+    elif backend == 'tflite':
+        try:
+            import tflite_runtime.interpreter as tflite
+        except ImportError:
+            from tensorflow import lite as tflite
+        model.model_type = Model.MODEL_TYPES.TFLITE
+        model.interpreter = tflite.Interpreter(str(model_path), num_threads=intra_op or None)
+        model.model = model.interpreter.get_signature_runner()
+    else:
+        import tensorflow as tf
+        try:
+            # Only possible before TensorFlow has started its thread pools
+            tf.config.threading.set_intra_op_parallelism_threads(intra_op)
+            tf.config.threading.set_inter_op_parallelism_threads(inter_op)
+        except RuntimeError:
+            pass
+        model.model_type = Model.MODEL_TYPES.TENSORFLOW
+        model.model = tf.saved_model.load(str(model_path))
+    return model
+
+def warm_up(model):
+    """
+    Runs one inference on a synthetic buffer so that graph setup and
+    memory allocation happen before the first real request.
+
+    Args:
+        model (Model): A loaded basic-pitch model.
+    """
+    from basic_pitch.constants import AUDIO_N_SAMPLES, AUDIO_SAMPLE_RATE
+    t = np.arange(AUDIO_N_SAMPLES, dtype=np.float32) / AUDIO_SAMPLE_RATE
+    tone = 0.5 * np.sin(2 * np.pi * 440.0 * t) # A4 sine wave
+    model.predict(tone.reshape(1, AUDIO_N_SAMPLES, 1).astype(np.float32))
+
+def load(model_path=MODEL_PATH, backend=None):
+    """
+    Loads the basic-pitch model once per process and warms it up.
+
+    Args:
+        model_path: Path to a serialized basic-pitch model (None for the default one).
+        backend (str): Runtime to use (MODEL_BACKEND by default).
+
+    Returns:
+        Model: The resident model instance.
+    """
+    global _model, _backend
+    with _lock:
+        if _model is None:
+            backend = check_backend(backend or MODEL_BACKEND)
+            model_path = resolve_path(model_path, backend)
+            if backend in ('auto', 'tf'):
+                # basic-pitch may start TensorFlow: its threads are set before that
+                export_tf_threads(*thread_settings('tf'))
+            if backend == 'auto':
+                from basic_pitch.inference import Model
+                model = Model(model_path)
+                backend = backend_of(model)
+                # Thread settings of TensorFlow go through configure_threads
+                if backend in ('onnx', 'tflite') and any(thread_settings(backend)):
+                    model = open_model(backend, model_path)
+            else:
+                model = open_model(backend, model_path)
+            warm_up(model)
+            intra_op, inter_op = thread_settings(backend)
+            logger.info("Model backend: %s (%s), intra-op threads: %s, inter-op threads: %s",
+                        backend, os.path.basename(str(model_path)), intra_op or 'default', inter_op or 'default')
+            _model, _backend = model, backend
+            _ready.set()
+    return _model
+
+def preload(model_path=MODEL_PATH):
+    """Loads the model in a background thread so startup is not blocked."""
+    thread = threading.Thread(target=load, args=(model_path,), name='model-preload', daemon=True)
+    thread.start()
+    return thread
+
+def get_backend():
+    """Backend of the resident model (None until it is loaded)."""
+    return _backend
+
+def fingerprint(model_path=MODEL_PATH):
+    """
+    Identifies the serialized model from the names, sizes and modification
+    times of its files, without loading it.
+    """
+    model_path = str(resolve_path(model_path))
+    if os.path.isdir(model_path):
+        paths = sorted(os.path.join(root, name)
+                       for root, _, names in os.walk(model_path) for name in names)
+    else:
+        paths = [model_path]
+    parts = []
+    for path in paths:
+        st = os.stat(path)
+        parts.append(f'{os.path.relpath(path, os.path.dirname(model_path))}:{st.st_size}:{int(st.st_mtime)}')
+    return '|'.join(parts)
+
+def get_model():
+    """Returns the resident model, loading it on first use if needed."""
+    if _ready.is_set():
+        return _model
+    return load()
+
+def is_ready():
+    """True only once the model is loaded and the warm-up has finished."""
+    return _ready.is_set()
+
+def reset():
+    """Drops the resident model (used by tests and model reloads)."""
+    global _model, _backend
+    with _lock:
+        _model = _backend = None
+        _ready.clear()
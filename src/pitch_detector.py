@@ -1,9 +1,30 @@
 # src/pitch_detector.py
-from basic_pitch.inference import predict
-from basic_pitch import ICASSP_2022_MODEL_PATH
+import os
+import librosa
+import numpy as np
+from basic_pitch import note_creation as infer
+from basic_pitch.inference import window_audio_file, unwrap_output
+from basic_pitch.constants import AUDIO_N_SAMPLES, AUDIO_SAMPLE_RATE, FFT_HOP
+from src.batching import get_scheduler
+from src import key_profiles
+from src import metrics
+from src import tracing
 from collections import Counter
-from itertools import combinations
-debug = True
+
+# Bump when the detection logic changes (invalidates cached results)
+DETECTION_VERSION = '3'
+
+# Key-finding engines: the original chord heuristic or the key profiles
+ENGINES = ('heuristic', 'profile')
+DETECTION_ENGINE = os.environ.get('DETECTION_ENGINE', 'heuristic')
+
+# What the engines read from the model: 'notes' (note events, as basic_pitch's
+# predict) or 'posteriors' (pitch energy read straight from the posteriorgrams,
+# without the note tracking and MIDI construction)
+KEY_SOURCES = ('notes', 'posteriors')
+KEY_SOURCE = os.environ.get('KEY_SOURCE', 'notes').lower()
+# Also count the onset posteriorgram in the pitch energy (struck notes weigh more)
+POSTERIOR_ONSETS = os.environ.get('POSTERIOR_ONSETS', '0') != '0'
 
 # Mapping from pitch class numbers to note names
 PITCH_CLASSES = ["C", "C#", "D", "D#", "E", "F", 
@@ -18,124 +39,362 @@ def find_common_notes(midi_notes, k):
     # Get the top k most common notes
     top_k_notes = note_counts.most_common(k)
 
-    results = []
-    if debug: print(f"The {k} most common notes are:")
-    for note_midi, count in top_k_notes:
-        # Convert MIDI number to pitch class
-        pitch_class_number = note_midi % 12
-        pitch_class_name = PITCH_CLASSES[pitch_class_number]
-        
-        results.append(note_midi)
-        if debug: print(f"  - Note: {pitch_class_name} (MIDI: {note_midi}) | Frequency: {count} times")
-
+    results = [note_midi for note_midi, _ in top_k_notes]
+    if tracing.enabled(tracing.DEBUG):
+        # Pitch class name, MIDI number and frequency of each note
+        tracing.event(f"The {k} most common notes", level=tracing.DEBUG,
+                      notes=[(PITCH_CLASSES[note_midi % 12], note_midi, count) for note_midi, count in top_k_notes])
     return results
 
+# Interval structure of the chords recognized by the template matcher
+TRIAD_QUALITIES = (('Major', (0, 4, 7)), ('Minor', (0, 3, 7)), ('Diminished', (0, 3, 6)))
+THIRD_QUALITIES = (('Major', (0, 4)), ('Minor', (0, 3)))
+# Only major and minor chords point to a key
+KEY_QUALITIES = ('Major', 'Minor')
+
+def pitch_class_mask(notes):
+    """Reduces MIDI notes to a 12-bit pitch-class set (bit i = pitch class i)."""
+    mask = 0
+    for note in notes:
+        mask |= 1 << (note % 12)
+    return mask
+
+def build_templates(qualities):
+    """
+    Precomputes the bitmask of every chord of the given qualities on all 12 roots.
+
+    Returns:
+        list: (mask, name, quality, pitch_classes) tuples.
+    """
+    templates = []
+    for root in range(12):
+        for quality, steps in qualities:
+            pitch_classes = tuple((root + step) % 12 for step in steps)
+            templates.append((pitch_class_mask(pitch_classes), f"{PITCH_CLASSES[root]} {quality}",
+                              quality, pitch_classes))
+    return templates
+
+TRIAD_TEMPLATES = build_templates(TRIAD_QUALITIES)
+THIRD_TEMPLATES = build_templates(THIRD_QUALITIES)
+TRIAD_NAMES = {mask: name for mask, name, _, _ in TRIAD_TEMPLATES}
+THIRD_NAMES = {mask: name for mask, name, _, _ in THIRD_TEMPLATES}
+
 def find_chord_from_notes(notes, just_thirds=False):
     """
-    Identifies a major or minor chord from a list of notes.
+    Identifies a major, minor or diminished triad (or a major/minor third)
+    from a list of notes, in any inversion or octave spread.
 
     Args:
-        notes (list): A list of three MIDI numbers.
+        notes (list): A list of MIDI numbers.
+        just_thirds (bool): Look for thirds instead of triads.
 
     Returns:
-        str: The name of the chord if a match is found, otherwise "No match".
+        str: The name of the chord if a match is found, otherwise None.
     """
-    # Sort notes for consistent interval calculation
-    notes.sort()
-    
-    root_note = notes[0]
-    second_note = notes[1]
-
-    # Calculate intervals in half-steps (semitones)
-    interval_1 = second_note - root_note
-    if not just_thirds: 
-        third_note = notes[2]
-        interval_2 = third_note - second_note
-
-        # Check for a major chord (4, 3)
-        if interval_1 == 4 and interval_2 == 3:
-            return f"{get_pitch_class_name(root_note)} Major"
-
-        # Check for a minor chord (3, 4)
-        if interval_1 == 3 and interval_2 == 4:
-            return f"{get_pitch_class_name(root_note)} Minor"
-    else:
-        # Check for a major chord (4, 3)
-        if interval_1 == 4:
-            return f"{get_pitch_class_name(root_note)} Major"
-
-        # Check for a minor chord (3, 4)
-        if interval_1 == 3:
-            return f"{get_pitch_class_name(root_note)} Minor"
-        
-        return None
+    names = THIRD_NAMES if just_thirds else TRIAD_NAMES
+    return names.get(pitch_class_mask(notes))
 
 def get_pitch_class_name(midi_num):
     """Converts a MIDI number to its pitch class name."""
     return PITCH_CLASSES[midi_num % 12]
 
+def match_templates(common_notes, templates):
+    """
+    Finds every key-defining chord contained in the pitch-class set of the notes.
+    Each template costs a constant number of integer operations.
+
+    Returns:
+        list: Chord names, ordered by the frequency rank of their notes.
+    """
+    mask = pitch_class_mask(common_notes)
+    # Best (lowest) frequency rank of each pitch class
+    ranks = {}
+    for rank, note in enumerate(common_notes):
+        ranks.setdefault(note % 12, rank)
+
+    found = []
+    for template, name, quality, pitch_classes in templates:
+        if mask & template == template and quality in KEY_QUALITIES:
+            found.append((sorted(ranks[pc] for pc in pitch_classes), name))
+    return [name for _, name in sorted(found)]
+
 def detect_pitch(midi_data, k):
     common_notes = find_common_notes(midi_data, k)
 
     # Try to find triads
-    found_chords = []
-    chord_options = list(combinations(common_notes, 3))
-    for chord in chord_options:
-        found = find_chord_from_notes(list(chord))
-        if found:
-            if debug: print('Chord detected:', found)
-            found_chords.append(found)
+    found_chords = match_templates(common_notes, TRIAD_TEMPLATES)
     if found_chords:
+        tracing.event('Chords detected', level=tracing.DEBUG, chords=found_chords)
         return True, found_chords
     
     # Try to find thirds
-    found_thirds = []
-    thirds_options = list(combinations(common_notes, 2))
-    for third in thirds_options:
-        found = find_chord_from_notes(list(third), just_thirds=True)
-        if found:
-            if debug: print('Third detected:', found)
-            found_thirds.append(found)
+    found_thirds = match_templates(common_notes, THIRD_TEMPLATES)
     if found_thirds:
+        tracing.event('Thirds detected', level=tracing.DEBUG, thirds=found_thirds)
         return True, found_thirds
     
-    if debug: print("No tonality detected.")
+    tracing.event('No tonality detected', level=tracing.DEBUG)
     if common_notes:
-        if debug: print("Assuming most repeated note is the root.")
+        tracing.event('Assuming most repeated note is the root', level=tracing.DEBUG)
         return False, get_pitch_class_name(common_notes[0])
     
     return False, None
 
+# Same windowing and post-processing settings as basic_pitch.inference.predict
+N_OVERLAPPING_FRAMES = 30
+OVERLAP_LEN = N_OVERLAPPING_FRAMES * FFT_HOP
+HOP_SIZE = AUDIO_N_SAMPLES - OVERLAP_LEN
+MIN_NOTE_LEN = int(np.round(127.70 / 1000 * (AUDIO_SAMPLE_RATE / FFT_HOP)))
+ONSET_THRESH = 0.5
+FRAME_THRESH = 0.3
+
+def load_audio(audio_file_path):
+    """Decodes an audio file as a mono float32 array at the model's sample rate."""
+    audio, _ = librosa.load(str(audio_file_path), sr=AUDIO_SAMPLE_RATE, mono=True)
+    return audio
+
+def predict(audio, outputs=('note', 'onset', 'contour')):
+    """
+    Runs the resident model on mono audio (at the model's sample rate).
+
+    The audio windows are sent to the batch scheduler, so concurrent
+    requests share the same forward passes.
+
+    Args:
+        outputs (tuple): Posteriorgrams to unwrap from the model windows.
+
+    Returns:
+        dict: Posteriorgrams of shape (n_frames, n_bins), as basic_pitch's model_output.
+    """
+    audio_original_length = audio.shape[0]
+    padded = np.concatenate([np.zeros((OVERLAP_LEN // 2,), dtype=np.float32), audio])
+    windows = np.stack([window for window, _ in window_audio_file(padded, HOP_SIZE)])
+    with metrics.DETECT_STAGE_SECONDS.time(stage='inference'), tracing.span('inference', windows=len(windows)):
+        output = get_scheduler().submit(windows)
+    return {k: unwrap_output(output[k], audio_original_length, N_OVERLAPPING_FRAMES) for k in outputs}
+
+def transcribe(audio):
+    """
+    Transcribes mono audio (at the model's sample rate) with the resident model.
+
+    Returns:
+        tuple: model_output, midi_data and note_events (as basic_pitch's predict).
+    """
+    model_output = predict(audio)
+    with metrics.DETECT_STAGE_SECONDS.time(stage='notes'), tracing.span('notes') as span:
+        midi_data, note_events = track_notes(model_output)
+        span.set(notes=len(note_events))
+    return model_output, midi_data, note_events
+
+def track_notes(model_output):
+    """Note tracking and MIDI construction of basic_pitch's predict. Returns (midi_data, note_events)."""
+    return infer.model_output_to_notes(
+        model_output,
+        onset_thresh=ONSET_THRESH,
+        frame_thresh=FRAME_THRESH,
+        min_note_len=MIN_NOTE_LEN,
+        melodia_trick=True,
+        midi_tempo=120,
+    )
+
+def pitch_energy(model_output, onsets=POSTERIOR_ONSETS):
+    """
+    Energy of each of the 88 piano pitches: the sum over time of the note
+    posteriorgram where it is above the note tracking threshold.
+
+    Args:
+        model_output (dict): Posteriorgrams from predict.
+        onsets (bool): Also add the onset posteriorgram above the onset threshold.
+
+    Returns:
+        np.ndarray: Energies of MIDI pitches infer.MIDI_OFFSET (A0) to 108 (C8).
+    """
+    frames = model_output['note']
+    energy = np.where(frames >= FRAME_THRESH, frames, 0).sum(axis=0, dtype=np.float64)
+    if onsets:
+        onset = model_output['onset']
+        energy += np.where(onset >= ONSET_THRESH, onset, 0).sum(axis=0, dtype=np.float64)
+    return energy
+
+def energy_ranking(energy, n=None):
+    """MIDI pitches with some energy, most energetic first (lowest pitch first on ties)."""
+    order = np.argsort(-energy, kind='stable')[:n]
+    return [int(i) + infer.MIDI_OFFSET for i in order if energy[i] > 0]
+
+def pitch_class_energy(energy):
+    """Folds the pitch energies into the 12 pitch classes, C to B."""
+    pitch_classes = (np.arange(len(energy)) + infer.MIDI_OFFSET) % 12
+    return np.bincount(pitch_classes, weights=energy, minlength=12)
+
+def predict_energy(audio):
+    """Pitch energies of mono audio, from the model alone (no note events)."""
+    model_output = predict(audio, outputs=('note', 'onset') if POSTERIOR_ONSETS else ('note',))
+    return pitch_energy(model_output)
+
 def run(audio_file_path):
-    # Make the prediction
-    model_output, midi_data, note_events = predict(audio_file_path, ICASSP_2022_MODEL_PATH)
-    #if debug: print(note_events)
+    """Detects the key of an audio file. Returns (pitch, mode)."""
+    return run_audio(load_audio(audio_file_path))
+
+def run_audio(audio):
+    """Detects the key of mono audio at the model's sample rate. Returns (pitch, mode)."""
+    if KEY_SOURCE == 'posteriors':
+        energy = predict_energy(audio)
+        with metrics.DETECT_STAGE_SECONDS.time(stage='key_search'), tracing.span('key_search'):
+            return key_from_ranking(energy_ranking(energy, MAX_COMMON_NOTES))
+
+    # Make the prediction with the resident model (loaded once per process)
+    model_output, midi_data, note_events = transcribe(audio)
     # midi_data: The transcribed MIDI file.
     # note_events: A list of note events (frequency, start, end, etc.).
 
     # Extract MIDI notes from the list
     midi_notes = [event[2] for event in note_events]
-    # Count the frequency of each note
-    note_counts = Counter(midi_notes)
-    # Get the most common note
-    most_common_notes = note_counts.most_common(1)
-
-    if debug: print(most_common_notes)
-    # Result: [(76, 5)] -> Note 76 was repeated 5 times.
-
-    print()
-    detected_pitch = []
-    k = 3 # Start with the 3 most common notes
-    while not detected_pitch and k <= 10:
-        print(f"Trying detection for k = {k}")
-        is_detected, detected_pitch = detect_pitch(midi_notes, k)
-        k += 1 # Increment k until there's a match
-        if not is_detected:
-            detected_pitch = []
+    with metrics.DETECT_STAGE_SECONDS.time(stage='key_search'), tracing.span('key_search'):
+        return detect_key(midi_notes)
+
+def rank_audio(audio):
+    """
+    Detects the key of mono audio with the key-profile engine.
+
+    Returns:
+        tuple: (pitch, mode, ranked) with all 24 keys ranked by confidence.
+    """
+    if KEY_SOURCE == 'posteriors':
+        energy = predict_energy(audio)
+        with metrics.DETECT_STAGE_SECONDS.time(stage='key_search'), tracing.span('key_search'):
+            return key_profiles.detect_key_from_vector(pitch_class_energy(energy))
+
+    model_output, midi_data, note_events = transcribe(audio)
+    with metrics.DETECT_STAGE_SECONDS.time(stage='key_search'), tracing.span('key_search'):
+        return key_profiles.detect_key(note_events)
+
+# Range of most common notes tried by detect_key
+MIN_COMMON_NOTES = 3
+MAX_COMMON_NOTES = 10
+
+def index_templates(templates):
+    """Groups the key-defining templates by the pitch classes they contain."""
+    by_pitch_class = [[] for _ in range(12)]
+    for template in templates:
+        if template[2] in KEY_QUALITIES:
+            for pitch_class in template[3]:
+                by_pitch_class[pitch_class].append(template)
+    return by_pitch_class
+
+TRIADS_BY_PITCH_CLASS = index_templates(TRIAD_TEMPLATES)
+THIRDS_BY_PITCH_CLASS = index_templates(THIRD_TEMPLATES)
+
+def detect_key(midi_notes):
+    """
+    Finds the key from a list of transcribed MIDI notes. Returns (pitch, mode).
+
+    Same result as calling detect_pitch for k = 3 to 10 until a chord is
+    found, in a single pass: the histogram is built once and, at each k,
+    only the chords containing the newly added pitch class are tested
+    (all the others were already rejected at a smaller k).
+    """
+    return key_from_ranking([note for note, _ in Counter(midi_notes).most_common(MAX_COMMON_NOTES)])
+
+def key_from_ranking(ranking):
+    """
+    Finds the key from MIDI notes ranked by importance (at most
+    MAX_COMMON_NOTES, most common first). Returns (pitch, mode).
+    """
+    mask = 0
+    ranks = {} # Best (lowest) frequency rank of each pitch class
+    new_pitch_classes = []
+    for k, note in enumerate(ranking, 1):
+        pitch_class = note % 12
+        if pitch_class not in ranks:
+            ranks[pitch_class] = k - 1
+            mask |= 1 << pitch_class
+            new_pitch_classes.append(pitch_class)
+        # Fewer distinct notes than MIN_COMMON_NOTES are tested all at once
+        if (k < MIN_COMMON_NOTES and k < len(ranking)) or not new_pitch_classes:
+            continue
+
+        for kind, by_pitch_class in (('Chords', TRIADS_BY_PITCH_CLASS), ('Thirds', THIRDS_BY_PITCH_CLASS)):
+            found = {}
+            for new_pitch_class in new_pitch_classes:
+                for template, name, _, pitch_classes in by_pitch_class[new_pitch_class]:
+                    if mask & template == template:
+                        found[name] = sorted(ranks[pc] for pc in pitch_classes)
+            if found:
+                tracing.event(f'{kind} detected', level=tracing.DEBUG, k=k, common_notes=ranking[:k], found=sorted(found))
+                return min(found, key=lambda name: (found[name], name)).split(' ')
+        new_pitch_classes = []
+
+    tracing.event('No tonality detected', level=tracing.DEBUG, common_notes=ranking)
+    return None, None
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ Streaming mode ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Analysis window and early termination settings
+STREAM_WINDOW_SECONDS = float(os.environ.get('STREAM_WINDOW_SECONDS', 5))
+STREAM_STABLE_WINDOWS = int(os.environ.get('STREAM_STABLE_WINDOWS', 3))
+STREAM_MARGIN_TOLERANCE = float(os.environ.get('STREAM_MARGIN_TOLERANCE', 0.02))
+
+MAJOR_STEPS = [0, 2, 4, 5, 7, 9, 11]
+MINOR_STEPS = [0, 2, 3, 5, 7, 8, 10]
+
+def score_keys(pitch_class_counts):
+    """
+    Scores the 24 major/minor keys against a pitch-class histogram: share
+    of the notes inside the scale plus share inside the tonic triad.
+
+    Args:
+        pitch_class_counts (list): 12 note counts, C to B.
+
+    Returns:
+        list: (score, pitch, mode) tuples, best key first.
+    """
+    total = sum(pitch_class_counts) or 1
+    scores = []
+    for root in range(12):
+        for mode, steps, third in (('Major', MAJOR_STEPS, 4), ('Minor', MINOR_STEPS, 3)):
+            in_scale = sum(pitch_class_counts[(root + step) % 12] for step in steps)
+            in_triad = sum(pitch_class_counts[(root + step) % 12] for step in (0, third, 7))
+            scores.append(((in_scale + in_triad) / (2 * total), PITCH_CLASSES[root], mode))
+    return sorted(scores, reverse=True)
+
+def run_streaming(blocks, stable_windows=STREAM_STABLE_WINDOWS, tolerance=STREAM_MARGIN_TOLERANCE):
+    """
+    Detects the key window by window, stopping as soon as the leading key
+    and its margin over the runner-up have been stable for a few windows.
+
+    Args:
+        blocks: Iterable of mono audio windows at the model's sample rate.
+        stable_windows (int): Consecutive stable windows needed to stop.
+        tolerance (float): Maximum margin change for a window to count as stable.
+
+    Returns:
+        tuple: (pitch, mode, analyzed_seconds)
+    """
+    midi_notes = []
+    pitch_class_counts = [0] * 12
+    analyzed = 0
+    leader, margin, stable = None, None, 0
+    for block in blocks:
+        analyzed += len(block)
+        _, _, note_events = transcribe(block)
+        for event in note_events:
+            midi_notes.append(event[2])
+            pitch_class_counts[event[2] % 12] += 1
+        if not midi_notes:
+            continue
+
+        ranked = score_keys(pitch_class_counts)
+        new_leader = ranked[0][1:]
+        new_margin = ranked[0][0] - ranked[1][0]
+        if new_leader == leader and abs(new_margin - margin) <= tolerance:
+            stable += 1
         else:
-            print(detected_pitch)
-            
-    return detected_pitch[0].split(' ') if detected_pitch else (None, None)
+            stable = 0
+        leader, margin = new_leader, new_margin
+        if stable >= stable_windows:
+            break
+
+    pitch, mode = detect_key(midi_notes)
+    return pitch, mode, analyzed / AUDIO_SAMPLE_RATE
 
 def show(list_values):
     for value in list_values:
@@ -0,0 +1,192 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+# Cache settings (can be overridden through environment variables)
+RESULT_CACHE_SIZE = int(os.environ.get('RESULT_CACHE_SIZE', 1024)) # results kept in memory
+RESULT_CACHE_DIR = os.environ.get('RESULT_CACHE_DIR') # on-disk tier, disabled when unset
+RESULT_CACHE_DISK_BYTES = int(os.environ.get('RESULT_CACHE_DISK_BYTES', 50 * 1024 * 1024))
+
+def hash_bytes(chunks):
+    """Returns the SHA-256 hex digest of an iterable of byte chunks."""
+    digest = hashlib.sha256()
+    for chunk in chunks:
+        digest.update(chunk)
+    return digest.hexdigest()
+
+class ResultCache:
+    """
+    Two-tier cache of detection results keyed by the hash of the uploaded
+    bytes: an in-memory LRU and an optional on-disk tier that survives restarts.
+    Every key includes the version, so results from another model or
+    detection logic are never returned.
+    """
+    def __init__(self, version, max_items=RESULT_CACHE_SIZE, disk_dir=RESULT_CACHE_DIR,
+                 disk_max_bytes=RESULT_CACHE_DISK_BYTES):
+        """
+        Args:
+            version (str): Fingerprint of the model and detection logic.
+            max_items (int): Maximum number of results kept in memory.
+            disk_dir (str): Directory of the on-disk tier (None to disable it).
+            disk_max_bytes (int): Maximum size of the on-disk tier.
+        """
+        self.version = version
+        self.max_items = max_items
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'memory_hits': 0, 'disk_hits': 0, 'misses': 0,
+                       'memory_evictions': 0, 'disk_evictions': 0}
+        if disk_dir:
+            self._open_disk()
+
+    def key(self, content_hash):
+        """Cache key of an upload for the current version."""
+        return hashlib.sha256(f'{self.version}:{content_hash}'.encode()).hexdigest()
+
+    def get(self, content_hash):
+        """Returns the cached result for an upload hash, or None."""
+        key = self.key(content_hash)
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self._stats['hits'] += 1
+                self._stats['memory_hits'] += 1
+                return self._memory[key]
+        result = self._disk_get(key)
+        with self._lock:
+            if result is None:
+                self._stats['misses'] += 1
+                return None
+            self._stats['hits'] += 1
+            self._stats['disk_hits'] += 1
+            self._memory_put(key, result)
+        return result
+
+    def put(self, content_hash, result):
+        """Stores the result of an upload in both tiers."""
+        key = self.key(content_hash)
+        with self._lock:
+            self._memory_put(key, result)
+        self._disk_put(key, result)
+
+    def clear(self):
+        """Drops every cached result."""
+        with self._lock:
+            self._memory.clear()
+        if self.disk_dir:
+            for name in os.listdir(self.disk_dir):
+                if name.endswith('.json'):
+                    os.remove(os.path.join(self.disk_dir, name))
+
+    def stats(self):
+        """Returns a snapshot of the hit/miss/eviction counters."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['memory_items'] = len(self._memory)
+        stats['version'] = self.version
+        return stats
+
+    def _memory_put(self, key, result):
+        self._memory[key] = result
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_items:
+            self._memory.popitem(last=False)
+            self._stats['memory_evictions'] += 1
+
+    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ Disk tier ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    def _open_disk(self):
+        # Entries of another model or detection version are wiped at startup
+        os.makedirs(self.disk_dir, exist_ok=True)
+        version_path = os.path.join(self.disk_dir, 'VERSION')
+        stored = None
+        if os.path.exists(version_path):
+            with open(version_path) as f:
+                stored = f.read().strip()
+        if stored != self.version:
+            self.clear()
+            with open(version_path, 'w') as f:
+                f.write(self.version)
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f'{key}.json')
+
+    def _disk_get(self, key):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path) as f:
+                result = json.load(f)
+            os.utime(path) # Refresh for the LRU eviction
+            return result
+        except (OSError, ValueError):
+            return None
+
+    def _disk_put(self, key, result):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        temp_path = f'{path}.{threading.get_ident()}.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(result, f)
+        os.replace(temp_path, path) # Atomic, so readers never see partial files
+        self._disk_evict()
+
+    def _disk_evict(self):
+        # Removes the least recently used files until the tier fits its size
+        entries = []
+        for name in os.listdir(self.disk_dir):
+            if name.endswith('.json'):
+                try:
+                    st = os.stat(os.path.join(self.disk_dir, name))
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.disk_max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.disk_dir, name))
+            except OSError:
+                continue
+            total -= size
+            with self._lock:
+                self._stats['disk_evictions'] += 1
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def detection_version():
+    """Hash of everything a detection result depends on: model, detection code and settings."""
+    from src import audio_io, chroma, key_profiles, model_session, pitch_detector
+    # Any change to the model files or the detection code gives a new version
+    sources = []
+    for module in (pitch_detector, key_profiles, chroma, audio_io):
+        with open(module.__file__, 'rb') as f:
+            sources.append(f.read())
+    return hash_bytes([
+        model_session.fingerprint().encode(),
+        pitch_detector.DETECTION_VERSION.encode(),
+        f'{pitch_detector.KEY_SOURCE}:{pitch_detector.POSTERIOR_ONSETS}'.encode(),
+        f'{chroma.KEY_CASCADE}:{chroma.CHROMA_MIN_CONFIDENCE}'.encode(),
+        # Windowing of the streaming mode (its results are cached under the ':stream' suffix)
+        f'{pitch_detector.STREAM_WINDOW_SECONDS}:{pitch_detector.STREAM_STABLE_WINDOWS}:'
+        f'{pitch_detector.STREAM_MARGIN_TOLERANCE}'.encode(),
+        # Trimming changes the audio the model sees
+        f'{audio_io.TRIM_SILENCE}:{audio_io.SILENCE_TOP_DB}:{audio_io.SILENCE_MIN_SECONDS}:'
+        f'{audio_io.SILENCE_KEEP_SECONDS}'.encode(),
+        *sources,
+    ])
+
+def get_cache():
+    """Returns the process-wide result cache for the current model and detection logic."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResultCache(detection_version())
+    return _cache
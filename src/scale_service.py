@@ -0,0 +1,116 @@
+import hashlib
+import json
+import os
+import threading
+from types import MappingProxyType
+from src.utils import Scale, SCALE_RESPONSES, get_url
+from src import metrics, tracing
+
+# Scale data is served in-process by default. Set SCALE_API_URL (e.g.
+# http://scales.internal:5000/api/) to fetch it from a remote instance instead
+SCALE_API_URL = os.environ.get('SCALE_API_URL')
+SCALE_API_TIMEOUT = float(os.environ.get('SCALE_API_TIMEOUT', 2)) # seconds, connect and read
+SCALE_API_POOL_SIZE = int(os.environ.get('SCALE_API_POOL_SIZE', 10)) # kept-alive connections
+
+# Strong ETag of each pre-encoded response, and version of the whole scales table
+SCALE_ETAGS = MappingProxyType({
+    name: hashlib.sha256(body).hexdigest()[:32] for name, body in SCALE_RESPONSES.items()
+})
+SCALES_VERSION = hashlib.sha256(
+    ''.join(f'{name}:{etag}' for name, etag in sorted(SCALE_ETAGS.items())).encode()).hexdigest()[:32]
+
+def key_query(key_name, is_minor=False):
+    """Adds or removes the minor 'm' suffix of a key name to match the mode."""
+    if key_name.endswith('m'):
+        if not is_minor:
+            key_name = key_name[:-1]
+    else:
+        if is_minor: key_name += 'm' # Adjusts for minor scale
+    return key_name
+
+def get_scale_body(key_name):
+    """Returns the pre-encoded JSON body of a key name (e.g. 'c-sharpm'), or None."""
+    return SCALE_RESPONSES.get(key_name.lower())
+
+def get_scale_etag(key_name):
+    """Returns the ETag (unquoted) of the /api/scale response of a key name, or None."""
+    return SCALE_ETAGS.get(key_name.lower())
+
+def encode_scales(key_names):
+    """Joins the pre-encoded bodies of valid key names into one JSON object keyed by name."""
+    items = [json.dumps(name).encode() + b':' + get_scale_body(name).rstrip(b'\n') for name in key_names]
+    return b'{' + b','.join(items) + b'}\n'
+
+# URL names of the 24 keys (majors, then minors), and their response precomputed once
+SCALE_NAMES = tuple(get_url(name) + suffix for suffix in ('', 'm') for name in Scale._api_mapping)
+ALL_SCALES_BODY = encode_scales(SCALE_NAMES)
+ALL_SCALES_ETAG = hashlib.sha256(ALL_SCALES_BODY).hexdigest()[:32]
+
+def get_scales_etag(key_names=None):
+    """ETag (unquoted) of the bulk response of valid key names (None for all the keys)."""
+    if key_names is None:
+        return ALL_SCALES_ETAG
+    tags = ','.join(f'{name}:{get_scale_etag(name)}' for name in key_names)
+    return hashlib.sha256(tags.encode()).hexdigest()[:32]
+
+def get_scales_body(key_names=None):
+    """JSON body of the bulk response of valid key names (None for all the keys)."""
+    if key_names is None:
+        return ALL_SCALES_BODY
+    return encode_scales(key_names)
+
+def get_scale(key_name, is_minor=False):
+    """
+    Returns the scale, chords and relative key of a key, as served by /api/scale.
+
+    Args:
+        key_name (str): The name of the musical key (e.g., 'c-sharp').
+        is_minor (bool): Whether the minor scale is requested.
+
+    Returns:
+        dict: The scale data, or None if the key is unknown (or the remote call fails).
+    """
+    key_name = key_query(key_name, is_minor)
+    with metrics.SCALE_SECONDS.time(operation='get_scale'), tracing.span('get_scale', key=key_name):
+        if SCALE_API_URL:
+            return fetch_scale(key_name)
+        if get_scale_body(key_name) is None:
+            return None
+        return Scale(key_name).to_dict()
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ Remote mode ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+_session = None
+_session_lock = threading.Lock()
+
+def get_session():
+    """Returns the process-wide HTTP session, which reuses its connections."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=SCALE_API_POOL_SIZE)
+            _session.mount('http://', adapter)
+            _session.mount('https://', adapter)
+    return _session
+
+def fetch_scale(key_name, api_url=None):
+    """
+    Gets the scale data of a key from a remote instance of the API.
+
+    Returns:
+        dict: The JSON data from the API response, or None if an error occurs.
+    """
+    import requests
+    url = f"{(api_url or SCALE_API_URL).rstrip('/')}/scale/{key_name}"
+    try:
+        response = get_session().get(url, timeout=SCALE_API_TIMEOUT)
+        response.raise_for_status()
+        return response.json()
+    except requests.exceptions.RequestException as e:
+        print(f"Error when making the request: {e}")
+        return None
+    except json.JSONDecodeError:
+        print("Error decoding JSON from the response.")
+        return None
@@ -1,5 +1,5 @@
 # src/scales_generator.py
-musical_info = {}
+from types import MappingProxyType
 
 # Definition of the 12 notes
 # We represent them as flats and sharps to handle both notations
@@ -103,6 +103,7 @@ def show_scales(scales):
 
 def run():
     # Generate the complete dictionary
+    musical_info = {}
     for note in notes:
         # Generate scales
         major_scale = generate_scale(note, intervals_major)
@@ -136,6 +137,17 @@ def run():
         }
     return musical_info
 
+def freeze(value):
+    """Recursively turns dicts into read-only mappings and lists into tuples."""
+    if isinstance(value, dict):
+        return MappingProxyType({k: freeze(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return tuple(freeze(v) for v in value)
+    return value
+
+# The complete table, generated once at import and shared read-only by all threads
+SCALES = freeze(run())
+
 if __name__=='__main__':
     scales = run()
     #show_scales(scales)
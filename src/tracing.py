@@ -0,0 +1,159 @@
+# src/tracing.py
+"""
+Request-scoped tracing: each sampled request is written as one JSON line
+with its request id, duration, attributes and the timed spans and events
+recorded while it was handled.
+
+Requests that are not sampled carry no trace, and span(), event() and
+annotate() then return at once. Debug events are only recorded for
+requests traced at the debug level, e.g. with the 'X-Trace: debug' header.
+"""
+import json
+import logging
+import os
+import random
+import time
+import uuid
+from contextvars import ContextVar
+
+# Trace levels: 'off', 'info' (request spans) or 'debug' (also the detection details)
+OFF, INFO, DEBUG = 0, 1, 2
+LEVELS = {'off': OFF, 'info': INFO, 'debug': DEBUG}
+TRACE_LEVEL = LEVELS.get(os.environ.get('TRACE_LEVEL', 'info').lower(), INFO)
+# Fraction of the requests traced, none by default (a request can still ask for it with X-Trace)
+TRACE_SAMPLE_RATE = float(os.environ.get('TRACE_SAMPLE_RATE', 0))
+
+# Traces are logged at INFO: the app's logging configuration decides where they go
+logger = logging.getLogger(__name__)
+
+_current = ContextVar('trace', default=None) # (Trace, innermost open Span) of this request
+
+class Trace:
+    """Spans and events of one request."""
+    def __init__(self, name, request_id, level):
+        self.name = name
+        self.request_id = request_id
+        self.level = level
+        self.started = time.perf_counter()
+        self.attributes = {}
+        self.spans = []
+        self.events = []
+
+    def elapsed_ms(self):
+        return round((time.perf_counter() - self.started) * 1000, 3)
+
+    def to_dict(self):
+        return {
+            'trace': self.name,
+            'request_id': self.request_id,
+            'duration_ms': self.elapsed_ms(),
+            **self.attributes,
+            'spans': self.spans,
+            'events': self.events,
+        }
+
+class Span:
+    """A timed step of a traced request (use as a context manager)."""
+    def __init__(self, trace, name, attributes):
+        self.trace = trace
+        self.name = name
+        self.attributes = attributes
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def __enter__(self):
+        self._token = _current.set((self.trace, self))
+        self._parent = self._token.old_value[1] if self._token.old_value else None
+        self.start_ms = self.trace.elapsed_ms()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _current.reset(self._token)
+        record = {'name': self.name, 'start_ms': self.start_ms,
+                  'duration_ms': round(self.trace.elapsed_ms() - self.start_ms, 3), **self.attributes}
+        if self._parent is not None:
+            record['parent'] = self._parent.name
+        if exc_type is not None:
+            record['error'] = exc_type.__name__
+        self.trace.spans.append(record)
+        return False
+
+class _NullSpan:
+    """Stand-in span of the requests that are not traced."""
+    def set(self, **attributes):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+NULL_SPAN = _NullSpan()
+
+def start_trace(name, request_id=None, level=None):
+    """
+    Starts the trace of a request, if it is sampled.
+
+    Args:
+        name (str): What is traced (e.g. 'GET /api/scale/<key_name>').
+        request_id (str): Id logged with the trace (a new one by default).
+        level (int): Level asked for this request (e.g. DEBUG for the
+            X-Trace header), which bypasses the sampling.
+
+    Returns:
+        Trace: The trace, or None when the request is not traced.
+    """
+    if TRACE_LEVEL == OFF:
+        return None
+    if level is None:
+        if random.random() >= TRACE_SAMPLE_RATE:
+            return None
+        level = TRACE_LEVEL
+    trace = Trace(name, request_id or uuid.uuid4().hex, level)
+    _current.set((trace, None))
+    return trace
+
+def end_trace():
+    """Writes the trace of the current request, if any, and closes it."""
+    current = _current.get()
+    if current is None:
+        return
+    _current.set(None)
+    logger.info(json.dumps(current[0].to_dict(), default=str))
+
+def current_trace():
+    current = _current.get()
+    return current[0] if current is not None else None
+
+def enabled(level=DEBUG):
+    """True when the current request is traced at this level (guards costly attributes)."""
+    current = _current.get()
+    return current is not None and current[0].level >= level
+
+def span(name, **attributes):
+    """Times a step of the current request. Does nothing when it is not traced."""
+    current = _current.get()
+    if current is None:
+        return NULL_SPAN
+    return Span(current[0], name, attributes)
+
+def event(message, level=INFO, **attributes):
+    """Records a point-in-time event in the current span."""
+    current = _current.get()
+    if current is None or current[0].level < level:
+        return
+    trace, parent = current
+    record = {'message': message, 'at_ms': trace.elapsed_ms(), **attributes}
+    if parent is not None:
+        record['span'] = parent.name
+    trace.events.append(record)
+
+def annotate(**attributes):
+    """Adds attributes to the current span, or to the request itself outside of spans."""
+    current = _current.get()
+    if current is None:
+        return
+    trace, parent = current
+    (parent.attributes if parent is not None else trace.attributes).update(attributes)
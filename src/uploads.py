@@ -0,0 +1,119 @@
+# src/uploads.py
+"""
+Limits of the uploaded audio: maximum size and duration, and the audio
+containers accepted, recognized from their first bytes rather than from
+the type declared by the client.
+"""
+import os
+import tempfile
+
+# Set any limit to 0 to disable it
+MAX_UPLOAD_BYTES = int(os.environ.get('MAX_UPLOAD_BYTES', 64 * 1024 * 1024)) # per audio file
+MAX_BATCH_BYTES = int(os.environ.get('MAX_BATCH_BYTES', 512 * 1024 * 1024)) # per batch request
+MAX_AUDIO_SECONDS = float(os.environ.get('MAX_AUDIO_SECONDS', 1800)) # read from the container header
+# Uploads larger than this are spooled to a temporary file while the request is read
+UPLOAD_SPOOL_BYTES = int(os.environ.get('UPLOAD_SPOOL_BYTES', 1024 * 1024))
+
+# Bytes needed to recognize every accepted container
+SNIFF_BYTES = 12
+
+class UnsupportedFormatError(Exception):
+    """Raised for an upload that is not in an accepted audio container."""
+
+class UploadTooLargeError(Exception):
+    """Raised for an upload larger than MAX_UPLOAD_BYTES."""
+
+class AudioTooLongError(Exception):
+    """Raised for audio longer than MAX_AUDIO_SECONDS."""
+
+def is_mpeg_frame(head):
+    # Frame sync (11 bits set), and a layer (MPEG audio, not AAC's ADTS)
+    return len(head) >= 2 and head[0] == 0xFF and head[1] & 0xE0 == 0xE0 and head[1] & 0x06 != 0
+
+def sniff_format(head):
+    """
+    Recognizes the audio container from the first bytes of a file.
+
+    Args:
+        head (bytes): The first SNIFF_BYTES bytes (or the whole file if it is shorter).
+
+    Returns:
+        str: 'wav', 'flac', 'ogg' or 'mp3', or None for anything else.
+    """
+    if head[:4] in (b'RIFF', b'RF64') and head[8:12] == b'WAVE':
+        return 'wav'
+    if head.startswith(b'fLaC'):
+        return 'flac'
+    if head.startswith(b'OggS'):
+        return 'ogg'
+    if head.startswith(b'ID3') or is_mpeg_frame(head):
+        return 'mp3'
+    return None
+
+def sniff_stream(stream):
+    """Container of a seekable file object, from its first bytes. Rewinds it."""
+    position = stream.tell()
+    try:
+        return sniff_format(stream.read(SNIFF_BYTES))
+    finally:
+        stream.seek(position)
+
+def check_duration(seconds):
+    """Raises AudioTooLongError when the audio is longer than MAX_AUDIO_SECONDS."""
+    if MAX_AUDIO_SECONDS and seconds > MAX_AUDIO_SECONDS:
+        raise AudioTooLongError(f'The audio lasts {seconds:.0f} s, longer than the maximum '
+                                f'of {MAX_AUDIO_SECONDS:.0f} s.')
+
+def check_size(size, limit=None):
+    """Raises UploadTooLargeError when an upload is larger than the limit (MAX_UPLOAD_BYTES by default)."""
+    limit = MAX_UPLOAD_BYTES if limit is None else limit
+    if limit and size > limit:
+        raise UploadTooLargeError(f'The file is larger than the maximum of {limit / (1024 * 1024):g} MB.')
+
+def stream_size(stream):
+    """Size in bytes of a seekable file object. Rewinds it."""
+    position = stream.tell()
+    try:
+        return stream.seek(0, os.SEEK_END)
+    finally:
+        stream.seek(position)
+
+class UploadSpool:
+    """
+    Container an uploaded file is written to while the request body is
+    parsed. The file is rejected as soon as its first bytes are not an
+    accepted container or its size passes the limit, so the rest of the
+    body is never read. Spooled to disk above UPLOAD_SPOOL_BYTES.
+    """
+    def __init__(self, max_bytes=None, sniff=True):
+        """
+        Args:
+            max_bytes (int): Size limit (MAX_UPLOAD_BYTES by default, 0 for none).
+            sniff (bool): Reject the files that are not audio (False for the
+                parts of a batch, which may be archives and are checked one by one).
+        """
+        self._file = tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_BYTES)
+        self._head = b''
+        self.max_bytes = max_bytes
+        self.sniff = sniff
+        self.size = 0
+        self.format = None
+
+    def write(self, data):
+        self.size += len(data)
+        check_size(self.size, self.max_bytes)
+        if self.sniff and len(self._head) < SNIFF_BYTES:
+            self._head += data[:SNIFF_BYTES - len(self._head)]
+            # Shorter files are checked once read (sniff_stream)
+            if len(self._head) == SNIFF_BYTES:
+                self.format = sniff_format(self._head)
+                if self.format is None:
+                    raise UnsupportedFormatError('Unsupported file type. Please upload a valid audio file.')
+        return self._file.write(data)
+
+    def __iter__(self):
+        return iter(self._file)
+
+    def __getattr__(self, name):
+        # read, seek, tell, close... of the spooled file
+        return getattr(self._file, name)
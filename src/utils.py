@@ -1,8 +1,10 @@
-import requests
+import hashlib
 import json
 import os
-from music21 import scale, stream, note, meter
+import threading
+from types import MappingProxyType
 import src.scales_generator as sg
+from src import metrics, tracing
 
 class Scale:
     """
@@ -73,19 +75,31 @@ class Scale:
         else:
             self.api_name = self.root_note
 
-        scales_data = sg.run() # Generates scales / chords / relatives data
+        scales_data = sg.SCALES # Scales / chords / relatives data, generated at import
         # print(self.root_note, self.api_name)
 
         # Then, check if the normalized key exists in the comprehensive dictionary
         if self.api_name in scales_data:
-            self.scale = scales_data[self.api_name]['scale'][self.mode]
-            self.chords = scales_data[self.api_name]['chords'][self.mode]
+            self.scale = list(scales_data[self.api_name]['scale'][self.mode])
+            self.chords = list(scales_data[self.api_name]['chords'][self.mode])
             self.relative = scales_data[self.api_name]['relative'][self.mode]
         else:
             self.scale = None
             self.chords = None
             self.relative = None
-            
+
+    def to_dict(self):
+        """Returns the data served by the /api/scale endpoint."""
+        return {
+            'root': self.root_note,
+            'enharmonic': self.enharmonic,
+            'is_flat': self.is_flat,
+            'mode': self.mode,
+            'scale': self.scale,
+            'chords': self.chords,
+            'relative': self.relative,
+        }
+
 def get_url(key_name):
     key_mapping = {
         'b': '-flat',
@@ -123,8 +137,14 @@ def format_music21(key_name):
     }
     return _key_name_mapping.get(key_name, key_name)
 
-def get_music_score(key_name, mode):
-    """Generates a music score image for a given scale and returns the file path."""
+# Rendered scores are named after the hash of their notes, so a file never changes
+SCORE_DIR = os.path.join('./app/', 'static', 'images', 'output')
+_scores = {} # (music21 key name, mode) -> file name of the score (None if it failed)
+_render_lock = threading.Lock() # music21 renders are not thread safe (global defaults)
+
+def build_score(key_name, mode):
+    """Builds the music21 stream of a scale, or returns None for unknown keys."""
+    from music21 import scale, stream, note, meter # Loaded on the first render only
     try:
         if mode == 'minor':
             scl = scale.MinorScale(format_music21(key_name))
@@ -134,7 +154,6 @@ def get_music_score(key_name, mode):
         print(f"Error creating scale: {e}")
         return None
 
-    print("Music score created sucessfuly.")
     s = stream.Stream()
     s.append(meter.TimeSignature('4/4'))
 
@@ -142,27 +161,73 @@ def get_music_score(key_name, mode):
         n = note.Note(p)
         n.duration.type = 'quarter'
         s.append(n)
-    
-    # Ensure the output directory exists
-    root_path = "./app/"
-    output_dir = os.path.join(root_path, 'static', 'images', 'output')
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
-    
-    # Construct the file path
-    #filename = f"{key_name}_{mode}_scale.png"
-    filename = "scale.png"
-    file_path = os.path.join(output_dir, filename)
-    print("Image saved sucessfuly:", file_path)
+    return s
 
-    try:
-        s.write('musicxml.png', fp=file_path)
+def score_id(s):
+    """Content address of a score: hash of its time signature and spelled notes."""
+    content = ' '.join(['4/4'] + [n.pitch.nameWithOctave for n in s.notes])
+    return hashlib.sha256(content.encode()).hexdigest()[:16]
 
-        # Return the path relative to the 'static' folder
-        return os.path.join('output', filename)
+def render_score(s, filename):
+    """Renders a score to SCORE_DIR/filename. Returns the file name, or None."""
+    os.makedirs(SCORE_DIR, exist_ok=True)
+    temp_path = os.path.join(SCORE_DIR, f'{filename}.{threading.get_ident()}.png')
+    try:
+        written = s.write('musicxml.png', fp=temp_path) # MuseScore adds a page suffix
+        os.replace(written, os.path.join(SCORE_DIR, filename)) # Atomic, never a partial image
+        tracing.event('Music score created', file=filename)
+        return filename
     except Exception as e:
         print(f"Error writing music score: {e}")
         return None
+    finally:
+        # Intermediate MusicXML file given to MuseScore
+        musicxml_path = os.path.splitext(temp_path)[0] + '.musicxml'
+        if os.path.exists(musicxml_path):
+            os.remove(musicxml_path)
+
+def get_music_score(key_name, mode):
+    """
+    Returns the file name (in SCORE_DIR) of the music score of a scale.
+    Each score is rendered once: later calls, concurrent ones included,
+    reuse the image, which is also kept on disk across restarts.
+    """
+    cache_key = (format_music21(key_name), mode)
+    if cache_key in _scores:
+        return _scores[cache_key]
+    with _render_lock:
+        if cache_key not in _scores:
+            with metrics.SCALE_SECONDS.time(operation='score_render'), tracing.span('score_render', key=key_name, mode=mode):
+                s = build_score(key_name, mode)
+                if s is None:
+                    return None
+                filename = f'{score_id(s)}.png'
+                if os.path.exists(os.path.join(SCORE_DIR, filename)):
+                    _scores[cache_key] = filename
+                else:
+                    _scores[cache_key] = render_score(s, filename)
+        return _scores[cache_key]
+
+def is_score_cached(key_name, mode):
+    """True once the score of a scale has been looked up (rendered, found on disk or failed)."""
+    return (format_music21(key_name), mode) in _scores
+
+def prerender_scores():
+    """
+    Renders the scores of all the keys, under every spelling and in both
+    modes. Stops at the first failure (e.g. MuseScore is not installed).
+
+    Returns:
+        int: Number of scores available.
+    """
+    count = 0
+    for alias in Scale._key_name_mapping:
+        for mode in ('major', 'minor'):
+            if get_music_score(alias, mode) is None:
+                print("Music scores could not be pre-rendered.")
+                return count
+            count += 1
+    return count
 
 def flip_accidentals(key_name):
     """
@@ -237,39 +302,36 @@ def solfeggio(notes: list[str]) -> list[str]:
         new_notes.append(note_mapping.get(note, note))
     return new_notes
 
-# Call to the API
+# Scale data (in-process, or from SCALE_API_URL in remote mode)
 def get_scale_data(key_name, is_minor=False, is_flat=False):
     """
-    Makes a GET request to the local API and returns JSON data.
+    Returns the scale data of a key, as served by the /api/scale endpoint.
 
     Args:
         key_name (str): The name of the musical key (e.g., 'c-sharp').
 
     Returns:
-        dict: The JSON data from the API response, or None if an error occurs.
+        dict: The scale data, or None if the key is unknown or an error occurs.
     """
-    if key_name.endswith('m'):
-        if not is_minor:
-            key_name = key_name[:-1]
-    else:
-        if is_minor: key_name+='m' # Adjusts for minor scale
-    # Build URL for API call
-    api_url = 'http://127.0.0.1:5000/api/'
-    url = f'{api_url}scale/{key_name}'
-        
-    try:
-        # Make the GET request
-        response = requests.get(url)
-        
-        # Check if the request was successful (status code 200)
-        response.raise_for_status()
-        
-        # Return the JSON data as a Python dictionary
-        return response.json()
-        
-    except requests.exceptions.RequestException as e:
-        print(f"Error when making the request: {e}")
-        return None
-    except json.JSONDecodeError:
-        print("Error decoding JSON from the response.")
-        return None
\ No newline at end of file
+    from src import scale_service
+    return scale_service.get_scale(key_name, is_minor)
+
+def encode_scales():
+    """
+    Pre-encodes the /api/scale response of every accepted key name: the 24
+    keys under each of their (lowercase) aliases, with and without the minor 'm'.
+
+    Returns:
+        MappingProxyType: Lowercase key name -> JSON body (bytes).
+    """
+    bodies = {}
+    for alias in Scale._key_name_mapping:
+        for key_name in (alias, alias + 'm'):
+            new_scale = Scale(key_name)
+            if new_scale.scale is not None:
+                # Same bytes as Flask's jsonify
+                body = json.dumps(new_scale.to_dict(), sort_keys=True, separators=(',', ':'))
+                bodies[key_name] = f'{body}\n'.encode()
+    return MappingProxyType(bodies)
+
+SCALE_RESPONSES = encode_scales()
@@ -0,0 +1,276 @@
+import itertools
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future
+from src import metrics, tracing
+
+# Process pool settings (can be overridden through environment variables)
+# WORKER_PROCESSES=0 keeps detection inside the web process
+WORKER_PROCESSES = int(os.environ.get('WORKER_PROCESSES', 0))
+# Intra-op threads per worker; by default the cores are split between workers
+WORKER_THREADS = int(os.environ.get('WORKER_THREADS', 0)) or max(1, (os.cpu_count() or 1) // max(1, WORKER_PROCESSES))
+
+class WorkerCrashedError(Exception):
+    """Raised for the requests of a worker process that died."""
+
+def _worker_main(conn, threads):
+    """
+    Entry point of a detection worker process: loads the model once and
+    answers (request_id, audio, task) messages received over the pipe.
+    """
+    from src import model_session
+    model_session.configure_threads(intra_op=threads, inter_op=1)
+    from src import audio_io, pitch_detector
+    model_session.load()
+    conn.send(('ready', os.getpid()))
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            break
+        if message is None: # Shutdown request
+            break
+        request_id, audio, task = message
+        try:
+            if task == 'stream':
+                blocks = audio_io.split_blocks(audio, pitch_detector.STREAM_WINDOW_SECONDS)
+                result = pitch_detector.run_streaming(blocks)
+            elif task == 'rank':
+                result = pitch_detector.rank_audio(audio)
+            else:
+                result = pitch_detector.run_audio(audio)
+            conn.send((request_id, True, result))
+        except Exception as e:
+            conn.send((request_id, False, str(e)))
+
+class _Worker:
+    """Parent-side handle of one worker process."""
+    def __init__(self, index, context, threads, target):
+        self.index = index
+        self.context = context
+        self.threads = threads
+        self.target = target
+        self.restarts = -1
+        self.stopping = False
+        self.pending = {} # request_id -> Future
+        self.lock = threading.Lock()
+        self.start()
+
+    def start(self):
+        parent_conn, child_conn = self.context.Pipe()
+        self.conn = parent_conn
+        self.process = self.context.Process(
+            target=self.target, args=(child_conn, self.threads), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.ready = threading.Event()
+        self.restarts += 1
+        threading.Thread(target=self._read, args=(parent_conn,), daemon=True).start()
+
+    def send(self, request_id, audio, task, future):
+        with self.lock:
+            self.pending[request_id] = future
+            try:
+                self.conn.send((request_id, audio, task))
+            except (OSError, ValueError):
+                del self.pending[request_id]
+                raise WorkerCrashedError(f'Detection worker {self.index} is not available.')
+
+    def depth(self):
+        """Requests sent to this worker and not answered yet."""
+        return len(self.pending)
+
+    def _read(self, conn):
+        # Resolves the futures of this worker until its process goes away
+        while True:
+            try:
+                message = conn.recv()
+            except (EOFError, OSError):
+                break
+            if message[0] == 'ready':
+                self.ready.set()
+                continue
+            request_id, ok, payload = message
+            with self.lock:
+                future = self.pending.pop(request_id, None)
+            if future is None:
+                continue
+            if ok:
+                future.set_result(payload)
+            else:
+                future.set_exception(RuntimeError(payload))
+        self._on_exit(conn)
+
+    def _on_exit(self, conn):
+        with self.lock:
+            if conn is not self.conn:
+                return
+            pending, self.pending = self.pending, {}
+            # A worker that crashed after starting up is replaced so the pool keeps
+            # its size (one that never got ready would just crash again)
+            if not self.stopping and self.ready.is_set():
+                self.process.join(timeout=1)
+                self.start()
+        for future in pending.values():
+            future.set_exception(WorkerCrashedError(f'Detection worker {self.index} crashed.'))
+
+    def stop(self):
+        self.stopping = True
+        try:
+            self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.terminate()
+
+class WorkerPool:
+    """
+    Pool of preforked detection processes, each with its own resident model.
+    Requests are dispatched to the worker with the fewest pending requests.
+    """
+    def __init__(self, processes=WORKER_PROCESSES, threads=WORKER_THREADS, target=_worker_main):
+        """
+        Args:
+            processes (int): Number of worker processes.
+            threads (int): Intra-op CPU threads of each worker's model.
+            target: Entry point of the worker processes.
+        """
+        # 'spawn' avoids inheriting the threads and model state of the web process
+        context = multiprocessing.get_context('spawn')
+        self._ids = itertools.count()
+        self._workers = [_Worker(i, context, threads, target) for i in range(processes)]
+
+    def submit(self, audio, task='key'):
+        """
+        Sends mono audio to the least busy worker (ready workers first).
+
+        Args:
+            audio (np.ndarray): Mono audio at the model's sample rate.
+            task (str): 'key' (run_audio), 'stream' (run_streaming) or 'rank' (rank_audio).
+
+        Returns:
+            Future: Resolves to the result of the task.
+        """
+        worker = min(self._workers, key=lambda w: (not w.ready.is_set(), w.depth()))
+        future = Future()
+        worker.send(next(self._ids), audio, task, future)
+        return future
+
+    def run_audio(self, audio):
+        """Detects the key of mono audio on the pool. Returns (pitch, mode)."""
+        return self.submit(audio).result()
+
+    def run_streaming(self, audio):
+        """Streaming detection on the pool. Returns (pitch, mode, analyzed_seconds)."""
+        return self.submit(audio, task='stream').result()
+
+    def rank_audio(self, audio):
+        """Key-profile detection on the pool. Returns (pitch, mode, ranked)."""
+        return self.submit(audio, task='rank').result()
+
+    def stats(self):
+        """Per-worker process id, liveness, pending requests and restarts."""
+        return [{
+            'worker': w.index,
+            'pid': w.process.pid,
+            'alive': w.process.is_alive(),
+            'ready': w.ready.is_set(),
+            'queued': w.depth(),
+            'restarts': w.restarts,
+        } for w in self._workers]
+
+    def close(self):
+        for worker in self._workers:
+            worker.stop()
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """Returns the process-wide worker pool, or None when it is disabled."""
+    global _pool
+    if not WORKER_PROCESSES:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = WorkerPool()
+    return _pool
+
+def infer(audio, task='key'):
+    """
+    Runs a detection task on preprocessed audio, on the worker pool (or
+    in-process when it is disabled).
+
+    Args:
+        audio (np.ndarray): Mono audio at the model's sample rate.
+        task (str): 'key' (run_audio) or 'rank' (rank_audio).
+    """
+    from src import pitch_detector
+    pool = get_pool()
+    if pool is None:
+        return pitch_detector.rank_audio(audio) if task == 'rank' else pitch_detector.run_audio(audio)
+    with metrics.DETECT_STAGE_SECONDS.time(stage='worker'), tracing.span('worker'):
+        return pool.rank_audio(audio) if task == 'rank' else pool.run_audio(audio)
+
+def detect(data, suffix=''):
+    """
+    Detects the key of uploaded audio bytes. The audio is decoded and its
+    silences trimmed here, and the inference runs on the worker pool (or
+    in-process when it is disabled).
+    """
+    from src import audio_io
+    return infer(audio_io.preprocess(data, suffix))
+
+def detect_streaming(data, suffix=''):
+    """
+    Detects the key of uploaded audio bytes window by window, stopping
+    early once the key is clear.
+
+    Returns:
+        tuple: (pitch, mode, analyzed_seconds, duration_seconds)
+    """
+    from src import audio_io, pitch_detector
+    pool = get_pool()
+    if pool is None:
+        # Decode lazily: blocks after the early stop are never decoded
+        duration, blocks = audio_io.open_blocks(data, pitch_detector.STREAM_WINDOW_SECONDS, suffix)
+        pitch, mode, analyzed = pitch_detector.run_streaming(blocks)
+    else:
+        audio = audio_io.decode_bytes(data, suffix)
+        duration = len(audio) / pitch_detector.AUDIO_SAMPLE_RATE
+        with metrics.DETECT_STAGE_SECONDS.time(stage='worker'), tracing.span('worker'):
+            pitch, mode, analyzed = pool.run_streaming(audio)
+    return pitch, mode, analyzed, duration
+
+def detect_ranked(data, suffix=''):
+    """
+    Detects the key of uploaded audio bytes with the key-profile engine.
+
+    Returns:
+        tuple: (pitch, mode, ranked) with all 24 keys ranked by confidence.
+    """
+    from src import audio_io
+    return infer(audio_io.preprocess(data, suffix), task='rank')
+
+def detect_cascade(data, suffix='', task='key'):
+    """
+    Detects the key of uploaded audio bytes with the two-tier cascade: the
+    chroma estimate answers when it is confident enough, and the model
+    only runs (on the same decoded audio) when it is not.
+
+    Args:
+        task (str): 'key' (result of detect) or 'rank' (result of detect_ranked).
+
+    Returns:
+        tuple: (result, tier) where tier is 'chroma' or 'model'.
+    """
+    from src import audio_io, chroma, pitch_detector
+    audio = audio_io.preprocess(data, suffix)
+    pitch, mode, ranked, confidence = chroma.estimate_key(audio, pitch_detector.AUDIO_SAMPLE_RATE)
+    if pitch is not None and confidence >= chroma.CHROMA_MIN_CONFIDENCE:
+        metrics.KEY_TIERS.inc(tier='chroma')
+        return ((pitch, mode, ranked) if task == 'rank' else (pitch, mode)), 'chroma'
+    metrics.KEY_TIERS.inc(tier='model')
+    return infer(audio, task), 'model'
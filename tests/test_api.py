@@ -1,11 +1,16 @@
 # tests/test_api.py
 import pytest
 import io
+import time
 from unittest.mock import patch
 from flask import Flask, json
 
 # Import the Blueprint from the api.py script
 from app.api import api as api_blueprint
+from benchmarks.legacy import legacy_get_scale
+from src.result_cache import get_cache
+from src import metrics
+from src import uploads
 
 # Create a test application and register the blueprint
 @pytest.fixture
@@ -16,6 +21,11 @@ def app():
     app.register_blueprint(api_blueprint, url_prefix='/api')
     return app
 
+@pytest.fixture(autouse=True)
+def empty_cache():
+    """Start every test without cached detection results."""
+    get_cache().clear()
+
 # Create a test client using the app fixture
 @pytest.fixture
 def client(app):
@@ -28,6 +38,28 @@ def test_root_endpoint(client):
     assert response.status_code == 200
     assert response.data.decode('utf-8') == "Welcome dear human…"
 
+@patch('app.api.model_session.is_ready', return_value=False)
+def test_ready_before_warm_up(mock_ready, client):
+    """The readiness check fails until the model is warmed up."""
+    response = client.get('/api/ready')
+    assert response.status_code == 503
+    assert json.loads(response.data)['ready'] is False
+
+@patch('app.api.model_session.is_ready', return_value=True)
+def test_ready_after_warm_up(mock_ready, client):
+    """The readiness check passes once the model is warmed up."""
+    response = client.get('/api/ready')
+    assert response.status_code == 200
+    assert json.loads(response.data)['ready'] is True
+
+@patch('app.api.get_scheduler')
+def test_stats_endpoint(mock_scheduler, client):
+    """The stats endpoint exposes the batching counters."""
+    mock_scheduler.return_value.stats.return_value = {'batches': 2, 'batch_size_avg': 3.5}
+    response = client.get('/api/stats')
+    assert response.status_code == 200
+    assert json.loads(response.data)['batching']['batches'] == 2
+
 @patch('app.api.detect_pitch')
 def test_detect_tone_valid_audio(mock_detect_pitch, client):
     """Test the /detect endpoint with a valid audio file."""
@@ -36,7 +68,7 @@ def test_detect_tone_valid_audio(mock_detect_pitch, client):
 
     # Create a mock audio file in memory
     data = {
-        'audio': (io.BytesIO(b"fake audio data"), 'test.mp3')
+        'audio': (io.BytesIO(b"ID3fake audio data"), 'test.mp3')
     }
     
     response = client.post('/api/detect', data=data, content_type='multipart/form-data')
@@ -45,7 +77,77 @@ def test_detect_tone_valid_audio(mock_detect_pitch, client):
     data = json.loads(response.data)
     assert data['pitch'] == "C"
     assert data['mode'] == "major"
+    # The upload is passed in memory, not as a temporary file
+    mock_detect_pitch.assert_called_once_with(b"ID3fake audio data", '.mp3')
             
+@patch('app.api.detect_pitch', return_value=("D", "major"))
+def test_detect_uses_result_cache(mock_detect_pitch, client):
+    """Uploading the same bytes twice only runs the detection once."""
+    for _ in range(2):
+        data = {'audio': (io.BytesIO(b"ID3same backing track"), 'test.mp3')}
+        response = client.post('/api/detect', data=data, content_type='multipart/form-data')
+        assert json.loads(response.data) == {'pitch': 'D', 'mode': 'major'}
+    mock_detect_pitch.assert_called_once()
+
+@patch('app.api.detect_streaming', return_value=("A", "minor", 20.0, 600.0))
+def test_detect_streaming_reports_analyzed_audio(mock_detect_streaming, client):
+    """The streaming mode reports how much audio was analyzed."""
+    data = {'audio': (io.BytesIO(b"ID3long rehearsal"), 'test.mp3')}
+    response = client.post('/api/detect?stream=1', data=data, content_type='multipart/form-data')
+    assert response.status_code == 200
+    assert json.loads(response.data) == {
+        'pitch': 'A', 'mode': 'minor', 'analyzed_seconds': 20.0, 'duration_seconds': 600.0}
+
+@patch('app.api.detect_ranked', return_value=("E", "Minor", [
+    {'pitch': 'E', 'mode': 'Minor', 'confidence': 0.8},
+    {'pitch': 'G', 'mode': 'Major', 'confidence': 0.7},
+]))
+def test_detect_profile_engine(mock_detect_ranked, client):
+    """The key-profile engine can be selected and returns ranked keys."""
+    data = {'audio': (io.BytesIO(b"ID3fake audio data"), 'test.mp3')}
+    response = client.post('/api/detect?engine=profile', data=data, content_type='multipart/form-data')
+    assert response.status_code == 200
+    data = json.loads(response.data)
+    assert (data['pitch'], data['mode'], data['engine']) == ('E', 'Minor', 'profile')
+    assert data['keys'][1] == {'pitch': 'G', 'mode': 'Major', 'confidence': 0.7}
+
+@patch('app.api.chroma.KEY_CASCADE', True)
+@patch('app.api.detect_cascade', return_value=(("F", "Major"), 'chroma'))
+def test_detect_reports_the_cascade_tier(mock_detect_cascade, client):
+    """With the key cascade enabled, the response tells which tier answered."""
+    data = {'audio': (io.BytesIO(b"ID3fake audio data"), 'test.mp3')}
+    response = client.post('/api/detect', data=data, content_type='multipart/form-data')
+    assert response.status_code == 200
+    assert json.loads(response.data) == {'pitch': 'F', 'mode': 'Major', 'tier': 'chroma'}
+    mock_detect_cascade.assert_called_once_with(b"ID3fake audio data", '.mp3')
+
+    # Cache hits are counted apart, so that the escalation share is not skewed by the hit rate
+    hits = metrics.KEY_TIERS.value(tier='cache')
+    data = {'audio': (io.BytesIO(b"ID3fake audio data"), 'test.mp3')}
+    response = client.post('/api/detect', data=data, content_type='multipart/form-data')
+    assert json.loads(response.data)['tier'] == 'chroma'
+    mock_detect_cascade.assert_called_once()
+    assert metrics.KEY_TIERS.value(tier='cache') == hits + 1
+
+@patch('app.api.detect_pitch', side_effect=[("C", "major"), MemoryError()])
+def test_detect_records_metrics(mock_detect_pitch, client):
+    """Detections record the upload time, the bytes analyzed and the errors by type."""
+    uploads = metrics.DETECT_STAGE_SECONDS.count(stage='upload')
+    analyzed = metrics.DETECT_BYTES.value()
+    errors = metrics.DETECT_ERRORS.value(type='MemoryError')
+    for content in (b"ID3first take", b"ID3second take"):
+        client.post('/api/detect', data={'audio': (io.BytesIO(content), 'test.mp3')},
+                    content_type='multipart/form-data')
+    assert metrics.DETECT_STAGE_SECONDS.count(stage='upload') == uploads + 2
+    assert metrics.DETECT_BYTES.value() == analyzed + len(b"ID3first take") + len(b"ID3second take")
+    assert metrics.DETECT_ERRORS.value(type='MemoryError') == errors + 1
+
+def test_detect_unknown_engine(client):
+    """Unknown engines are rejected."""
+    data = {'audio': (io.BytesIO(b"ID3fake audio data"), 'test.mp3')}
+    response = client.post('/api/detect?engine=magic', data=data, content_type='multipart/form-data')
+    assert response.status_code == 400
+
 @patch('app.api.detect_pitch')
 def test_detect_tone_no_audio_file(mock_detect_pitch, client):
     """Test the /detect endpoint with no audio file."""
@@ -69,6 +171,71 @@ def test_detect_tone_unsupported_file_type(mock_detect_pitch, client):
     assert 'error' in data
     assert 'Unsupported file type' in data['error']
 
+@patch('app.api.detect_pitch')
+def test_detect_sniffs_the_container(mock_detect_pitch, client):
+    """The declared type is not trusted: the first bytes decide."""
+    mock_detect_pitch.return_value = ("C", "major")
+    disguised = {'audio': (io.BytesIO(b"<html>" + b"x" * 100000), 'test.mp3', 'audio/mpeg')}
+    response = client.post('/api/detect', data=disguised, content_type='multipart/form-data')
+    assert response.status_code == 415
+    assert 'Unsupported file type' in json.loads(response.data)['error']
+    mock_detect_pitch.assert_not_called()
+
+    wav = {'audio': (io.BytesIO(b"RIFF\x24\x00\x00\x00WAVEfmt "), 'take', 'application/octet-stream')}
+    assert client.post('/api/detect', data=wav, content_type='multipart/form-data').status_code == 200
+
+@patch('src.uploads.MAX_UPLOAD_BYTES', 1000)
+@patch('app.api.detect_pitch')
+def test_detect_rejects_oversized_uploads(mock_detect_pitch, client):
+    """413 from the Content-Length, or as soon as the file passes the limit."""
+    for size in (200000, 2000):
+        data = {'audio': (io.BytesIO(b"ID3" + b"\x00" * size), 'test.mp3')}
+        response = client.post('/api/detect', data=data, content_type='multipart/form-data')
+        assert response.status_code == 413
+        assert 'maximum' in json.loads(response.data)['error']
+    mock_detect_pitch.assert_not_called()
+
+@patch('app.api.detect_pitch', side_effect=uploads.AudioTooLongError('The audio lasts 3600 s.'))
+def test_detect_rejects_long_audio(mock_detect_pitch, client):
+    data = {'audio': (io.BytesIO(b"ID3fake audio data"), 'test.mp3')}
+    response = client.post('/api/detect', data=data, content_type='multipart/form-data')
+    assert response.status_code == 413
+    assert json.loads(response.data) == {'error': 'The audio lasts 3600 s.'}
+
+@patch('app.api.detect_pitch', return_value=("G", "minor"))
+def test_detect_job_lifecycle(mock_detect_pitch, client):
+    """A detection job is accepted immediately and its result can be polled."""
+    data = {'audio': (io.BytesIO(b"ID3fake audio data"), 'test.mp3')}
+    response = client.post('/api/detect/jobs', data=data, content_type='multipart/form-data')
+    assert response.status_code == 202
+    job = json.loads(response.data)
+    assert job['status'] in ('queued', 'running', 'done')
+    assert response.headers['Location'].endswith(f"/api/detect/jobs/{job['job_id']}")
+
+    for _ in range(100):
+        result = json.loads(client.get(f"/api/detect/jobs/{job['job_id']}").data)
+        if result['status'] == 'done':
+            break
+        time.sleep(0.01)
+    assert result['result'] == {'pitch': 'G', 'mode': 'minor'}
+
+@patch('app.api.check_upload')
+@patch('app.api.get_job_queue')
+def test_detect_job_queue_full(mock_job_queue, mock_check_upload, client):
+    """A full queue rejects new jobs with 503 and Retry-After, before the upload is parsed."""
+    mock_job_queue.return_value.full.return_value = True
+    data = {'audio': (io.BytesIO(b"ID3fake audio data"), 'test.mp3')}
+    response = client.post('/api/detect/jobs', data=data, content_type='multipart/form-data')
+    assert response.status_code == 503
+    assert 'Retry-After' in response.headers
+    mock_check_upload.assert_not_called()
+    mock_job_queue.return_value.submit.assert_not_called()
+
+def test_detect_job_not_found(client):
+    """Polling an unknown job returns 404."""
+    response = client.get('/api/detect/jobs/unknown')
+    assert response.status_code == 404
+
 def test_get_scale_valid_key(client):
     """Test the /scale/<key_name> endpoint with a valid key."""
     response = client.get('/api/scale/C')
@@ -99,4 +266,132 @@ def test_get_scale_invalid_key(client):
     assert response.status_code == 404
     data = json.loads(response.data)
     assert 'error' in data
-    assert 'Information for key invalid_key not found' in data['error']
\ No newline at end of file
+    assert 'Information for key invalid_key not found' in data['error']
+
+def test_get_scale_matches_rebuilt_table(app):
+    """The pre-encoded scale is the one the table rebuilt per request gave."""
+    app.add_url_rule('/legacy/scale/<string:key_name>', view_func=legacy_get_scale)
+    client = app.test_client()
+    for key_name in ('c', 'f-sharpm'):
+        response = client.get(f'/api/scale/{key_name}')
+        assert response.data == client.get(f'/legacy/scale/{key_name}').data
+
+def test_get_scale_cache_headers(client):
+    """Scale responses carry a strong ETag and a max-age."""
+    response = client.get('/api/scale/C')
+    assert response.headers['ETag'].startswith('"')
+    assert response.cache_control.public
+    assert response.cache_control.max_age > 0
+    assert client.get('/api/scale/c').headers['ETag'] == response.headers['ETag']
+    assert client.get('/api/scale/Cm').headers['ETag'] != response.headers['ETag']
+    assert 'ETag' not in client.get('/api/scale/invalid_key').headers
+
+def test_get_scale_not_modified(client):
+    """A matching If-None-Match gets an empty 304 without building the response."""
+    etag = client.get('/api/scale/f-sharp').headers['ETag']
+    with patch('app.api.scale_service.get_scale_body') as mock_body:
+        response = client.get('/api/scale/f-sharp', headers={'If-None-Match': etag})
+        other = client.get('/api/scale/f-sharp', headers={'If-None-Match': '"stale"'})
+    assert response.status_code == 304
+    assert response.data == b''
+    assert response.headers['ETag'] == etag
+    assert response.cache_control.max_age > 0
+    assert other.status_code == 200
+    mock_body.assert_called_once()
+
+def test_get_scales_all_keys(client):
+    """Without arguments, the data of the 24 keys is returned from the precomputed blob."""
+    with patch('app.api.scale_service.encode_scales') as mock_encode:
+        response = client.get('/api/scales')
+    mock_encode.assert_not_called()
+    assert response.status_code == 200
+    data = json.loads(response.data)
+    assert len(data) == 24
+    assert data['f-sharpm'] == json.loads(client.get('/api/scale/f-sharpm').data)
+    assert response.headers['ETag']
+
+def test_get_scales_subset(client):
+    """?keys= returns the same payload as /api/scale for each key, keyed by the name asked."""
+    response = client.get('/api/scales?keys=c, Am,f-sharp,c')
+    assert response.status_code == 200
+    data = json.loads(response.data)
+    assert list(data) == ['c', 'Am', 'f-sharp']
+    for name in data:
+        assert data[name] == json.loads(client.get(f'/api/scale/{name}').data)
+
+def test_get_scales_unknown_keys(client):
+    response = client.get('/api/scales?keys=c,h,xm')
+    assert response.status_code == 404
+    assert 'h, xm' in json.loads(response.data)['error']
+
+def test_get_scales_not_modified(client):
+    etag = client.get('/api/scales?keys=c,am').headers['ETag']
+    assert client.get('/api/scales?keys=c,am', headers={'If-None-Match': etag}).status_code == 304
+    assert client.get('/api/scales?keys=am,c', headers={'If-None-Match': etag}).status_code == 200
+    assert client.get('/api/scales', headers={'If-None-Match': etag}).status_code == 200
+
+def ndjson(response):
+    return [json.loads(line) for line in response.data.decode().splitlines()]
+
+@patch('app.api.detect_pitch', side_effect=lambda data, suffix: ('C', 'major') if data != b'ID3bad' else 1 / 0)
+def test_detect_batch_multipart(mock_detect_pitch, client):
+    """Many 'audio' parts give one NDJSON line each, with per-file errors inline."""
+    data = {'audio': [(io.BytesIO(b"ID3one"), 'one.mp3'), (io.BytesIO(b"ID3bad"), 'bad.mp3'),
+                      (io.BytesIO(b"text"), 'notes.txt')]}
+    response = client.post('/api/detect/batch', data=data, content_type='multipart/form-data')
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    results = sorted(ndjson(response), key=lambda r: r['index'])
+    assert results[0] == {'index': 0, 'file': 'one.mp3', 'pitch': 'C', 'mode': 'major'}
+    assert results[1]['file'] == 'bad.mp3' and 'division by zero' in results[1]['error']
+    assert results[2] == {'index': 2, 'file': 'notes.txt', 'error': 'Unsupported file type.'}
+
+@patch('app.api.detect_pitch', return_value=('A', 'minor'))
+def test_detect_batch_archive(mock_detect_pitch, client):
+    """The audio files of a zip archive are detected."""
+    import zipfile
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        archive.writestr('set/01.mp3', b'ID3one')
+        archive.writestr('set/02.wav', b'RIFF\x24\x00\x00\x00WAVEtwo')
+    buffer.seek(0)
+    data = {'archive': (buffer, 'set.zip')}
+    response = client.post('/api/detect/batch', data=data, content_type='multipart/form-data')
+    results = sorted(ndjson(response), key=lambda r: r['index'])
+    assert [(r['file'], r['pitch']) for r in results] == [('set/01.mp3', 'A'), ('set/02.wav', 'A')]
+    assert sorted(call.args[1] for call in mock_detect_pitch.call_args_list) == ['.mp3', '.wav']
+
+@patch('src.uploads.MAX_UPLOAD_BYTES', 1000)
+@patch('app.api.detect_pitch', return_value=('C', 'major'))
+def test_detect_batch_checks_each_part(mock_detect_pitch, client):
+    """Mislabelled or oversized parts are reported inline, without trusting the declared type."""
+    data = {'audio': [(io.BytesIO(b"<html>" + b"x" * 100), 'fake.mp3', 'audio/mpeg'),
+                      (io.BytesIO(b"ID3" + b"\x00" * 2000), 'big.mp3', 'audio/mpeg'),
+                      (io.BytesIO(b"fLaC take"), 'take', 'application/octet-stream')]}
+    response = client.post('/api/detect/batch', data=data, content_type='multipart/form-data')
+    results = sorted(ndjson(response), key=lambda r: r['index'])
+    assert results[0] == {'index': 0, 'file': 'fake.mp3', 'error': 'Unsupported file type.'}
+    assert results[1]['file'] == 'big.mp3' and 'maximum' in results[1]['error']
+    assert results[2] == {'index': 2, 'file': 'take', 'pitch': 'C', 'mode': 'major'}
+    mock_detect_pitch.assert_called_once_with(b"fLaC take", '.take')
+
+@patch('src.uploads.MAX_BATCH_BYTES', 1000)
+def test_detect_batch_rejects_oversized_requests(client):
+    data = {'audio': [(io.BytesIO(b"ID3" + b"\x00" * 2000), 'big.mp3')]}
+    response = client.post('/api/detect/batch', data=data, content_type='multipart/form-data')
+    assert response.status_code == 413
+    assert 'maximum' in json.loads(response.data)['error']
+
+@patch('src.uploads.MAX_UPLOAD_BYTES', 1024 * 1024)
+@patch('src.uploads.MAX_BATCH_BYTES', 2 * 1024 * 1024)
+def test_detect_batch_reports_the_batch_limit(client):
+    """A batch refused from its Content-Length is told the batch limit, not the per-file one."""
+    data = {'audio': [(io.BytesIO(b"ID3" + b"\x00" * 3 * 1024 * 1024), 'big.mp3')]}
+    response = client.post('/api/detect/batch', data=data, content_type='multipart/form-data')
+    assert response.status_code == 413
+    assert json.loads(response.data)['error'] == 'The request is larger than the maximum of 2 MB.'
+
+def test_detect_batch_rejects_other_uploads(client):
+    assert client.post('/api/detect/batch', data={}, content_type='multipart/form-data').status_code == 400
+    data = {'archive': (io.BytesIO(b"not an archive"), 'set.zip')}
+    assert client.post('/api/detect/batch', data=data, content_type='multipart/form-data').status_code == 415
@@ -1,7 +1,10 @@
 # tests/test_app.py
+import json
+import logging
 import pytest
 import sys
 import os
+from unittest.mock import patch
 
 # Add the project's root directory to the Python path
 # This allows imports like 'from app.app import ...' and 'from api import ...' to work
@@ -55,6 +58,69 @@ def test_show_scale_route_not_found(client):
     response = client.get('/scale/invalidkey')
     assert response.status_code == 404
 
+def test_show_scale_route_score_image(client):
+    """The scale page shows the content-addressed score image."""
+    with patch('app.app.get_music_score', return_value='0123456789abcdef.png'):
+        response = client.get('/scale/c')
+    assert b'/scores/0123456789abcdef.png' in response.data
+
+def test_show_scale_route_unknown_mode(client):
+    """Unknown modes are shown as major, without a score of their own."""
+    with patch('app.app.get_music_score', return_value='0123456789abcdef.png') as mock_score, \
+            patch('app.app.is_score_cached', return_value=True):
+        for mode in ('MINOR', 'dorian', 'x' * 100):
+            assert client.get(f'/scale/c?mode={mode}').status_code == 200
+    assert list(dict.fromkeys(call.args[1] for call in mock_score.call_args_list)) == ['minor', 'major']
+
+def test_music_score_route_cache_headers(client, tmp_path):
+    """Score images are served with long-lived cache headers."""
+    (tmp_path / '0123456789abcdef.png').write_bytes(b'png')
+    with patch('app.app.SCORE_DIR', str(tmp_path)):
+        response = client.get('/scores/0123456789abcdef.png')
+        missing = client.get('/scores/missing.png')
+    assert response.status_code == 200
+    assert response.data == b'png'
+    assert response.cache_control.max_age == 365 * 24 * 3600
+    assert response.cache_control.immutable
+    assert missing.status_code == 404
+
+def test_show_scale_route_not_modified(client):
+    """Scale pages carry an ETag; a matching If-None-Match gets a 304 without building the page."""
+    with patch.dict('src.utils._scores', clear=True), \
+            patch('src.utils.render_score', return_value='0123456789abcdef.png'):
+        response = client.get('/scale/a?mode=minor')
+        etag = response.headers['ETag']
+        with patch('app.app.scale_service.get_scale') as mock_get_scale:
+            cached = client.get('/scale/a?mode=minor', headers={'If-None-Match': etag})
+        major = client.get('/scale/a')
+    assert response.cache_control.max_age > 0
+    assert cached.status_code == 304
+    assert cached.data == b''
+    mock_get_scale.assert_not_called()
+    assert major.headers['ETag'] != etag
+
+def test_metrics_route(client):
+    """Request counters and stage histograms are exposed in the Prometheus text format."""
+    client.get('/scale/c')
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.content_type.startswith('text/plain; version=0.0.4')
+    text = response.get_data(as_text=True)
+    assert '# TYPE whatkey_detect_stage_seconds histogram' in text
+    assert 'whatkey_scale_seconds_count{operation="get_scale"}' in text
+    assert 'whatkey_http_requests_total{endpoint="show_scale",method="GET",status="200"}' in text
+
+def test_trace_requested_by_header(client, caplog):
+    """'X-Trace: debug' traces a single request, whatever the sampling rate."""
+    from src import tracing
+    with caplog.at_level(logging.INFO, logger=tracing.logger.name), patch('src.tracing.TRACE_SAMPLE_RATE', 0.0):
+        response = client.get('/scale/a?mode=minor', headers={'X-Trace': 'debug', 'X-Request-ID': 'req-1'})
+    assert response.headers['X-Request-ID'] == 'req-1'
+    trace = json.loads([r for r in caplog.records if r.name == tracing.logger.name][-1].getMessage())
+    assert (trace['trace'], trace['request_id'], trace['status']) == ('GET /scale/<string:key_name>', 'req-1', 200)
+    assert (trace['key'], trace['mode']) == ('a', 'minor')
+    assert 'get_scale' in [span['name'] for span in trace['spans']]
+
 def test_parser_route_redirect_major(client):
     """Test the /scale/detected route for a major key redirect."""
     response = client.get('/scale/detected/C_major')
@@ -0,0 +1,120 @@
+import io
+import numpy as np
+import pytest
+import soundfile as sf
+from unittest.mock import patch
+from basic_pitch.constants import AUDIO_SAMPLE_RATE
+from src import metrics
+from src.audio_io import decode_buffer, decode_bytes, decode_spooled, open_blocks, to_model_input
+from src.audio_io import preprocess, trim_silence
+from src.uploads import AudioTooLongError
+
+def encode(audio, sample_rate, format):
+    """Encodes samples into an in-memory audio file."""
+    buffer = io.BytesIO()
+    sf.write(buffer, audio, sample_rate, format=format)
+    return buffer.getvalue()
+
+def sine(sample_rate, seconds=1.0, channels=1):
+    t = np.arange(int(sample_rate * seconds)) / sample_rate
+    tone = (0.3 * np.sin(2 * np.pi * 440 * t)).astype(np.float32)
+    return np.stack([tone] * channels, axis=1) if channels > 1 else tone
+
+def test_to_model_input_downmix_and_resample():
+    """Stereo audio is downmixed and resampled to the model rate."""
+    audio = to_model_input(sine(44100, channels=2), 44100)
+    assert audio.ndim == 1
+    assert audio.dtype == np.float32
+    assert len(audio) == AUDIO_SAMPLE_RATE
+
+@pytest.mark.parametrize('format', ['WAV', 'FLAC', 'OGG'])
+def test_decode_buffer_in_memory(format):
+    """WAV/FLAC/OGG uploads are decoded straight from memory."""
+    data = encode(sine(AUDIO_SAMPLE_RATE), AUDIO_SAMPLE_RATE, format)
+    with patch('src.audio_io.decode_spooled') as mock_spooled:
+        audio = decode_bytes(data, '.' + format.lower())
+    mock_spooled.assert_not_called()
+    assert len(audio) == AUDIO_SAMPLE_RATE
+
+def test_decode_buffer_matches_source():
+    """In-memory decoding keeps the samples at the model rate untouched."""
+    tone = sine(AUDIO_SAMPLE_RATE)
+    audio = decode_buffer(encode(tone, AUDIO_SAMPLE_RATE, 'WAV'))
+    assert np.allclose(audio, tone, atol=1e-4)
+
+@patch('src.audio_io.decode_spooled', return_value=np.zeros(4, dtype=np.float32))
+def test_undecodable_buffer_falls_back_to_disk(mock_spooled):
+    """Containers libsndfile cannot read from memory are spooled to disk."""
+    decode_bytes(b'not a riff header', '.m4a')
+    mock_spooled.assert_called_once_with(b'not a riff header', '.m4a')
+
+@patch('src.audio_io.decode_spooled', return_value=np.zeros(4, dtype=np.float32))
+@patch('src.audio_io.decode_buffer')
+def test_other_containers_skip_soundfile(mock_buffer, mock_spooled):
+    """Containers libsndfile cannot read go straight to the disk fallback."""
+    decode_bytes(b'ftypM4A', '.m4a')
+    mock_buffer.assert_not_called()
+
+def test_decode_spooled_matches_buffer():
+    """The disk fallback downmixes and resamples like the in-memory decoder."""
+    data = encode(sine(44100, channels=2), 44100, 'WAV')
+    assert np.allclose(decode_spooled(data, '.wav'), decode_buffer(data), atol=1e-4)
+
+def with_silences(*parts):
+    """Concatenates (seconds, is_tone) parts at the model rate."""
+    return np.concatenate([sine(AUDIO_SAMPLE_RATE, seconds) if is_tone
+                           else np.zeros(int(AUDIO_SAMPLE_RATE * seconds), dtype=np.float32)
+                           for seconds, is_tone in parts])
+
+def test_trim_silence_leading_trailing_and_long_gaps():
+    """Silent intros, tails and long gaps are dropped, keeping a little around the tones."""
+    audio = with_silences((3, False), (1, True), (4, False), (1, True), (0.5, False), (1, True), (5, False))
+    trimmed = trim_silence(audio, min_seconds=1.0, keep_seconds=0.25)
+    # 3 s of tone, the 0.5 s gap and 0.25 s of each cut region edge (rounded up to whole frames)
+    assert 3 + 0.5 + 4 * 0.25 <= len(trimmed) / AUDIO_SAMPLE_RATE <= 5.0
+    assert np.abs(trimmed).max() == np.abs(audio).max()
+
+def test_trim_silence_keeps_audible_audio():
+    audio = sine(AUDIO_SAMPLE_RATE, 2.0)
+    assert trim_silence(audio) is audio
+    silence = np.zeros(AUDIO_SAMPLE_RATE, dtype=np.float32)
+    assert trim_silence(silence) is silence
+
+def test_preprocess_reports_frames_saved():
+    data = encode(with_silences((2, False), (1, True), (2, False)), AUDIO_SAMPLE_RATE, 'WAV')
+    decoded, trimmed = metrics.AUDIO_FRAMES.value(kind='decoded'), metrics.AUDIO_FRAMES.value(kind='trimmed')
+    audio = preprocess(data, '.wav')
+    assert metrics.AUDIO_FRAMES.value(kind='decoded') == decoded + 5 * AUDIO_SAMPLE_RATE
+    assert metrics.AUDIO_FRAMES.value(kind='trimmed') == trimmed + 5 * AUDIO_SAMPLE_RATE - len(audio)
+    assert len(audio) < 2 * AUDIO_SAMPLE_RATE
+
+@patch('src.audio_io.TRIM_SILENCE', False)
+def test_preprocess_without_trimming():
+    data = encode(with_silences((1, False), (1, True)), AUDIO_SAMPLE_RATE, 'WAV')
+    assert len(preprocess(data, '.wav')) == 2 * AUDIO_SAMPLE_RATE
+
+@pytest.mark.parametrize('format, sample_rate', [('WAV', AUDIO_SAMPLE_RATE), ('FLAC', 44100), ('MP3', 44100)])
+def test_open_blocks_matches_full_decode(format, sample_rate):
+    """Block by block decoding gives the same samples as a full decode."""
+    data = encode(sine(sample_rate, seconds=3.0, channels=2), sample_rate, format)
+    duration, blocks = open_blocks(data, 1.0)
+    blocks = list(blocks)
+    assert duration == pytest.approx(3.0, abs=0.1)
+    assert len(blocks) == 3
+    assert np.allclose(np.concatenate(blocks), decode_buffer(data), atol=1e-5)
+
+# Tests for the maximum audio duration
+@patch('src.uploads.MAX_AUDIO_SECONDS', 1.5)
+@pytest.mark.parametrize('format', ['WAV', 'MP3'])
+def test_long_audio_is_refused_from_its_header(format):
+    data = encode(sine(44100, seconds=2.0), 44100, format)
+    with pytest.raises(AudioTooLongError):
+        decode_bytes(data, f'.{format.lower()}')
+    with pytest.raises(AudioTooLongError):
+        open_blocks(data, 1.0, f'.{format.lower()}')
+    assert len(decode_bytes(encode(sine(44100, seconds=1.0), 44100, format))) > 0
+
+@patch('src.uploads.MAX_AUDIO_SECONDS', 1.5)
+def test_long_audio_is_refused_by_the_disk_fallback():
+    with pytest.raises(AudioTooLongError):
+        decode_spooled(encode(sine(44100, seconds=2.0), 44100, 'WAV'), '.wav')
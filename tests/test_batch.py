@@ -0,0 +1,121 @@
+import io
+import tarfile
+import threading
+import time
+import zipfile
+import pytest
+from unittest.mock import patch
+from src.batch import is_archive, iter_archive, run_batch
+
+def make_zip(files):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        for name, data in files.items():
+            archive.writestr(name, data)
+    buffer.seek(0)
+    return buffer
+
+def make_tar(files, mode='w:gz'):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode=mode) as archive:
+        for name, data in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+    buffer.seek(0)
+    return buffer
+
+FILES = {
+    'album/01.mp3': b'ID3one',
+    'album/02.flac': b'fLaCtwo',
+    'album/cover.jpg': b'jpeg',
+    '__MACOSX/album/._01.mp3': b'meta',
+}
+
+@pytest.mark.parametrize('make_archive', [make_zip, make_tar, lambda f: make_tar(f, 'w')])
+def test_iter_archive(make_archive):
+    """Audio files are read, other files are reported and archiver metadata is skipped."""
+    archive = make_archive(FILES)
+    assert is_archive(archive)
+    assert list(iter_archive(archive)) == [
+        ('album/01.mp3', b'ID3one', None),
+        ('album/02.flac', b'fLaCtwo', None),
+        ('album/cover.jpg', None, 'Unsupported file type.'),
+    ]
+
+@patch('src.uploads.MAX_UPLOAD_BYTES', 100)
+@pytest.mark.parametrize('make_archive', [make_zip, make_tar])
+def test_iter_archive_checks_the_members(make_archive):
+    """Oversized members are not loaded, and the container is sniffed, not guessed from the name."""
+    archive = make_archive({'big.mp3': b'ID3' + b'\x00' * 1000, 'fake.mp3': b'<html>', 'ok.mp3': b'ID3ok'})
+    results = list(iter_archive(archive))
+    assert results[0][:2] == ('big.mp3', None) and 'maximum' in results[0][2]
+    assert results[1:] == [('fake.mp3', None, 'Unsupported file type.'), ('ok.mp3', b'ID3ok', None)]
+
+def test_iter_archive_closes_the_members():
+    """Each zip member is closed once read, with its decompressor, instead of waiting for the GC."""
+    opened = []
+    original_open = zipfile.ZipFile.open
+    def open_member(archive, *args, **kwargs):
+        opened.append(original_open(archive, *args, **kwargs))
+        return opened[-1]
+    archive = make_zip(FILES)
+    with patch.object(zipfile.ZipFile, 'open', open_member):
+        results = list(iter_archive(archive))
+    assert len(results) == 3
+    assert len(opened) == 2 and all(member.closed for member in opened)
+
+def test_is_archive_rejects_other_files():
+    assert not is_archive(io.BytesIO(b'ID3 not an archive'))
+
+def test_run_batch_reports_errors_inline():
+    """Failed files do not stop the batch."""
+    def detect(data):
+        if data == b'bad':
+            raise RuntimeError('Could not decode')
+        return {'pitch': 'C', 'mode': 'Major'}
+
+    files = [('a.mp3', b'good', None), ('b.mp3', b'bad', None), ('c.txt', None, 'Unsupported file type.')]
+    results = sorted(run_batch(files, detect), key=lambda r: r['index'])
+    assert results == [
+        {'index': 0, 'file': 'a.mp3', 'pitch': 'C', 'mode': 'Major'},
+        {'index': 1, 'file': 'b.mp3', 'error': 'Could not decode'},
+        {'index': 2, 'file': 'c.txt', 'error': 'Unsupported file type.'},
+    ]
+
+def test_run_batch_streams_in_completion_order():
+    """Results are yielded as each file finishes, concurrently."""
+    delays = {b'slow': 0.3, b'fast': 0.0}
+    def detect(data):
+        time.sleep(delays[data])
+        return {'data': data.decode()}
+
+    start = time.perf_counter()
+    results = run_batch([('1', b'slow', None), ('2', b'fast', None), ('3', b'fast', None)], detect, concurrency=3)
+    first = next(results)
+    assert first['file'] != '1'
+    assert time.perf_counter() - start < 0.3
+    assert [r['file'] for r in results][-1] == '1'
+
+def test_run_batch_bounds_files_in_flight():
+    """Files are only read as detection slots free up."""
+    read = []
+    running = threading.Semaphore(0)
+    def files():
+        for i in range(20):
+            read.append(i)
+            yield str(i), i, None
+
+    def detect(data):
+        running.acquire() # Blocks until the test releases it
+        return {}
+
+    results = run_batch(files(), detect, concurrency=2)
+    thread = threading.Thread(target=lambda: list(results))
+    thread.start()
+    time.sleep(0.1)
+    assert len(read) == 4 # 2 running + 2 queued
+    for _ in range(20):
+        running.release()
+    thread.join(timeout=5)
+    assert len(read) == 20
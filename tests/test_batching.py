@@ -0,0 +1,69 @@
+import threading
+import numpy as np
+import pytest
+from src.batching import BatchScheduler
+
+def fake_predict(calls):
+    """Builds a predict function that records the size of every batch."""
+    def predict(x):
+        calls.append(len(x))
+        # Each output row carries the first sample of its window
+        return {'note': x[:, :1, 0].copy(), 'onset': x[:, :1, 0] * 2}
+    return predict
+
+def windows(value, n=1):
+    return np.full((n, 8, 1), value, dtype=np.float32)
+
+def test_submit_returns_own_results():
+    """A single request receives the outputs for its own windows."""
+    calls = []
+    scheduler = BatchScheduler(fake_predict(calls), max_batch_size=4, max_wait_ms=1)
+    result = scheduler.submit(windows(3.0, n=2))
+    assert result['note'].tolist() == [[3.0], [3.0]]
+    assert result['onset'].tolist() == [[6.0], [6.0]]
+    assert calls == [2]
+
+def test_concurrent_requests_share_a_batch():
+    """Requests arriving within the wait time run as one forward pass."""
+    calls = []
+    scheduler = BatchScheduler(fake_predict(calls), max_batch_size=8, max_wait_ms=200)
+    results = {}
+    def worker(value):
+        results[value] = scheduler.submit(windows(value))
+    threads = [threading.Thread(target=worker, args=(v,)) for v in (1.0, 2.0, 3.0, 4.0)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sum(calls) == 4
+    assert len(calls) < 4
+    for value, result in results.items():
+        assert result['note'].tolist() == [[value]]
+
+def test_large_request_is_split():
+    """Requests larger than the batch size are split and reassembled in order."""
+    calls = []
+    scheduler = BatchScheduler(fake_predict(calls), max_batch_size=4, max_wait_ms=1)
+    data = np.arange(10, dtype=np.float32).reshape(10, 1, 1).repeat(8, axis=1)
+    result = scheduler.submit(data)
+    assert result['note'].ravel().tolist() == list(range(10))
+    assert max(calls) <= 4
+
+def test_errors_are_propagated():
+    """A failing forward pass raises in every waiting request."""
+    def predict(x):
+        raise RuntimeError('model failure')
+    scheduler = BatchScheduler(predict, max_batch_size=4, max_wait_ms=1)
+    with pytest.raises(RuntimeError):
+        scheduler.submit(windows(1.0))
+
+def test_stats_counters():
+    """Batch size and queue wait counters are updated."""
+    scheduler = BatchScheduler(fake_predict([]), max_batch_size=4, max_wait_ms=1)
+    scheduler.submit(windows(1.0, n=3))
+    stats = scheduler.stats()
+    assert stats['requests'] == 1
+    assert stats['batches'] == 1
+    assert stats['batch_sizes'] == {3: 1}
+    assert stats['queue_wait_max_ms'] >= 0
+    assert stats['batch_size_avg'] == 3
@@ -0,0 +1,56 @@
+import json
+import soundfile as sf
+from benchmarks.fixtures import synthesize, build_fixtures
+from unittest.mock import patch
+from benchmarks.backends import key_mismatches, main as backends_main
+from benchmarks.run import percentile, measure, main
+
+def test_synthesize():
+    audio = synthesize([60, 64, 67], seconds=2, sample_rate=44100)
+    assert audio.shape == (88200,)
+    assert abs(audio).max() <= 0.8
+
+def test_build_fixtures(tmp_path):
+    fixtures = build_fixtures(tmp_path, tones={'sine': [69]}, lengths=(1,), sample_rates=(22050, 48000))
+    assert sorted(fixtures) == ['sine_1s_22050hz.wav', 'sine_1s_48000hz.wav']
+    info = sf.info(fixtures['sine_1s_48000hz.wav'])
+    assert (info.samplerate, info.frames) == (48000, 48000)
+
+def test_percentile():
+    values = [1, 2, 3, 4, 5]
+    assert percentile(values, 50) == 3
+    assert percentile(values, 90) == 4.6
+    assert percentile([7], 99) == 7
+
+def test_measure():
+    stats = measure(lambda: bytearray(2**20), repeat=5)
+    assert stats['n'] == 5
+    assert stats['p50_ms'] <= stats['p99_ms'] <= stats['max_ms']
+    assert stats['throughput_per_s'] > 0
+    assert stats['peak_memory_mb'] >= 1
+
+def test_results_file(tmp_path):
+    """The suite writes a machine-readable results file."""
+    output = tmp_path / 'results.json'
+    main(['--quick', '--groups', 'scales', '--output', str(output), '--fixtures-dir', str(tmp_path)])
+    results = json.loads(output.read_text())
+    assert results['format'] == 1
+    assert set(results['stages']) == {'scales_generator.run', 'Scale(c)', 'Scale(f-sharpm)'}
+    assert results['stages']['Scale(c)']['n'] == 200
+
+def test_backend_key_mismatches():
+    """Fixtures are reported when the backends disagree on their key."""
+    results = {
+        'tflite': {'keys': {'a.wav': ['C', 'Major'], 'b.wav': ['A', 'Minor']}},
+        'onnx': {'keys': {'a.wav': ['C', 'Major'], 'b.wav': ['C', 'Major']}},
+        'tf': {'skipped': 'not installed'},
+    }
+    assert key_mismatches(results) == {'b.wav': {'tflite': ['A', 'Minor'], 'onnx': ['C', 'Major']}}
+
+def test_backends_not_installed_are_skipped(tmp_path):
+    output = tmp_path / 'backends.json'
+    with patch('benchmarks.backends.is_installed', return_value=False):
+        status = backends_main(['--quick', '--output', str(output), '--fixtures-dir', str(tmp_path)])
+    assert status == 0
+    results = json.loads(output.read_text())
+    assert results['backends']['onnx'] == {'skipped': 'not installed'}
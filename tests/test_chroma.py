@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+from unittest.mock import patch
+from benchmarks.fixtures import synthesize
+from src import chroma, metrics
+from src.worker_pool import detect_cascade
+
+SAMPLE_RATE = 22050
+
+def progression(chords, seconds=1.0):
+    return np.concatenate([synthesize(chord, seconds, SAMPLE_RATE) for chord in chords])
+
+def test_confidence_is_the_margin_over_the_runner_up():
+    ranked = [{'pitch': 'C', 'mode': 'Major', 'confidence': 0.9},
+              {'pitch': 'A', 'mode': 'Minor', 'confidence': 0.7}]
+    assert chroma.confidence(ranked) == pytest.approx(0.2)
+    assert chroma.confidence([]) == 0.0
+
+def test_estimate_key_of_a_cadence():
+    # Arrange: I-IV-V-I in C major, twice
+    audio = np.tile(progression([[48, 60, 64, 67], [53, 60, 65, 69], [55, 59, 62, 67], [48, 60, 64, 67]]), 2)
+
+    # Act
+    pitch, mode, ranked, confidence = chroma.estimate_key(audio, SAMPLE_RATE)
+
+    # Assert: a clear key, confident enough to skip the model
+    assert (pitch, mode) == ('C', 'Major')
+    assert len(ranked) == 24
+    assert confidence >= chroma.CHROMA_MIN_CONFIDENCE
+
+def test_estimate_key_of_silence():
+    assert chroma.estimate_key(np.zeros(0, dtype=np.float32), SAMPLE_RATE) == (None, None, [], 0.0)
+
+RANKED = [{'pitch': 'G', 'mode': 'Major', 'confidence': 0.9}, {'pitch': 'E', 'mode': 'Minor', 'confidence': 0.6}]
+
+@patch('src.worker_pool.infer')
+@patch('src.chroma.estimate_key', return_value=('G', 'Major', RANKED, 0.3))
+@patch('src.audio_io.preprocess', return_value=np.zeros(10, dtype=np.float32))
+def test_confident_chroma_answers(mock_preprocess, mock_estimate, mock_infer):
+    answered = metrics.KEY_TIERS.value(tier='chroma')
+    assert detect_cascade(b'audio', '.wav') == (('G', 'Major'), 'chroma')
+    assert detect_cascade(b'audio', '.wav', task='rank') == (('G', 'Major', RANKED), 'chroma')
+    mock_infer.assert_not_called()
+    assert metrics.KEY_TIERS.value(tier='chroma') == answered + 2
+
+@patch('src.worker_pool.infer', return_value=['C', 'Major'])
+@patch('src.chroma.estimate_key', return_value=('E', 'Minor', RANKED, 0.05))
+@patch('src.audio_io.preprocess', return_value=np.zeros(10, dtype=np.float32))
+def test_unsure_chroma_escalates_to_the_model(mock_preprocess, mock_estimate, mock_infer):
+    escalated = metrics.KEY_TIERS.value(tier='model')
+    assert detect_cascade(b'audio', '.wav') == (['C', 'Major'], 'model')
+    # The model gets the audio already decoded for the chroma
+    assert mock_infer.call_args.args[0] is mock_preprocess.return_value
+    mock_preprocess.assert_called_once()
+    assert metrics.KEY_TIERS.value(tier='model') == escalated + 1
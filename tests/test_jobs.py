@@ -0,0 +1,70 @@
+import threading
+import time
+import pytest
+from src.jobs import JobQueue, QueueFullError
+
+def wait_for(job, timeout=5):
+    """Waits until a job has finished."""
+    deadline = time.monotonic() + timeout
+    while job.status in ('queued', 'running') and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return job
+
+def test_job_runs_and_returns_result():
+    """A submitted job runs in the pool and stores its result."""
+    jobs = JobQueue(workers=1, max_queued=4)
+    job = jobs.submit(lambda x: x * 2, 21)
+    assert wait_for(job).status == 'done'
+    assert job.to_dict() == {'job_id': job.id, 'status': 'done', 'result': 42}
+    assert jobs.get(job.id) is job
+
+def test_failed_job_reports_error():
+    """Exceptions raised by a job are reported as a failed status."""
+    def fail():
+        raise ValueError('bad audio')
+    jobs = JobQueue(workers=1, max_queued=4)
+    job = wait_for(jobs.submit(fail))
+    assert job.status == 'failed'
+    assert job.to_dict()['error'] == 'bad audio'
+
+def test_queue_full_fails_fast():
+    """Submitting to a full queue raises instead of blocking."""
+    release = threading.Event()
+    jobs = JobQueue(workers=1, max_queued=1)
+    running = jobs.submit(release.wait)
+    while running.status == 'queued':
+        time.sleep(0.01)
+    jobs.submit(release.wait) # fills the only queue slot
+    assert jobs.full()
+    with pytest.raises(QueueFullError):
+        jobs.submit(release.wait)
+    release.set()
+
+def test_unknown_job():
+    """Unknown job ids return None."""
+    assert JobQueue(workers=1).get('missing') is None
+
+def test_finished_jobs_expire():
+    """Finished jobs are forgotten after the TTL."""
+    jobs = JobQueue(workers=1, max_queued=4, ttl=0)
+    job = wait_for(jobs.submit(lambda: None))
+    time.sleep(0.01)
+    jobs.submit(lambda: None)
+    assert jobs.get(job.id) is None
+
+def test_expired_jobs_are_purged_on_lookup():
+    """Looking up a job also forgets the expired ones, without new submissions."""
+    jobs = JobQueue(workers=1, max_queued=4, ttl=0)
+    job = wait_for(jobs.submit(lambda: None))
+    time.sleep(0.01)
+    jobs.get('missing')
+    assert job.id not in jobs._jobs
+
+def test_finished_job_releases_its_payload():
+    """A finished job no longer references the function and arguments (e.g. the upload)."""
+    jobs = JobQueue(workers=1, max_queued=4)
+    done = wait_for(jobs.submit(len, b'audio data'))
+    failed = wait_for(jobs.submit(int, 'not a number'))
+    assert (done.status, failed.status) == ('done', 'failed')
+    for job in (done, failed):
+        assert job.fn is None and job.args is None
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+from src.key_profiles import (
+    KEYS,
+    MAJOR_PROFILE,
+    MINOR_PROFILE,
+    pitch_class_vector,
+    correlate,
+    rank_keys,
+    detect_key,
+    detect_key_from_vector,
+)
+
+def scale_events(root, steps, tonic_weight=2.0):
+    """One note event per scale degree, the tonic played longer."""
+    events = []
+    for i, step in enumerate(steps):
+        duration = tonic_weight if i == 0 else 1.0
+        events.append((float(i), float(i) + duration, 60 + root + step, 0.8, None))
+    return events
+
+def test_pitch_class_vector_weights_duration_and_amplitude():
+    """Longer and louder notes weigh more, octaves are folded."""
+    events = [(0.0, 2.0, 60, 0.5, None), (0.0, 1.0, 72, 1.0, None), (0.0, 1.0, 64, 0.25, None)]
+    vector = pitch_class_vector(events)
+    assert vector[0] == pytest.approx(2.0) # C4 (2s x 0.5) + C5 (1s x 1.0)
+    assert vector[4] == pytest.approx(0.25)
+    assert vector.sum() == pytest.approx(2.25)
+
+def test_correlate_matches_pearson_per_key():
+    """The single matrix product equals one Pearson correlation per key."""
+    vector = np.random.default_rng(0).random(12)
+    expected = [np.corrcoef(vector, np.roll(MAJOR_PROFILE, r))[0, 1] for r in range(12)]
+    expected += [np.corrcoef(vector, np.roll(MINOR_PROFILE, r))[0, 1] for r in range(12)]
+    assert np.allclose(correlate(vector), expected)
+
+@pytest.mark.parametrize('root, steps, expected', [
+    (0, [0, 2, 4, 5, 7, 9, 11], ('C', 'Major')),
+    (7, [0, 2, 4, 5, 7, 9, 11], ('G', 'Major')),
+    (9, [0, 2, 3, 5, 7, 8, 10], ('A', 'Minor')),
+    (2, [0, 2, 3, 5, 7, 8, 10], ('D', 'Minor')),
+])
+def test_detect_key_from_scales(root, steps, expected):
+    """Scales with an emphasized tonic are recognized."""
+    pitch, mode, ranked = detect_key(scale_events(root, steps))
+    assert (pitch, mode) == expected
+    assert len(ranked) == len(KEYS) == 24
+
+def test_rank_keys_sorted_by_confidence():
+    """Keys are returned best first with their confidence."""
+    ranked = rank_keys(pitch_class_vector(scale_events(0, [0, 4, 7])))
+    confidences = [key['confidence'] for key in ranked]
+    assert confidences == sorted(confidences, reverse=True)
+    assert -1 <= confidences[-1] <= confidences[0] <= 1
+
+def test_no_notes():
+    """Without notes no key is detected."""
+    assert detect_key([]) == (None, None, [])
+
+def test_detect_key_from_vector():
+    """Pitch-class vectors from other sources (e.g. posteriorgram energy) are ranked the same way."""
+    vector = pitch_class_vector(scale_events(7, [0, 2, 4, 5, 7, 9, 11]))
+    assert detect_key_from_vector(vector) == detect_key(scale_events(7, [0, 2, 4, 5, 7, 9, 11]))
@@ -0,0 +1,52 @@
+# tests/test_metrics.py
+import pytest
+from src import metrics
+from src.metrics import Counter, Histogram
+
+@pytest.fixture(autouse=True)
+def registry(monkeypatch):
+    """Metrics created by the tests are kept out of the process-wide registry."""
+    monkeypatch.setattr(metrics, '_registry', [])
+
+def test_counter_samples():
+    counter = Counter('test_requests_total', 'Requests.', ['status'])
+    counter.inc(status=200)
+    counter.inc(2, status=200)
+    counter.inc(status=404)
+    assert counter.value(status=200) == 3
+    assert list(counter.samples()) == [
+        'test_requests_total{status="200"} 3',
+        'test_requests_total{status="404"} 1',
+    ]
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram('test_seconds', 'Durations.', ['stage'], buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 2.0):
+        histogram.observe(value, stage='decode')
+    assert histogram.count(stage='decode') == 4
+    assert list(histogram.samples()) == [
+        'test_seconds_bucket{stage="decode",le="0.1"} 2',
+        'test_seconds_bucket{stage="decode",le="1"} 3',
+        'test_seconds_bucket{stage="decode",le="+Inf"} 4',
+        'test_seconds_sum{stage="decode"} 2.65',
+        'test_seconds_count{stage="decode"} 4',
+    ]
+
+def test_histogram_times_failing_blocks():
+    histogram = Histogram('test_seconds', 'Durations.', ['stage'])
+    with pytest.raises(ValueError):
+        with histogram.time(stage='decode'):
+            raise ValueError
+    assert histogram.count(stage='decode') == 1
+
+def test_render_text_format():
+    counter = Counter('test_errors_total', 'Errors.', ['type'])
+    counter.inc(type='Bad "quote"\n')
+    Counter('test_unused_total', 'Never incremented.')
+    assert metrics.render() == (
+        '# HELP test_errors_total Errors.\n'
+        '# TYPE test_errors_total counter\n'
+        'test_errors_total{type="Bad \\"quote\\"\\n"} 1\n'
+        '# HELP test_unused_total Never incremented.\n'
+        '# TYPE test_unused_total counter\n'
+    )
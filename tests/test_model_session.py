@@ -0,0 +1,88 @@
+import logging
+import os
+import pytest
+from unittest.mock import patch
+from src import model_session
+
+@pytest.fixture(autouse=True)
+def fresh_session():
+    """Ensures each test starts without a resident model."""
+    model_session.reset()
+    yield
+    model_session.reset()
+
+@patch('basic_pitch.inference.Model')
+def test_load_once_per_process(mock_model):
+    """The model is deserialized only once and reused afterwards."""
+    first = model_session.load()
+    second = model_session.get_model()
+    assert first is second
+    mock_model.assert_called_once()
+
+@patch('basic_pitch.inference.Model')
+def test_warm_up_runs_synthetic_inference(mock_model):
+    """Loading runs a warm-up prediction on a single model window."""
+    model_session.load()
+    instance = mock_model.return_value
+    instance.predict.assert_called_once()
+    batch = instance.predict.call_args[0][0]
+    assert batch.shape[0] == 1
+    assert batch.shape[2] == 1
+
+@patch('basic_pitch.inference.Model')
+def test_not_ready_until_warm_up_done(mock_model):
+    """Readiness is only reported after the warm-up has finished."""
+    seen = []
+    mock_model.return_value.predict.side_effect = lambda x: seen.append(model_session.is_ready())
+    assert model_session.is_ready() is False
+    model_session.load()
+    assert seen == [False]
+    assert model_session.is_ready() is True
+
+@patch('basic_pitch.inference.Model')
+def test_preload_in_background(mock_model):
+    """preload() loads the model without blocking the caller."""
+    model_session.preload().join(timeout=5)
+    assert model_session.is_ready() is True
+
+@pytest.mark.parametrize('backend, filename', [('tf', 'nmp'), ('tflite', 'nmp.tflite'), ('onnx', 'nmp.onnx')])
+def test_resolve_path_per_backend(backend, filename):
+    """Each backend loads its own serialization of the ICASSP 2022 model."""
+    path = model_session.resolve_path(backend=backend)
+    assert os.path.basename(path) == filename
+    assert os.path.exists(path)
+
+def test_unknown_backend():
+    with pytest.raises(ValueError, match='Unknown model backend'):
+        model_session.load(backend='coreml-gpu')
+
+@patch.dict('os.environ', {'ONNX_INTRA_OP_THREADS': '3'})
+@patch('src.model_session.INTRA_OP_THREADS', 2)
+@patch('src.model_session.INTER_OP_THREADS', 1)
+def test_thread_settings_per_backend():
+    """Backend-specific settings override the general ones."""
+    assert model_session.thread_settings('onnx') == (3, 1)
+    assert model_session.thread_settings('tflite') == (2, 1)
+
+@patch.dict('os.environ', {'TF_INTRA_OP_THREADS': '3', 'TF_INTER_OP_THREADS': '1'})
+@patch('basic_pitch.inference.Model')
+def test_tf_threads_are_set_before_auto_loading(mock_model):
+    """With MODEL_BACKEND=auto, TensorFlow gets its thread settings before basic-pitch starts it."""
+    seen = []
+    def load_model(path):
+        seen.append((os.environ.get('TF_NUM_INTRAOP_THREADS'), os.environ.get('TF_NUM_INTEROP_THREADS')))
+        return mock_model.return_value
+    mock_model.side_effect = load_model
+    model_session.load(backend='auto')
+    assert seen == [('3', '1')]
+
+@patch.dict('os.environ', {'ONNX_INTRA_OP_THREADS': '2', 'ONNX_INTER_OP_THREADS': '1'})
+def test_load_onnx_backend(caplog):
+    """The chosen runtime is opened directly with its thread settings, and logged."""
+    pytest.importorskip('onnxruntime')
+    with caplog.at_level(logging.INFO, logger='src.model_session'):
+        model = model_session.load(backend='onnx')
+    options = model.model.get_session_options()
+    assert (options.intra_op_num_threads, options.inter_op_num_threads) == (2, 1)
+    assert model_session.get_backend() == 'onnx'
+    assert 'Model backend: onnx (nmp.onnx), intra-op threads: 2, inter-op threads: 1' in caplog.text
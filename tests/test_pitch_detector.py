@@ -1,6 +1,13 @@
 # tests/test_pitch_detector.py
+import random
+import numpy as np
 import pytest
+from unittest.mock import patch
+from benchmarks.legacy import legacy_find_triads
 from src.pitch_detector import find_chord_from_notes, get_pitch_class_name, find_common_notes
+from src.pitch_detector import score_keys, run_streaming, detect_key
+from src.pitch_detector import pitch_class_mask, match_templates, TRIAD_TEMPLATES, detect_pitch
+from src.pitch_detector import pitch_energy, energy_ranking, pitch_class_energy, key_from_ranking, run_audio, rank_audio
 
 # Example test for a major chord
 def test_find_chord_from_notes_major():
@@ -56,4 +63,172 @@ def test_find_common_notes():
     result = find_common_notes(midi_notes, k)
 
     # Assert
-    assert result == [60, 64]
\ No newline at end of file
+    assert result == [60, 64]
+
+# Tests for the streaming mode
+def test_score_keys_prefers_tonic_triad():
+    # Arrange: C, E and G dominate, with a few other C major notes
+    counts = [10, 0, 2, 0, 8, 2, 0, 8, 0, 2, 0, 1]
+
+    # Act
+    ranked = score_keys(counts)
+
+    # Assert: C major wins over its relative A minor
+    assert ranked[0][1:] == ('C', 'Major')
+    assert len(ranked) == 24
+
+def fake_transcribe(block):
+    """Every block contains a C major triad."""
+    return None, None, [(0, 1, 60, 0.5), (0, 1, 64, 0.5), (0, 1, 67, 0.5)]
+
+@patch('src.pitch_detector.transcribe', side_effect=fake_transcribe)
+def test_run_streaming_stops_early(mock_transcribe):
+    # Arrange: 20 one-second blocks
+    blocks = [np.zeros(22050, dtype=np.float32) for _ in range(20)]
+
+    # Act
+    pitch, mode, analyzed = run_streaming(iter(blocks), stable_windows=2)
+
+    # Assert: the key is stable after 3 blocks, the rest is never analyzed
+    assert (pitch, mode) == ('C', 'Major')
+    assert mock_transcribe.call_count == 3
+    assert analyzed == 3.0
+
+@patch('src.pitch_detector.transcribe', side_effect=fake_transcribe)
+def test_run_streaming_short_audio(mock_transcribe):
+    # Arrange: fewer blocks than needed to be stable
+    blocks = [np.zeros(22050, dtype=np.float32)]
+
+    # Act
+    pitch, mode, analyzed = run_streaming(iter(blocks), stable_windows=3)
+
+    # Assert: the whole audio is analyzed
+    assert (pitch, mode) == ('C', 'Major')
+    assert analyzed == 1.0
+
+# Tests for the bitmask chord-template matcher
+@pytest.mark.parametrize('notes, expected', [
+    ([64, 67, 72], "C Major"), # first inversion
+    ([67, 72, 76], "C Major"), # second inversion
+    ([48, 64, 79], "C Major"), # open, octave-spread voicing
+    ([57, 72, 76], "A Minor"),
+    ([59, 62, 65], "B Diminished"),
+])
+def test_find_chord_from_notes_any_voicing(notes, expected):
+    assert find_chord_from_notes(notes) == expected
+
+def test_find_chord_from_notes_thirds():
+    assert find_chord_from_notes([60, 64], just_thirds=True) == "C Major"
+    assert find_chord_from_notes([69, 60], just_thirds=True) == "A Minor" # inverted third
+    assert find_chord_from_notes([60, 62], just_thirds=True) is None
+
+def test_pitch_class_mask():
+    # Arrange: C4, E4, G4 and C5
+    notes = [60, 64, 67, 72]
+
+    # Act
+    result = pitch_class_mask(notes)
+
+    # Assert: bits 0 (C), 4 (E) and 7 (G)
+    assert result == 0b000010010001
+
+def test_diminished_triads_do_not_define_the_key():
+    # Arrange: B, D and F only
+    midi_notes = [59, 62, 65]
+
+    # Act
+    is_detected, found = detect_pitch(midi_notes, 3)
+
+    # Assert: no major/minor triad, the minor thirds B-D and D-F are found
+    assert is_detected is True
+    assert found == ["B Minor", "D Minor"]
+
+@pytest.mark.parametrize('k', [10, 24, 48])
+def test_template_matcher_finds_the_combinations_chords(k):
+    # Arrange: the k most common notes span several octaves
+    common_notes = [36 + (i * 7) % 48 for i in range(k)]
+
+    # Act
+    legacy = legacy_find_triads(common_notes)
+    found = match_templates(common_notes, TRIAD_TEMPLATES)
+
+    # Assert: the chords of the combinations loop are found (and more voicings)
+    assert set(legacy) <= set(found)
+
+# Regression tests for the single-pass k search
+def legacy_detect_key(midi_notes):
+    """The k loop used before the single-pass search."""
+    detected_pitch = []
+    k = 3
+    while not detected_pitch and k <= 10:
+        is_detected, detected_pitch = detect_pitch(midi_notes, k)
+        k += 1
+        if not is_detected:
+            detected_pitch = []
+    return detected_pitch[0].split(' ') if detected_pitch else (None, None)
+
+@pytest.mark.parametrize('midi_notes', [
+    [],
+    [60, 60, 60],
+    [60, 64], # fewer distinct notes than k = 3
+    [59, 62, 65],
+    [60, 62, 62, 65, 65, 65, 67, 69, 71],
+    [60, 61, 66, 71, 72, 73, 78, 83, 84, 85, 90], # no chord before k = 10
+])
+def test_detect_key_matches_legacy_loop_examples(midi_notes):
+    assert detect_key(midi_notes) == legacy_detect_key(midi_notes)
+
+def test_detect_key_matches_legacy_loop_random():
+    rng = random.Random(0)
+    for _ in range(2000):
+        # Few pitch classes make for lots of count ties and late matches
+        pitch_classes = rng.sample(range(12), rng.randint(1, 12))
+        midi_notes = [rng.choice(pitch_classes) + 12 * rng.randint(3, 6)
+                      for _ in range(rng.randint(0, 40))]
+        assert detect_key(midi_notes) == legacy_detect_key(midi_notes), midi_notes
+
+# Tests for the posteriorgram path
+def posteriorgram(levels, n_frames=10):
+    """Note posteriorgram holding each MIDI pitch at a constant level."""
+    frames = np.zeros((n_frames, 88), dtype=np.float32)
+    for midi, level in levels.items():
+        frames[:, midi - 21] = level
+    return frames
+
+def test_pitch_energy_ignores_weak_posteriors():
+    note = posteriorgram({60: 0.9, 64: 0.5, 67: 0.2}) # G4 stays below the note threshold
+    energy = pitch_energy({'note': note})
+    assert energy.shape == (88,)
+    assert energy[60 - 21] == pytest.approx(9.0)
+    assert energy[67 - 21] == 0
+    assert energy_ranking(energy) == [60, 64]
+
+def test_pitch_energy_with_onsets():
+    note = posteriorgram({60: 0.5, 64: 0.5})
+    onset = posteriorgram({64: 0.8}, n_frames=10)
+    onset[1:] = 0 # A single struck onset
+    energy = pitch_energy({'note': note, 'onset': onset}, onsets=True)
+    assert energy_ranking(energy) == [64, 60]
+
+def test_pitch_class_energy_folds_octaves():
+    energy = pitch_energy({'note': posteriorgram({48: 0.5, 60: 0.5, 69: 1.0})})
+    vector = pitch_class_energy(energy)
+    assert vector[0] == pytest.approx(10.0) # C3 + C4
+    assert vector[9] == pytest.approx(10.0) # A4
+
+def test_key_from_ranking_matches_detect_key():
+    """The heuristic gives the same key from counts or from energy rankings."""
+    midi_notes = [60] * 5 + [64] * 4 + [67] * 3 + [62]
+    assert key_from_ranking([60, 64, 67, 62]) == detect_key(midi_notes) == ['C', 'Major']
+
+@patch('src.pitch_detector.KEY_SOURCE', 'posteriors')
+@patch('src.pitch_detector.transcribe')
+@patch('src.pitch_detector.predict', return_value={'note': posteriorgram({57: 0.9, 60: 0.8, 64: 0.7})})
+def test_posteriors_skip_note_tracking(mock_predict, mock_transcribe):
+    """With KEY_SOURCE=posteriors, only the model runs: no note events or MIDI."""
+    audio = np.zeros(22050, dtype=np.float32)
+    assert run_audio(audio) == ['A', 'Minor']
+    pitch, mode, ranked = rank_audio(audio)
+    assert (pitch, mode) == ('A', 'Minor')
+    mock_transcribe.assert_not_called()
+    assert mock_predict.call_args[1] == {'outputs': ('note',)}
@@ -0,0 +1,82 @@
+import os
+import pytest
+from unittest.mock import patch
+from src.result_cache import ResultCache, hash_bytes, detection_version
+
+def test_hash_bytes():
+    """The content hash only depends on the bytes, not on the chunking."""
+    assert hash_bytes([b'abc', b'def']) == hash_bytes([b'abcdef'])
+
+def test_memory_hit_and_miss():
+    """Stored results are returned and counted as hits."""
+    cache = ResultCache('v1', max_items=4)
+    assert cache.get('h1') is None
+    cache.put('h1', {'pitch': 'C', 'mode': 'Major'})
+    assert cache.get('h1') == {'pitch': 'C', 'mode': 'Major'}
+    stats = cache.stats()
+    assert stats['hits'] == 1
+    assert stats['misses'] == 1
+
+def test_memory_lru_eviction():
+    """The least recently used result is evicted first."""
+    cache = ResultCache('v1', max_items=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    cache.get('a')
+    cache.put('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    assert cache.stats()['memory_evictions'] == 1
+
+def test_version_is_part_of_the_key():
+    """A new model or detection version never sees old results."""
+    assert ResultCache('v1').key('h') != ResultCache('v2').key('h')
+
+def test_trim_settings_are_part_of_the_version():
+    """Results computed on differently trimmed audio are not reused."""
+    version = detection_version()
+    with patch('src.audio_io.TRIM_SILENCE', False):
+        assert detection_version() != version
+    with patch('src.audio_io.SILENCE_TOP_DB', 40.0):
+        assert detection_version() != version
+    assert detection_version() == version
+
+def test_key_source_settings_are_part_of_the_version():
+    version = detection_version()
+    with patch('src.pitch_detector.KEY_SOURCE', 'posteriors'):
+        posteriors = detection_version()
+        with patch('src.pitch_detector.POSTERIOR_ONSETS', True):
+            assert detection_version() not in (version, posteriors)
+    assert posteriors != version
+
+@pytest.mark.parametrize('setting, value', [
+    ('STREAM_WINDOW_SECONDS', 10.0), ('STREAM_STABLE_WINDOWS', 5), ('STREAM_MARGIN_TOLERANCE', 0.1)])
+def test_stream_settings_are_part_of_the_version(setting, value):
+    """Streaming results computed with another windowing are not reused."""
+    version = detection_version()
+    with patch(f'src.pitch_detector.{setting}', value):
+        assert detection_version() != version
+    assert detection_version() == version
+
+def test_disk_tier_survives_restarts(tmp_path):
+    """Results on disk are found by a new cache instance."""
+    ResultCache('v1', disk_dir=str(tmp_path)).put('h1', {'pitch': 'A', 'mode': 'Minor'})
+    cache = ResultCache('v1', disk_dir=str(tmp_path))
+    assert cache.get('h1') == {'pitch': 'A', 'mode': 'Minor'}
+    assert cache.stats()['disk_hits'] == 1
+
+def test_disk_tier_invalidated_on_version_change(tmp_path):
+    """Opening the disk tier with another version wipes it."""
+    ResultCache('v1', disk_dir=str(tmp_path)).put('h1', {'pitch': 'A', 'mode': 'Minor'})
+    cache = ResultCache('v2', disk_dir=str(tmp_path))
+    assert cache.get('h1') is None
+    assert [n for n in os.listdir(tmp_path) if n.endswith('.json')] == []
+
+def test_disk_tier_size_eviction(tmp_path):
+    """The disk tier never grows past its size limit."""
+    cache = ResultCache('v1', max_items=1, disk_dir=str(tmp_path), disk_max_bytes=100)
+    for i in range(20):
+        cache.put(f'h{i}', {'pitch': 'C', 'mode': 'Major'})
+    files = [n for n in os.listdir(tmp_path) if n.endswith('.json')]
+    assert sum(os.path.getsize(tmp_path / n) for n in files) <= 100
+    assert cache.stats()['disk_evictions'] > 0
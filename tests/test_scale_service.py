@@ -0,0 +1,74 @@
+# tests/test_scale_service.py
+import json
+import pytest
+from unittest.mock import patch, MagicMock
+from requests.exceptions import RequestException
+
+from src import scale_service
+from src.scale_service import key_query, get_scale, get_scale_body, fetch_scale, get_session
+
+@pytest.mark.parametrize('key_name, is_minor, expected', [
+    ('c', False, 'c'),
+    ('c', True, 'cm'),
+    ('am', False, 'a'),
+    ('am', True, 'am'),
+])
+def test_key_query(key_name, is_minor, expected):
+    assert key_query(key_name, is_minor) == expected
+
+def test_get_scale_body():
+    """Bodies are looked up case-insensitively."""
+    assert get_scale_body('F-Sharpm') == get_scale_body('f-sharpm')
+    assert b'"mode":"minor"' in get_scale_body('f-sharpm')
+    assert get_scale_body('invalid') is None
+
+def test_get_scale_in_process():
+    """By default no HTTP request is made."""
+    with patch('src.scale_service.fetch_scale') as mock_fetch:
+        result = get_scale('a', is_minor=True)
+    mock_fetch.assert_not_called()
+    assert result['scale'] == ['A', 'B', 'C', 'D', 'E', 'F', 'G']
+    assert result['relative'] == 'C'
+
+def test_get_scale_returns_copies():
+    """Callers cannot alter the data of later requests."""
+    get_scale('c')['scale'].append('C')
+    assert len(get_scale('c')['scale']) == 7
+
+@patch('src.scale_service.SCALE_API_URL', 'http://scales:5000/api/')
+@patch('src.scale_service.get_session')
+def test_get_scale_remote_mode(mock_session):
+    """With SCALE_API_URL set, the data is fetched with the pooled session and a timeout."""
+    mock_session.return_value.get.return_value.json.return_value = {'scale': 'data'}
+
+    result = get_scale('am', is_minor=True)
+
+    assert result == {'scale': 'data'}
+    mock_session.return_value.get.assert_called_once_with(
+        'http://scales:5000/api/scale/am', timeout=scale_service.SCALE_API_TIMEOUT)
+
+@patch('src.scale_service.get_session')
+def test_fetch_scale_request_failure(mock_session):
+    """Network errors and timeouts give None."""
+    mock_session.return_value.get.side_effect = RequestException("Test connection error")
+    assert fetch_scale('c', api_url='http://scales:5000/api') is None
+
+@patch('src.scale_service.get_session')
+def test_fetch_scale_http_error(mock_session):
+    """Error statuses (e.g. unknown keys) give None."""
+    response = MagicMock()
+    response.raise_for_status.side_effect = RequestException("404 Client Error")
+    mock_session.return_value.get.return_value = response
+    assert fetch_scale('invalid', api_url='http://scales:5000/api') is None
+
+def test_session_is_shared():
+    """Connections are pooled in a single session."""
+    session = get_session()
+    assert get_session() is session
+    assert session.get_adapter('http://scales:5000/')._pool_maxsize == scale_service.SCALE_API_POOL_SIZE
+
+def test_encode_scales():
+    """Bulk bodies are valid JSON built from the per-key bodies."""
+    body = scale_service.encode_scales(['c', 'am'])
+    assert json.loads(body) == {'c': json.loads(get_scale_body('c')), 'am': json.loads(get_scale_body('am'))}
+    assert json.loads(scale_service.ALL_SCALES_BODY).keys() == set(scale_service.SCALE_NAMES)
@@ -82,4 +82,13 @@ def test_get_relative_key():
     assert get_relative_key('A', 'minor') == 'C'
     assert get_relative_key('G', 'major') == 'E'
     assert get_relative_key('C#', 'major') == 'A#'
-    assert get_relative_key('F#', 'minor') == 'A'
\ No newline at end of file
+    assert get_relative_key('F#', 'minor') == 'A'
+
+def test_scales_table_is_read_only():
+    """The table generated at import cannot be modified by the requests."""
+    from src.scales_generator import SCALES, run
+    assert SCALES['C']['scale']['major'] == tuple(run()['C']['scale']['major'])
+    with pytest.raises(TypeError):
+        SCALES['C'] = {}
+    with pytest.raises(TypeError):
+        SCALES['C']['scale']['major'][0] = 'D'
@@ -0,0 +1,87 @@
+# tests/test_startup.py
+import json
+import os
+import subprocess
+import sys
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Cold-start budget of a web/API process (can be relaxed on slow machines)
+STARTUP_BUDGET_SECONDS = float(os.environ.get('STARTUP_BUDGET_SECONDS', 1.5))
+STARTUP_BUDGET_RSS_MB = float(os.environ.get('STARTUP_BUDGET_RSS_MB', 100))
+
+# Dependencies that must only be loaded by the subsystem that uses them
+HEAVY_MODULES = ['basic_pitch', 'tensorflow', 'onnxruntime', 'librosa', 'scipy',
+                 'soundfile', 'music21', 'requests']
+
+# Runs in a fresh interpreter: imports the app, then serves a first request
+STARTUP_SCRIPT = '''
+import json, os, resource, sys, threading, time
+start = time.perf_counter()
+from app.app import app
+import_seconds = time.perf_counter() - start
+from src import model_session
+model_ready = model_session.is_ready()
+background = sorted(t.name for t in threading.enumerate() if t.daemon and t.is_alive())
+try:
+    # Peak RSS since exec (ru_maxrss can include the forking parent's on Linux)
+    with open('/proc/self/status') as f:
+        rss_mb = next(int(l.split()[1]) for l in f if l.startswith('VmHWM')) / 2**10
+except OSError:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    rss_mb = rss / 2**20 if sys.platform == 'darwin' else rss / 2**10
+loaded = [m for m in HEAVY_MODULES if m in sys.modules]
+start = time.perf_counter()
+status = app.test_client().get('/api/scale/c').status_code
+first_request_seconds = time.perf_counter() - start
+print(json.dumps({
+    'import_seconds': import_seconds, 'rss_mb': rss_mb, 'loaded': loaded,
+    'first_request_seconds': first_request_seconds, 'status': status,
+    'loaded_after_request': [m for m in HEAVY_MODULES if m in sys.modules],
+    'model_ready': model_ready, 'background': background,
+}))
+sys.stdout.flush()
+os._exit(0) # Without waiting for the preload threads
+'''
+
+def measure_startup(**settings):
+    """Cold start with the default settings (those that ship), overridden by settings."""
+    env = {name: value for name, value in os.environ.items() if name not in ('PRELOAD_MODEL', 'PRERENDER_SCORES')}
+    env.update(settings, PYTHONDONTWRITEBYTECODE='1')
+    output = subprocess.run(
+        [sys.executable, '-c', f'HEAVY_MODULES = {HEAVY_MODULES!r}\n{STARTUP_SCRIPT}'],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+@pytest.fixture(scope='module')
+def startup():
+    return measure_startup()
+
+@pytest.fixture(scope='module')
+def lazy_startup():
+    """Process that only serves scales and pages (see README, Startup)."""
+    measure_startup(PRELOAD_MODEL='0', PRERENDER_SCORES='0') # Warm the file system cache
+    return measure_startup(PRELOAD_MODEL='0', PRERENDER_SCORES='0')
+
+def test_startup_budget(lazy_startup):
+    """
+    Cost of importing the app itself. Measured without the preload threads,
+    which load basic-pitch while the import runs and make it depend on timing.
+    """
+    summary = (f"import app: {lazy_startup['import_seconds'] * 1000:.0f} ms, {lazy_startup['rss_mb']:.0f} MB RSS, "
+               f"first /api/scale: {lazy_startup['first_request_seconds'] * 1000:.1f} ms")
+    assert lazy_startup['import_seconds'] < STARTUP_BUDGET_SECONDS, summary
+    assert lazy_startup['rss_mb'] < STARTUP_BUDGET_RSS_MB, summary
+
+def test_preload_is_deferred(startup):
+    """By default the model and scores are loaded in the background, after the import returns."""
+    assert startup['model_ready'] is False
+    assert {'model-preload', 'score-prerender'} <= set(startup['background'])
+    assert startup['status'] == 200
+
+def test_heavy_dependencies_are_lazy(lazy_startup):
+    """Without preloading, neither importing the app nor serving scales loads the detection or score stacks."""
+    assert lazy_startup['loaded'] == []
+    assert lazy_startup['status'] == 200
+    assert lazy_startup['loaded_after_request'] == []
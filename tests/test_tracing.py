@@ -0,0 +1,74 @@
+# tests/test_tracing.py
+import json
+import logging
+import pytest
+from unittest.mock import patch
+from src import tracing
+
+@pytest.fixture
+def traces(caplog):
+    """JSON traces written during the test."""
+    caplog.set_level(logging.INFO, logger=tracing.logger.name)
+    return lambda: [json.loads(record.getMessage()) for record in caplog.records if record.name == tracing.logger.name]
+
+def test_spans_and_events(traces):
+    """A trace lists its nested spans, their attributes and the events recorded in them."""
+    tracing.start_trace('POST /api/detect', request_id='abc', level=tracing.DEBUG)
+    tracing.annotate(status=200)
+    with tracing.span('detect', engine='heuristic') as span:
+        with tracing.span('decode', bytes=10):
+            tracing.event('Chords detected', level=tracing.DEBUG, chords=['C Major'])
+        span.set(pitch='C')
+    tracing.end_trace()
+
+    [trace] = traces()
+    assert (trace['trace'], trace['request_id'], trace['status']) == ('POST /api/detect', 'abc', 200)
+    decode, detect = trace['spans']
+    assert (decode['name'], decode['parent'], decode['bytes']) == ('decode', 'detect', 10)
+    assert (detect['name'], detect['engine'], detect['pitch']) == ('detect', 'heuristic', 'C')
+    assert detect['duration_ms'] >= decode['duration_ms']
+    assert trace['events'] == [{'message': 'Chords detected', 'at_ms': trace['events'][0]['at_ms'],
+                                'chords': ['C Major'], 'span': 'decode'}]
+
+def test_span_records_errors(traces):
+    tracing.start_trace('GET /', level=tracing.INFO)
+    with pytest.raises(ValueError):
+        with tracing.span('decode'):
+            raise ValueError
+    tracing.end_trace()
+    assert traces()[0]['spans'][0]['error'] == 'ValueError'
+
+def test_debug_events_need_the_debug_level(traces):
+    tracing.start_trace('GET /', level=tracing.INFO)
+    assert not tracing.enabled(tracing.DEBUG)
+    tracing.event('Detail', level=tracing.DEBUG)
+    tracing.event('Summary')
+    tracing.end_trace()
+    assert [e['message'] for e in traces()[0]['events']] == ['Summary']
+
+@patch('src.tracing.TRACE_SAMPLE_RATE', 0.0)
+def test_unsampled_requests_are_not_traced(traces):
+    """Without a trace, spans are a shared no-op and nothing is written."""
+    assert tracing.start_trace('GET /') is None
+    assert tracing.span('decode') is tracing.NULL_SPAN
+    with tracing.span('decode') as span:
+        span.set(bytes=10)
+        tracing.event('Detail')
+        tracing.annotate(key='c')
+    tracing.end_trace()
+    assert traces() == []
+
+@patch('src.tracing.TRACE_SAMPLE_RATE', 0.0)
+def test_requested_level_bypasses_sampling():
+    trace = tracing.start_trace('GET /', level=tracing.DEBUG)
+    assert trace is not None and tracing.enabled(tracing.DEBUG)
+    tracing.end_trace()
+
+@patch('src.tracing.TRACE_LEVEL', tracing.OFF)
+def test_tracing_off():
+    assert tracing.start_trace('GET /', level=tracing.DEBUG) is None
+
+def test_traces_go_through_the_logging_configuration():
+    """Traces have no handler of their own: the app's logging configuration decides where they go."""
+    assert tracing.logger.handlers == []
+    assert tracing.logger.propagate
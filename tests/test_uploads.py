@@ -0,0 +1,84 @@
+import io
+import numpy as np
+import pytest
+import soundfile as sf
+from unittest.mock import patch
+from src.uploads import (
+    sniff_format,
+    sniff_stream,
+    check_duration,
+    UploadSpool,
+    UnsupportedFormatError,
+    UploadTooLargeError,
+    AudioTooLongError,
+)
+
+def encode(format):
+    buffer = io.BytesIO()
+    sf.write(buffer, np.zeros(4410, dtype=np.float32), 44100, format=format)
+    return buffer.getvalue()
+
+@pytest.mark.parametrize('format, expected', [('WAV', 'wav'), ('FLAC', 'flac'), ('OGG', 'ogg'), ('MP3', 'mp3')])
+def test_sniff_encoded_audio(format, expected):
+    assert sniff_format(encode(format)[:12]) == expected
+
+@pytest.mark.parametrize('head', [
+    b'ID3\x04\x00\x00\x00\x00\x00\x00',
+    b'\xff\xfb\x90\x64\x00\x00\x00\x00\x00\x00\x00\x00', # MPEG-1 layer III frame
+])
+def test_sniff_mp3(head):
+    assert sniff_format(head) == 'mp3'
+
+@pytest.mark.parametrize('head', [
+    b'this is not audio',
+    b'PK\x03\x04\x14\x00\x00\x00\x08\x00\x00\x00', # zip
+    b'RIFF\x24\x00\x00\x00AVI ', # RIFF but not WAVE
+    b'\xff\xf1\x50\x80\x00\x1f\xfc\x00\x00\x00\x00\x00', # AAC in ADTS frames
+    b'\x00\x00\x00\x20ftypM4A ', # MP4 audio
+    b'',
+])
+def test_sniff_other_files(head):
+    assert sniff_format(head) is None
+
+def test_sniff_stream_rewinds():
+    stream = io.BytesIO(encode('FLAC'))
+    assert sniff_stream(stream) == 'flac'
+    assert stream.tell() == 0
+
+@patch('src.uploads.MAX_AUDIO_SECONDS', 60)
+def test_check_duration():
+    check_duration(60)
+    with pytest.raises(AudioTooLongError):
+        check_duration(61)
+
+def test_spool_keeps_the_upload():
+    # Arrange: the upload arrives in small chunks, as from the multipart parser
+    data = encode('WAV')
+    spool = UploadSpool()
+
+    # Act
+    for start in range(0, len(data), 5):
+        spool.write(data[start:start + 5])
+    spool.seek(0)
+
+    # Assert
+    assert spool.format == 'wav'
+    assert spool.read() == data
+
+def test_spool_rejects_other_files_from_the_first_bytes():
+    spool = UploadSpool()
+    with pytest.raises(UnsupportedFormatError):
+        spool.write(b'<html><body>' + b'x' * 10000)
+
+@patch('src.uploads.MAX_UPLOAD_BYTES', 1000)
+def test_spool_rejects_oversized_files():
+    spool = UploadSpool()
+    spool.write(b'ID3' + b'\x00' * 900)
+    with pytest.raises(UploadTooLargeError):
+        spool.write(b'\x00' * 200)
+
+@patch('src.uploads.UPLOAD_SPOOL_BYTES', 100)
+def test_spool_goes_to_disk_above_the_threshold():
+    spool = UploadSpool()
+    spool.write(b'ID3' + b'\x00' * 200)
+    assert spool._rolled
@@ -1,6 +1,7 @@
 # tests/test_utils.py
-import pytest, sys, os, music21
-from unittest.mock import patch, MagicMock
+import pytest, sys, os, json, time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
 
 # Add the project's root directory to the Python path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
@@ -10,17 +11,20 @@ from src.utils import (
     get_url, 
     format_music21, 
     get_music_score, 
+    build_score,
+    score_id,
+    prerender_scores,
     flip_accidentals, 
     user_repr, 
     solfeggio,
-    get_scale_data
+    get_scale_data,
+    SCALE_RESPONSES
 )
-from requests.exceptions import RequestException
 
 # Mock the scales_generator module as it's an external dependency
 @pytest.fixture
 def mock_scales_generator():
-    """Mock the scales_generator.run() function."""
+    """Mock the scales table generated by scales_generator at import."""
     mock_data = {
         'C': {
             'scale': {'major': ['C', 'D', 'E', 'F', 'G', 'A', 'B']},
@@ -38,8 +42,8 @@ def mock_scales_generator():
             'relative': {'major': 'D#m'}
         }
     }
-    with patch('src.scales_generator.run', return_value=mock_data) as mock_run:
-        yield mock_run
+    with patch('src.scales_generator.SCALES', mock_data) as mock_scales:
+        yield mock_scales
 
 ### Tests for the Scale Class ###
 
@@ -86,6 +90,20 @@ def test_scale_init_invalid_key(mock_scales_generator):
     assert s.chords is None
     assert s.relative is None
 
+def test_scale_lists_are_copies(mock_scales_generator):
+    """Changing a Scale's notes does not touch the shared table."""
+    s = Scale('C')
+    s.scale.append('C')
+    assert Scale('C').scale == ['C', 'D', 'E', 'F', 'G', 'A', 'B']
+
+def test_scale_responses_are_pre_encoded():
+    """Every alias of the 24 keys has its JSON body ready, in both modes."""
+    assert len({json.loads(body)['scale'][0] + json.loads(body)['mode'] for body in SCALE_RESPONSES.values()}) == 24
+    data = json.loads(SCALE_RESPONSES['f-sharpm'])
+    assert data == Scale('f-sharpm').to_dict()
+    assert data['root'] == 'F#' and data['mode'] == 'minor'
+    assert 'invalid' not in SCALE_RESPONSES
+
 ### Tests for Helper Functions ###
 
 @pytest.mark.parametrize('key_name, expected_url', [
@@ -107,25 +125,73 @@ def test_format_music21(key_name, expected_format):
     """Test the format_music21 function."""
     assert format_music21(key_name) == expected_format
 
-@patch('src.utils.os.makedirs')
-@patch('src.utils.os.path.exists', return_value=True)
-@patch('src.utils.stream.Stream.write')
-@patch('src.utils.scale.MajorScale', return_value=MagicMock(pitches=[
-    music21.pitch.Pitch('C4'),
-    music21.pitch.Pitch('D4'),
-    music21.pitch.Pitch('E4'),
-    music21.pitch.Pitch('F4'),
-    music21.pitch.Pitch('G4'),
-    music21.pitch.Pitch('A4'),
-    music21.pitch.Pitch('B4'),
-    music21.pitch.Pitch('C5')
-]))
-def test_get_music_score(mock_scale, mock_write, mock_exists, mock_makedirs):
-    """Test get_music_score function, mocking file system and music21 calls."""
-    result = get_music_score('C', 'major')
-    assert result == os.path.join('output', 'scale.png')
-    mock_scale.assert_called_once_with('C')
-    mock_write.assert_called_once_with('musicxml.png', fp='./app/static/images/output/scale.png')
+@pytest.fixture
+def score_dir(tmp_path):
+    """Renders the scores into a temporary directory, with an empty render cache."""
+    with patch('src.utils.SCORE_DIR', str(tmp_path)), patch.dict('src.utils._scores', clear=True):
+        yield tmp_path
+
+def fake_write(self, fmt, fp):
+    """Writes like music21 + MuseScore: a .musicxml file and a '-1.png' page."""
+    stem = os.path.splitext(fp)[0]
+    with open(f'{stem}.musicxml', 'w') as f:
+        f.write('xml')
+    with open(f'{stem}-1.png', 'wb') as f:
+        f.write(b'png')
+    return f'{stem}-1.png'
+
+def test_get_music_score(score_dir):
+    """Test music score creation."""
+    with patch('music21.stream.Stream.write', autospec=True, side_effect=fake_write) as mock_write:
+        result = get_music_score('C', 'major')
+
+    # Named after the content, without intermediate files
+    assert result == f"{score_id(build_score('C', 'major'))}.png"
+    assert os.listdir(score_dir) == [result]
+    assert mock_write.call_args.args[1] == 'musicxml.png'
+
+def test_get_music_score_is_cached(score_dir):
+    """Each score is rendered once, and same notes share the same image."""
+    with patch('music21.stream.Stream.write', autospec=True, side_effect=fake_write) as mock_write:
+        first = get_music_score('c', 'major')
+        assert get_music_score('C', 'major') == first
+        assert get_music_score('a', 'minor') != first
+        assert get_music_score('d-flat', 'major') != get_music_score('c-sharp', 'major') # spelling
+    assert mock_write.call_count == 4
+
+def test_get_music_score_reuses_files(score_dir):
+    """Scores rendered by a previous run are not rendered again."""
+    (score_dir / f"{score_id(build_score('e', 'minor'))}.png").write_bytes(b'png')
+    with patch('music21.stream.Stream.write') as mock_write:
+        assert get_music_score('e', 'minor') is not None
+    mock_write.assert_not_called()
+
+def test_get_music_score_single_flight(score_dir):
+    """Concurrent requests for a score that is not cached wait for a single render."""
+    def slow_write(self, fmt, fp):
+        time.sleep(0.05)
+        return fake_write(self, fmt, fp)
+
+    with patch('music21.stream.Stream.write', autospec=True, side_effect=slow_write) as mock_write:
+        with ThreadPoolExecutor(8) as executor:
+            results = list(executor.map(lambda _: get_music_score('g', 'major'), range(8)))
+    assert mock_write.call_count == 1
+    assert len(set(results)) == 1 and results[0] is not None
+
+def test_get_music_score_render_failure(score_dir):
+    """Renderer errors give None and leave no files behind."""
+    with patch('music21.stream.Stream.write', side_effect=Exception('MuseScore not found')):
+        assert get_music_score('C', 'major') is None
+    assert os.listdir(score_dir) == []
+
+def test_get_music_score_invalid_key(score_dir):
+    assert get_music_score('invalid', 'major') is None
+
+def test_prerender_scores(score_dir):
+    """All the keys are rendered, under each spelling and in both modes."""
+    with patch('music21.stream.Stream.write', autospec=True, side_effect=fake_write):
+        assert prerender_scores() == 2 * len(Scale._key_name_mapping)
+    assert len(os.listdir(score_dir)) == 2 * len(Scale._key_name_mapping)
 
 @pytest.mark.parametrize('key_name, expected_flip', [
     ('A#', 'Bb'),
@@ -154,33 +220,19 @@ def test_solfeggio():
     expected_notes = ['Do', 'Re', 'Mi']
     assert solfeggio(notes) == expected_notes
 
-@patch('src.utils.requests.get')
-def test_get_scale_data_success(mock_get):
-    """Test successful API call."""
-    mock_response = MagicMock()
-    mock_response.status_code = 200
-    mock_response.json.return_value = {'scale': 'data'}
-    mock_get.return_value = mock_response
-
-    result = get_scale_data('c')
-    assert result == {'scale': 'data'}
-    mock_get.assert_called_once_with('http://127.0.0.1:5000/api/scale/c')
-
-@patch('src.utils.requests.get')
-def test_get_scale_data_minor(mock_get):
-    """Test API call for a minor key."""
-    mock_response = MagicMock()
-    mock_response.status_code = 200
-    mock_response.json.return_value = {'scale': 'data'}
-    mock_get.return_value = mock_response
-
-    result = get_scale_data('am', is_minor=True)
-    assert result == {'scale': 'data'}
-    mock_get.assert_called_once_with('http://127.0.0.1:5000/api/scale/am')
-
-@patch('src.utils.requests.get', side_effect=RequestException("Test connection error"))
-def test_get_scale_data_request_failure(mock_get):
-    """Test handling of a failed network request."""
-    result = get_scale_data('c')
-    assert result is None
-    mock_get.assert_called_once_with('http://127.0.0.1:5000/api/scale/c')
\ No newline at end of file
+def test_get_scale_data_success():
+    """Scale data is served in-process, without an HTTP call."""
+    with patch('src.scale_service.get_session') as mock_session:
+        result = get_scale_data('c')
+    assert result == json.loads(SCALE_RESPONSES['c'])
+    mock_session.assert_not_called()
+
+def test_get_scale_data_minor():
+    """The mode flag adds or removes the minor suffix."""
+    assert get_scale_data('a', is_minor=True)['mode'] == 'minor'
+    assert get_scale_data('am', is_minor=True)['root'] == 'A'
+    assert get_scale_data('am')['mode'] == 'major'
+
+def test_get_scale_data_unknown_key():
+    """Unknown keys give None."""
+    assert get_scale_data('invalid') is None
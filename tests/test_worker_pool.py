@@ -0,0 +1,59 @@
+import os
+import signal
+import time
+import numpy as np
+import pytest
+from src.worker_pool import WorkerPool
+
+def echo_worker(conn, threads):
+    """Lightweight worker: answers with the sum of the audio and its thread count."""
+    conn.send(('ready', os.getpid()))
+    while True:
+        message = conn.recv()
+        if message is None:
+            break
+        request_id, audio, task = message
+        if audio is None:
+            conn.send((request_id, False, 'no audio'))
+        else:
+            conn.send((request_id, True, (float(audio.sum()), threads)))
+
+def wait_ready(pool, timeout=30):
+    deadline = time.monotonic() + timeout
+    while not all(w['ready'] for w in pool.stats()):
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+
+@pytest.fixture
+def pool():
+    pool = WorkerPool(processes=2, threads=3, target=echo_worker)
+    wait_ready(pool)
+    yield pool
+    pool.close()
+
+def test_dispatch_over_pipes(pool):
+    """Audio is sent to a worker process and its result comes back."""
+    assert pool.run_audio(np.ones(10, dtype=np.float32)) == (10.0, 3)
+
+def test_worker_errors_are_raised(pool):
+    """Errors inside a worker are raised in the caller."""
+    with pytest.raises(RuntimeError):
+        pool.run_audio(None)
+
+def test_queue_depth_is_visible(pool):
+    """Stats expose one entry per worker with its pending requests."""
+    stats = pool.stats()
+    assert [w['worker'] for w in stats] == [0, 1]
+    assert all(w['queued'] == 0 and w['alive'] for w in stats)
+
+def test_crashed_worker_is_restarted(pool):
+    """A killed worker process is replaced by a new one."""
+    old_pid = pool.stats()[0]['pid']
+    os.kill(old_pid, signal.SIGKILL)
+    deadline = time.monotonic() + 30
+    while pool.stats()[0]['restarts'] == 0:
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+    wait_ready(pool)
+    assert pool.stats()[0]['pid'] != old_pid
+    assert pool.run_audio(np.ones(2, dtype=np.float32)) == (2.0, 3)